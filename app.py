@@ -26,21 +26,113 @@ def parse_args():
     parser = argparse.ArgumentParser(description="Discharge Summary Generator")
     parser.add_argument(
         "--mode",
-        choices=["web", "generate"],
+        choices=[
+            "web",
+            "generate",
+            "batch",
+            "validate",
+            "show",
+            "history",
+            "serve",
+            "enqueue",
+            "work",
+            "queue-status",
+            "batch-submit",
+            "batch-status",
+            "batch-collect",
+        ],
         default="web",
-        help="Run mode: 'web' for web UI, 'generate' for CLI generation",
+        help="Run mode: 'web' for web UI, 'generate' for CLI generation, "
+        "'batch' for concurrent generation over many patient records, "
+        "'validate' to check patient records without generating, "
+        "'show' to print a stored summary, 'history' to list a patient's "
+        "stored summaries, 'serve' for the HTTP generation API, 'enqueue' to "
+        "add patient records to the durable job queue, 'work' to drain it "
+        "with worker processes, 'queue-status' to show its progress, "
+        "'batch-submit' to submit records to the OpenAI Batch API, "
+        "'batch-status' to check submitted batches, 'batch-collect' to wait "
+        "for a batch and collect its summaries",
     )
     parser.add_argument(
-        "--input", type=str, help="Input JSON file path (for generate mode)"
+        "--input",
+        type=str,
+        help="Input JSON file path (for generate mode), or directory, glob or "
+        "JSONL file of patient records (for batch and validate modes)",
     )
     parser.add_argument(
-        "--output", type=str, help="Output text file path (for generate mode)"
+        "--output",
+        type=str,
+        help="Output text file path (for generate and show modes) or output "
+        "directory (for batch and work modes)",
     )
     parser.add_argument(
         "--template",
         type=str,
-        default="general",
-        help="Template type to use (for generate mode)",
+        default="auto",
+        help="Template type to use (for generate and batch modes); 'auto' "
+        "routes each chart by its diagnoses, DRG and encounters",
+    )
+    parser.add_argument(
+        "--patient-id",
+        type=str,
+        help="Patient to generate for when --input holds many records "
+        "(for generate mode; NDJSON files are indexed for fast lookup), or "
+        "whose stored summaries to show (for show and history modes)",
+    )
+    parser.add_argument(
+        "--version",
+        type=int,
+        help="Stored summary version to print (for show mode; defaults to "
+        "the latest)",
+    )
+    parser.add_argument(
+        "--strategy",
+        choices=["single", "map_reduce", "incremental"],
+        default=config.SUMMARY_STRATEGY,
+        help="Generation strategy: one prompt; chart sections summarized "
+        "concurrently and merged; or the same, redrafting only sections that "
+        "changed since the patient's last summary (for generate and batch modes)",
+    )
+    parser.add_argument(
+        "--concurrency",
+        type=int,
+        default=config.BATCH_CONCURRENCY,
+        help="Maximum number of concurrent generation calls (for batch mode)",
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=config.JOB_QUEUE_WORKERS,
+        help="Number of worker processes (for work mode)",
+    )
+    parser.add_argument(
+        "--queue",
+        type=str,
+        default=str(config.JOB_QUEUE_PATH),
+        help="Job queue database (for enqueue, work and queue-status modes)",
+    )
+    parser.add_argument(
+        "--batch-id",
+        type=str,
+        help="Batch API batch (for batch-status and batch-collect modes; "
+        "batch-status lists every submitted batch without it)",
+    )
+    parser.add_argument(
+        "--host",
+        type=str,
+        default=config.SERVICE_HOST,
+        help="Interface to listen on (for serve mode)",
+    )
+    parser.add_argument(
+        "--port",
+        type=int,
+        default=config.SERVICE_PORT,
+        help="Port to listen on (for serve mode)",
+    )
+    parser.add_argument(
+        "--resume",
+        action="store_true",
+        help="Skip patients whose output file already exists (for batch mode)",
     )
 
     return parser.parse_args()
@@ -65,7 +157,9 @@ def run_web_ui():
     )
 
 
-def run_cli_generation(input_file, output_file, template_type):
+def run_cli_generation(
+    input_file, output_file, template_type, patient_id=None, strategy=None
+):
     """Run CLI-based generation of a discharge summary."""
     # Setup logging
     logger = setup_logging(config.LOGS_DIR, config.LOG_LEVEL)
@@ -74,17 +168,276 @@ def run_cli_generation(input_file, output_file, template_type):
     # Import the generator
     from llm.discharge_generator import DischargeSummaryGenerator
 
+    from llm.ingest import find_patient
+    from llm.utils import consume_stream, load_patient_data
+
     # Generate the summary
     generator = DischargeSummaryGenerator()
-    summary = generator.generate_summary_from_file(input_file, template_type)
+    if patient_id:
+        try:
+            patient_data = find_patient(input_file, patient_id)
+        except KeyError as e:
+            print(f"Error: {e.args[0]}")
+            sys.exit(1)
+    else:
+        patient_data = load_patient_data(input_file)
 
-    # Write to output file or stdout
+    # Write to output file or stream to stdout as tokens arrive
     if output_file:
+        summary = generator.generate_summary(
+            patient_data, template_type, strategy=strategy
+        )
         with open(output_file, "w") as f:
             f.write(summary)
         logger.info(f"Summary written to {output_file}")
     else:
-        print(summary)
+        consume_stream(
+            generator.stream_summary(patient_data, template_type, strategy=strategy),
+            on_chunk=lambda chunk: print(chunk, end="", flush=True),
+        )
+        print()
+
+
+def run_batch_generation(
+    input_source, output_dir, template_type, concurrency, resume, strategy=None
+):
+    """Run concurrent CLI generation over many patient records."""
+    # Setup logging
+    logger = setup_logging(config.LOGS_DIR, config.LOG_LEVEL)
+    logger.info(
+        f"Batch generation mode: {input_source} -> {output_dir} "
+        f"(concurrency={concurrency}, resume={resume})"
+    )
+
+    from llm.discharge_generator import DischargeSummaryGenerator
+    from llm.batch import run_batch
+
+    # One generator (and HTTP client) is shared by all workers
+    generator = DischargeSummaryGenerator()
+    manifest = run_batch(
+        generator,
+        input_source,
+        output_dir,
+        template_type=template_type,
+        concurrency=concurrency,
+        resume=resume,
+        strategy=strategy,
+    )
+
+    counts = manifest["counts"]
+    print(
+        f"{counts['ok']} generated, {counts['failed']} failed, "
+        f"{counts['skipped']} skipped. Manifest: {Path(output_dir) / 'manifest.json'}"
+    )
+    if counts["failed"]:
+        sys.exit(1)
+
+
+def run_service(host, port):
+    """Serve discharge summary generation over HTTP."""
+    setup_logging(config.LOGS_DIR, config.LOG_LEVEL)
+
+    from llm.discharge_generator import DischargeSummaryGenerator
+    from llm.service import serve
+
+    serve(DischargeSummaryGenerator(), host, port)
+
+
+def run_enqueue(input_source, queue_path, template_type, strategy):
+    """Add patient records to the durable job queue."""
+    from llm.job_queue import JobQueue
+    from llm.utils import iter_patient_records
+
+    queue = JobQueue(queue_path)
+    template_type = None if template_type == "auto" else template_type
+    added = skipped = invalid = 0
+    for label, record, error in iter_patient_records(input_source, validate=True):
+        if error:
+            invalid += 1
+            print(f"{label}: {error}")
+        elif queue.enqueue(record, template_type, strategy, source=label):
+            added += 1
+        else:
+            skipped += 1
+
+    print(f"{added} queued, {skipped} already queued, {invalid} invalid")
+    print_queue_status(queue_path)
+
+
+def run_workers(queue_path, workers, output_dir):
+    """Drain the durable job queue with worker processes."""
+    logger = setup_logging(config.LOGS_DIR, config.LOG_LEVEL)
+    logger.info(f"Working through {queue_path} with {workers} worker processes")
+
+    from llm import job_queue
+
+    counts = job_queue.run_workers(queue_path, workers, output_dir)
+    print(
+        f"{counts['done']} done, {counts['dead']} dead-lettered, "
+        f"{counts['queued'] + counts['leased']} pending"
+    )
+    if counts["dead"]:
+        sys.exit(1)
+
+
+def print_queue_status(queue_path):
+    """Print the durable job queue's progress and dead letters."""
+    from llm.job_queue import JobQueue
+
+    queue = JobQueue(queue_path)
+    counts = queue.progress()
+    print(
+        f"{counts['total']} jobs: {counts['queued']} queued "
+        f"({counts['ready']} ready), {counts['leased']} leased, "
+        f"{counts['done']} done, {counts['dead']} dead"
+    )
+    for job in queue.dead_letters():
+        print(
+            f"  dead: job {job['id']} patient {job['patient_id']} after "
+            f"{job['attempts']} attempts: {job['last_error']}"
+        )
+
+
+def run_batch_submit(input_source, template_type):
+    """Submit patient records to the OpenAI Batch API."""
+    logger = setup_logging(config.LOGS_DIR, config.LOG_LEVEL)
+    logger.info(f"Batch API submission: {input_source}")
+
+    from llm.batch_api import submit_batches
+    from llm.discharge_generator import DischargeSummaryGenerator
+
+    result = submit_batches(DischargeSummaryGenerator(), input_source, template_type)
+    for manifest in result["batches"]:
+        print(f"{manifest['batch_id']}: {len(manifest['requests'])} requests")
+    print(
+        f"{result['submitted']} submitted in {len(result['batches'])} batches, "
+        f"{result['skipped']} already summarized, "
+        f"{result['pending']} already in a batch, {result['invalid']} invalid, "
+        f"{result['failed']} failed"
+    )
+    if result["invalid"] or result["failed"]:
+        sys.exit(1)
+
+
+def run_batch_status(batch_id=None):
+    """Print a submitted batch's progress, or list every submitted batch."""
+    from datetime import datetime
+
+    setup_logging(config.LOGS_DIR, config.LOG_LEVEL)
+
+    from llm import batch_api
+    from llm.discharge_generator import DischargeSummaryGenerator
+
+    if batch_id is None:
+        manifests = batch_api.list_batches()
+        if not manifests:
+            print(f"No batches submitted from {config.BATCH_API_DIR}")
+        for manifest in manifests:
+            submitted = datetime.fromtimestamp(manifest["submitted_at"])
+            print(
+                f"{manifest['batch_id']}  {submitted:%Y-%m-%d %H:%M}  "
+                f"{manifest['status']:<11} {len(manifest['requests'])} requests"
+                f"{'  (collected)' if manifest['collected_at'] else ''}"
+            )
+        return
+
+    try:
+        batch = batch_api.batch_status(DischargeSummaryGenerator(), batch_id)
+    except KeyError as e:
+        print(f"Error: {e.args[0]}")
+        sys.exit(1)
+    counts = batch.get("request_counts") or {}
+    print(
+        f"{batch_id}: {batch['status']}, {counts.get('completed', 0)}/"
+        f"{counts.get('total', '?')} completed, {counts.get('failed', 0)} failed"
+    )
+
+
+def run_batch_collect(batch_id, output_dir=None):
+    """Wait for a Batch API batch and collect its summaries."""
+    logger = setup_logging(config.LOGS_DIR, config.LOG_LEVEL)
+    logger.info(f"Collecting batch {batch_id}")
+
+    from llm.batch_api import collect_batch
+    from llm.discharge_generator import DischargeSummaryGenerator
+
+    try:
+        counts = collect_batch(DischargeSummaryGenerator(), batch_id, output_dir)
+    except KeyError as e:
+        print(f"Error: {e.args[0]}")
+        sys.exit(1)
+    print(
+        f"Batch {counts['status']}: {counts['done']} summaries collected, "
+        f"{counts['failed']} failed, {counts['pending']} not answered"
+    )
+    if counts["failed"] or counts["pending"]:
+        sys.exit(1)
+
+
+def run_validation(input_source):
+    """Check patient records against the record model without any LLM calls."""
+    from llm.utils import iter_patient_records
+
+    valid = invalid = 0
+    for label, _, error in iter_patient_records(input_source, validate=True):
+        if error:
+            invalid += 1
+            print(f"{label}: {error}")
+        else:
+            valid += 1
+
+    print(f"{valid} valid, {invalid} invalid")
+    if invalid:
+        sys.exit(1)
+
+
+def _open_store():
+    from llm.store import SummaryStore
+
+    if not config.SUMMARY_STORE_PATH.exists():
+        print(f"No summary store at {config.SUMMARY_STORE_PATH}")
+        sys.exit(1)
+    return SummaryStore(config.SUMMARY_STORE_PATH)
+
+
+def run_show(patient_id, version=None, template=None, output_file=None):
+    """Print (or write) a stored summary without generating anything."""
+    store = _open_store()
+    template = None if template in (None, "auto") else template
+    if version is None:
+        row = store.latest(patient_id, template=template)
+    else:
+        row = store.get(patient_id, version, template=template)
+    if row is None:
+        print(f"No stored summary for patient {patient_id}")
+        sys.exit(1)
+
+    if output_file:
+        with open(output_file, "w") as f:
+            f.write(row["summary"])
+        print(f"Summary v{row['version']} written to {output_file}")
+    else:
+        print(row["summary"])
+
+
+def run_history(patient_id, template=None):
+    """List a patient's stored summaries, newest first."""
+    from datetime import datetime
+
+    store = _open_store()
+    template = None if template in (None, "auto") else template
+    rows = store.versions(patient_id, template=template)
+    if not rows:
+        print(f"No stored summaries for patient {patient_id}")
+        sys.exit(1)
+    for row in rows:
+        created = datetime.fromtimestamp(row["created_at"]).strftime("%Y-%m-%d %H:%M")
+        print(
+            f"v{row['version']}  {created}  {row['template']:<18} "
+            f"admission {row['admission'] or '-':<10}  {row['model']} "
+            f"({row['strategy']}, {row['prompt_tokens']}+"
+            f"{row['completion_tokens']} tokens, {row['latency_ms']:.0f} ms)"
+        )
 
 
 def main():
@@ -97,7 +450,57 @@ def main():
         if not args.input:
             print("Error: --input file is required for generate mode")
             sys.exit(1)
-        run_cli_generation(args.input, args.output, args.template)
+        run_cli_generation(
+            args.input, args.output, args.template, args.patient_id, args.strategy
+        )
+    elif args.mode == "batch":
+        if not args.input or not args.output:
+            print("Error: --input and --output are required for batch mode")
+            sys.exit(1)
+        run_batch_generation(
+            args.input,
+            args.output,
+            args.template,
+            args.concurrency,
+            args.resume,
+            args.strategy,
+        )
+    elif args.mode == "validate":
+        if not args.input:
+            print("Error: --input is required for validate mode")
+            sys.exit(1)
+        run_validation(args.input)
+    elif args.mode == "enqueue":
+        if not args.input:
+            print("Error: --input is required for enqueue mode")
+            sys.exit(1)
+        run_enqueue(args.input, args.queue, args.template, args.strategy)
+    elif args.mode == "work":
+        run_workers(args.queue, args.workers, args.output)
+    elif args.mode == "queue-status":
+        print_queue_status(args.queue)
+    elif args.mode == "batch-submit":
+        if not args.input:
+            print("Error: --input is required for batch-submit mode")
+            sys.exit(1)
+        run_batch_submit(args.input, args.template)
+    elif args.mode == "batch-status":
+        run_batch_status(args.batch_id)
+    elif args.mode == "batch-collect":
+        if not args.batch_id:
+            print("Error: --batch-id is required for batch-collect mode")
+            sys.exit(1)
+        run_batch_collect(args.batch_id, args.output)
+    elif args.mode == "serve":
+        run_service(args.host, args.port)
+    elif args.mode in ("show", "history"):
+        if not args.patient_id:
+            print(f"Error: --patient-id is required for {args.mode} mode")
+            sys.exit(1)
+        if args.mode == "show":
+            run_show(args.patient_id, args.version, args.template, args.output)
+        else:
+            run_history(args.patient_id, args.template)
 
 
 if __name__ == "__main__":
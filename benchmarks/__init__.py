@@ -0,0 +1,6 @@
+"""
+Offline benchmarks for the discharge summary pipeline.
+
+Run ``python -m benchmarks.run`` from the repository root. LLM calls go to a
+local mock OpenAI-compatible server, so no API credits are used.
+"""
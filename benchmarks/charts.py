@@ -0,0 +1,118 @@
+"""
+Synthetic patient charts derived from the sample charts shipped with the repo.
+
+Each synthetic chart copies one of ``data.json`` .. ``data_4.json`` (so the
+different schemas are all exercised), gives it a unique patient ID and
+repeats its list sections ``scale`` times with dates shifted forward, which
+stretches the stay the way a longer admission would.
+"""
+
+import copy
+import json
+from datetime import date, timedelta
+from pathlib import Path
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+SAMPLE_CHARTS = ["data.json", "data_2.json", "data_3.json", "data_4.json"]
+
+# Sections that grow with the length of stay
+REPEATED_SECTIONS = [
+    "encounters",
+    "flowsheets",
+    "imaging",
+    "labs",
+    "med_orders",
+    "notes",
+    "ward_round_notes",
+]
+
+
+def load_sample_charts(root=REPO_ROOT):
+    """Load the sample charts shipped at the repository root."""
+    charts = []
+    for name in SAMPLE_CHARTS:
+        with open(Path(root) / name) as f:
+            charts.append(json.load(f))
+    return charts
+
+
+def _shift_date(value, days):
+    try:
+        return (date.fromisoformat(value) + timedelta(days=days)).isoformat()
+    except (TypeError, ValueError):
+        return value
+
+
+def _shifted(entry, days):
+    """Copy a section entry with its date moved forward."""
+    entry = copy.deepcopy(entry)
+    if isinstance(entry, dict) and "date" in entry:
+        entry["date"] = _shift_date(entry["date"], days)
+    return entry
+
+
+def synthetic_chart(base, index, scale=1):
+    """
+    Build a synthetic chart from a sample chart.
+
+    Args:
+        base (dict): Sample chart to copy
+        index (int): Chart number, used for the patient ID
+        scale (int): How many times to repeat each list section
+
+    Returns:
+        dict: New patient chart
+    """
+    chart = copy.deepcopy(base)
+    chart["patient_id"] = f"BENCH{index:07d}"
+
+    demographics = chart.get("patient_demographics", {})
+    admission = demographics.get("admission_date")
+    discharge_field = (
+        "discharge_date"
+        if "discharge_date" in demographics
+        else "expected_discharge_date"
+    )
+    try:
+        stay = (
+            date.fromisoformat(demographics[discharge_field])
+            - date.fromisoformat(admission)
+        ).days + 1
+    except (KeyError, TypeError, ValueError):
+        stay = 1
+
+    for section in REPEATED_SECTIONS:
+        entries = chart.get(section)
+        if not isinstance(entries, list) or not entries:
+            continue
+        chart[section] = [
+            _shifted(entry, repeat * stay)
+            for repeat in range(scale)
+            for entry in entries
+        ]
+    if discharge_field in demographics:
+        demographics[discharge_field] = _shift_date(
+            demographics[discharge_field], (scale - 1) * stay
+        )
+    return chart
+
+
+def make_charts(count, sizes=(1,), root=REPO_ROOT):
+    """
+    Build ``count`` synthetic charts, cycling through sample charts and sizes.
+
+    Args:
+        count (int): Number of charts
+        sizes (tuple): Scale factors to cycle through
+        root (str): Directory holding the sample charts
+
+    Returns:
+        list: Patient charts
+    """
+    samples = load_sample_charts(root)
+    return [
+        synthetic_chart(
+            samples[i % len(samples)], i, sizes[(i // len(samples)) % len(sizes)]
+        )
+        for i in range(count)
+    ]
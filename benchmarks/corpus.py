@@ -0,0 +1,670 @@
+"""
+Seeded generator of synthetic patient records for scale testing.
+
+Records have the sections of the sample charts (``patient_demographics``,
+``diagnoses`` with ICD-10 codes, ``drg``, ``encounters``, ``flowsheets``,
+``labs``, ``med_orders``, ``ward_round_notes`` and ``notes``). Length of stay
+is drawn from a log-normal distribution, and the number of entries per day
+from a second one, so a corpus has a realistic long tail of large charts.
+
+Every record is generated from its own seed (corpus seed + record index),
+so a record's content does not depend on how many records came before it
+and corpora of any size are produced in constant memory::
+
+    python -m benchmarks.corpus --count 100000 --output corpus.jsonl
+    python -m benchmarks.corpus --count 1000000 --output corpus/ \
+        --shard-size 50000 --workers 8
+"""
+
+import argparse
+import json
+import math
+import multiprocessing
+import random
+import sys
+from datetime import date, timedelta
+from functools import partial
+from pathlib import Path
+
+# fmt: off
+FIRST_NAMES = [
+    "James", "Mary", "Robert", "Patricia", "John", "Jennifer", "Michael",
+    "Linda", "David", "Elizabeth", "William", "Barbara", "Richard", "Susan",
+    "Joseph", "Jessica", "Thomas", "Sarah", "Priya", "Wei", "Ahmed", "Fatima",
+    "Carlos", "Maria", "Kwame", "Aisha", "Hiroshi", "Yuki", "Olga", "Ivan",
+]
+LAST_NAMES = [
+    "Smith", "Johnson", "Williams", "Brown", "Jones", "Garcia", "Miller",
+    "Davis", "Rodriguez", "Martinez", "Hernandez", "Lopez", "Wilson",
+    "Anderson", "Thomas", "Taylor", "Moore", "Jackson", "Martin", "Lee",
+    "Patel", "Chen", "Khan", "Okafor", "Nguyen", "Kim", "Singh", "Mensah",
+]
+# fmt: on
+CLINICIANS = ["Dr. Smith", "Dr. Patel", "Dr. Chen", "Dr. Okafor", "Dr. Garcia"]
+NURSES = ["Nurse Brown", "Nurse Kim", "Nurse Singh", "Nurse Davis"]
+TIMES_OF_DAY = ["Morning", "Afternoon", "Evening", "Night"]
+CONSULT_SERVICES = ["Physiotherapy", "Dietitian", "Pharmacy", "Specialist"]
+
+# Clinical profiles: diagnosis, DRG, and the labs, medications and note
+# phrases typical of the admission. Weights set how common each one is.
+PROFILES = [
+    {
+        "weight": 12,
+        "code": "J18.1",
+        "description": "Lobar pneumonia, unspecified organism",
+        "drg": ("193", "Simple pneumonia and pleurisy with MCC"),
+        "reason": "Fever, productive cough and shortness of breath",
+        "imaging": ("Chest X-ray", "Consolidation in the right lower lobe"),
+        "labs": [
+            ("CBC", ["WBC {wbc} x10^9/L", "Hemoglobin {hb} g/dL"]),
+            ("CRP", ["{crp} mg/L"]),
+            ("Blood cultures", ["No growth at 48 hours", "Pending"]),
+        ],
+        "meds": [
+            ("Ceftriaxone", "1 g", "IV once daily"),
+            ("Azithromycin", "500 mg", "Orally once daily"),
+            ("Paracetamol", "1 g", "Every 6 hours as needed"),
+        ],
+        "progress": [
+            "Fever settling on antibiotics, oxygen requirement reducing.",
+            "Chest clearer on auscultation, tolerating oral intake.",
+            "Ongoing cough, saturations stable on room air.",
+        ],
+    },
+    {
+        "weight": 6,
+        "code": "J44.1",
+        "description": "Chronic obstructive pulmonary disease with acute exacerbation",
+        "drg": ("190", "Chronic obstructive pulmonary disease with MCC"),
+        "reason": "Worsening breathlessness and wheeze",
+        "imaging": ("Chest X-ray", "Hyperinflated lungs, no consolidation"),
+        "labs": [
+            ("Arterial blood gas", ["pH {ph}, pCO2 {pco2} kPa"]),
+            ("CBC", ["WBC {wbc} x10^9/L", "Hemoglobin {hb} g/dL"]),
+        ],
+        "meds": [
+            ("Prednisolone", "40 mg", "Orally once daily"),
+            ("Salbutamol", "5 mg", "Nebulised every 4 hours"),
+            ("Ipratropium", "500 mcg", "Nebulised every 6 hours"),
+        ],
+        "progress": [
+            "Wheeze improving, nebuliser frequency reduced.",
+            "Mobilising on the ward, saturations at target range.",
+            "Remains breathless on exertion, continue steroids.",
+        ],
+    },
+    {
+        "weight": 8,
+        "code": "I21.0",
+        "description": "Acute transmural myocardial infarction of anterior wall",
+        "drg": ("280", "Acute myocardial infarction, discharged alive with MCC"),
+        "reason": "Central crushing chest pain radiating to the left arm",
+        "imaging": ("Echocardiogram", "Anterior wall hypokinesia, EF {ef}%"),
+        "labs": [
+            ("Troponin", ["{trop} ng/L"]),
+            ("Lipid panel", ["LDL {ldl} mmol/L"]),
+            ("BMP", ["Creatinine {creat} umol/L, potassium {k} mmol/L"]),
+        ],
+        "meds": [
+            ("Aspirin", "75 mg", "Orally once daily"),
+            ("Ticagrelor", "90 mg", "Orally twice daily"),
+            ("Atorvastatin", "80 mg", "Orally at night"),
+            ("Bisoprolol", "2.5 mg", "Orally once daily"),
+        ],
+        "progress": [
+            "Chest pain free since PCI, radial site clean.",
+            "Telemetry unremarkable overnight, mobilising.",
+            "Cardiac rehabilitation referral made.",
+        ],
+    },
+    {
+        "weight": 6,
+        "code": "I50.9",
+        "description": "Heart failure, unspecified",
+        "drg": ("291", "Heart failure and shock with MCC"),
+        "reason": "Progressive breathlessness and ankle swelling",
+        "imaging": ("Echocardiogram", "Dilated left ventricle, EF {ef}%"),
+        "labs": [
+            ("BNP", ["{bnp} pg/mL"]),
+            ("BMP", ["Creatinine {creat} umol/L, potassium {k} mmol/L"]),
+        ],
+        "meds": [
+            ("Furosemide", "40 mg", "IV twice daily"),
+            ("Ramipril", "2.5 mg", "Orally once daily"),
+            ("Spironolactone", "25 mg", "Orally once daily"),
+        ],
+        "progress": [
+            "Good diuresis overnight, weight down {weight_loss} kg.",
+            "Oedema improving, switch to oral diuretics planned.",
+            "Renal function stable on diuretics.",
+        ],
+    },
+    {
+        "weight": 4,
+        "code": "I61.9",
+        "description": "Intracerebral hemorrhage, unspecified",
+        "drg": ("064", "Intracranial hemorrhage or cerebral infarction with MCC"),
+        "reason": "Sudden onset headache and left-sided weakness",
+        "imaging": ("CT head", "Intraparenchymal haemorrhage in the right hemisphere"),
+        "labs": [
+            ("Coagulation profile", ["INR {inr}"]),
+            ("CBC", ["WBC {wbc} x10^9/L", "Hemoglobin {hb} g/dL"]),
+        ],
+        "meds": [
+            ("Mannitol", "0.25 g/kg", "Every 6 hours"),
+            ("Labetalol", "20 mg", "IV as per BP"),
+        ],
+        "progress": [
+            "GCS {gcs}, neurological observations stable.",
+            "Speech and swallow assessment completed.",
+            "Blood pressure within target on infusion.",
+        ],
+    },
+    {
+        "weight": 5,
+        "code": "I63.9",
+        "description": "Cerebral infarction, unspecified",
+        "drg": ("065", "Intracranial hemorrhage or cerebral infarction with CC"),
+        "reason": "Facial droop and slurred speech",
+        "imaging": ("MRI brain", "Acute infarct in the left MCA territory"),
+        "labs": [
+            ("Lipid panel", ["LDL {ldl} mmol/L"]),
+            ("HbA1c", ["{hba1c} mmol/mol"]),
+        ],
+        "meds": [
+            ("Aspirin", "300 mg", "Orally once daily for 14 days"),
+            ("Atorvastatin", "80 mg", "Orally at night"),
+        ],
+        "progress": [
+            "Power in right arm improving, physiotherapy ongoing.",
+            "Swallow safe for soft diet.",
+            "Occupational therapy assessment booked.",
+        ],
+    },
+    {
+        "weight": 7,
+        "code": "A41.9",
+        "description": "Sepsis, unspecified organism",
+        "drg": ("871", "Septicemia or severe sepsis without MV >96 hours with MCC"),
+        "reason": "Fever, rigors and hypotension",
+        "imaging": ("Chest X-ray", "No focal consolidation"),
+        "labs": [
+            ("Lactate", ["{lactate} mmol/L"]),
+            ("Blood cultures", ["Gram-negative rods", "No growth at 48 hours"]),
+            ("CBC", ["WBC {wbc} x10^9/L", "Hemoglobin {hb} g/dL"]),
+        ],
+        "meds": [
+            ("Piperacillin-tazobactam", "4.5 g", "IV every 8 hours"),
+            ("Sodium chloride 0.9%", "500 mL", "IV bolus"),
+        ],
+        "progress": [
+            "Lactate clearing, off vasopressors.",
+            "Afebrile for 24 hours, antibiotics rationalised.",
+            "Source identified as urinary, continue therapy.",
+        ],
+    },
+    {
+        "weight": 4,
+        "code": "K35.80",
+        "description": "Unspecified acute appendicitis",
+        "drg": ("343", "Appendectomy without complicated principal diagnosis"),
+        "reason": "Right iliac fossa pain and vomiting",
+        "imaging": ("CT abdomen", "Inflamed appendix without perforation"),
+        "labs": [
+            ("CBC", ["WBC {wbc} x10^9/L", "Hemoglobin {hb} g/dL"]),
+            ("CRP", ["{crp} mg/L"]),
+        ],
+        "meds": [
+            ("Co-amoxiclav", "1.2 g", "IV every 8 hours"),
+            ("Morphine", "5 mg", "IV as needed"),
+        ],
+        "progress": [
+            "Laparoscopic appendicectomy performed, wounds clean.",
+            "Tolerating diet, pain controlled on oral analgesia.",
+            "Bowels opened, mobilising independently.",
+        ],
+    },
+    {
+        "weight": 4,
+        "code": "S72.001A",
+        "description": "Fracture of unspecified part of neck of right femur",
+        "drg": ("481", "Hip and femur procedures except major joint with CC"),
+        "reason": "Fall at home with right hip pain",
+        "imaging": (
+            "X-ray hip",
+            "Displaced intracapsular fracture of the femoral neck",
+        ),
+        "labs": [
+            ("CBC", ["WBC {wbc} x10^9/L", "Hemoglobin {hb} g/dL"]),
+            ("Group and save", ["Completed"]),
+        ],
+        "meds": [
+            ("Enoxaparin", "40 mg", "Subcutaneous once daily"),
+            ("Paracetamol", "1 g", "Orally every 6 hours"),
+            ("Oxycodone", "5 mg", "Orally as needed"),
+        ],
+        "progress": [
+            "Hemiarthroplasty performed, wound dry.",
+            "Mobilising with frame and physiotherapy.",
+            "Orthogeriatric review completed.",
+        ],
+    },
+    {
+        "weight": 3,
+        "code": "E11.10",
+        "description": "Type 2 diabetes mellitus with ketoacidosis without coma",
+        "drg": ("637", "Diabetes with MCC"),
+        "reason": "Vomiting, polyuria and drowsiness",
+        "imaging": ("Chest X-ray", "No acute abnormality"),
+        "labs": [
+            ("Venous blood gas", ["pH {ph}, bicarbonate {bicarb} mmol/L"]),
+            ("Ketones", ["{ketones} mmol/L"]),
+            ("BMP", ["Creatinine {creat} umol/L, potassium {k} mmol/L"]),
+        ],
+        "meds": [
+            ("Insulin infusion", "0.1 units/kg/hr", "Continuous IV"),
+            ("Potassium chloride", "40 mmol", "IV in each litre"),
+        ],
+        "progress": [
+            "Ketones cleared, transitioned to subcutaneous insulin.",
+            "Diabetes nurse education completed.",
+            "Capillary glucose within target.",
+        ],
+    },
+    {
+        "weight": 5,
+        "code": "N39.0",
+        "description": "Urinary tract infection, site not specified",
+        "drg": ("690", "Kidney and urinary tract infections without MCC"),
+        "reason": "Dysuria, confusion and fever",
+        "imaging": ("Renal ultrasound", "No hydronephrosis"),
+        "labs": [
+            ("Urinalysis", ["Nitrites positive, leukocytes +++"]),
+            ("Urine culture", ["E. coli, sensitive to nitrofurantoin", "Pending"]),
+        ],
+        "meds": [
+            ("Nitrofurantoin", "100 mg", "Orally twice daily"),
+            ("Gentamicin", "5 mg/kg", "IV once daily"),
+        ],
+        "progress": [
+            "Confusion resolving, drinking well.",
+            "Afebrile, switched to oral antibiotics.",
+            "Back to baseline cognition per family.",
+        ],
+    },
+    {
+        "weight": 4,
+        "code": "K92.2",
+        "description": "Gastrointestinal hemorrhage, unspecified",
+        "drg": ("378", "GI hemorrhage with CC"),
+        "reason": "Melaena and dizziness",
+        "imaging": ("Endoscopy", "Duodenal ulcer with visible vessel, treated"),
+        "labs": [
+            ("CBC", ["WBC {wbc} x10^9/L", "Hemoglobin {hb} g/dL"]),
+            ("Coagulation profile", ["INR {inr}"]),
+        ],
+        "meds": [
+            ("Pantoprazole", "40 mg", "IV twice daily"),
+            ("Packed red cells", "1 unit", "IV over 2 hours"),
+        ],
+        "progress": [
+            "Hemoglobin stable after transfusion.",
+            "No further melaena, diet reintroduced.",
+            "H. pylori eradication therapy started.",
+        ],
+    },
+]
+
+_PROFILE_WEIGHTS = [profile["weight"] for profile in PROFILES]
+_CORPUS_START = date(2023, 1, 1)
+
+
+def _lab_values(rng):
+    """Random values for the placeholders used in lab results and notes."""
+    return {
+        "wbc": round(rng.uniform(4, 22), 1),
+        "hb": round(rng.uniform(8, 16), 1),
+        "crp": rng.randint(5, 300),
+        "ph": round(rng.uniform(7.1, 7.45), 2),
+        "pco2": round(rng.uniform(4, 9), 1),
+        "trop": rng.randint(20, 20000),
+        "ldl": round(rng.uniform(1.5, 5.5), 1),
+        "creat": rng.randint(50, 250),
+        "k": round(rng.uniform(3.0, 5.8), 1),
+        "ef": rng.randint(20, 60),
+        "bnp": rng.randint(100, 5000),
+        "inr": round(rng.uniform(0.9, 3.5), 1),
+        "gcs": rng.randint(9, 15),
+        "hba1c": rng.randint(40, 110),
+        "lactate": round(rng.uniform(0.8, 6.0), 1),
+        "bicarb": rng.randint(8, 24),
+        "ketones": round(rng.uniform(0.2, 6.0), 1),
+        "weight_loss": round(rng.uniform(0.5, 2.5), 1),
+    }
+
+
+def _count(rng, per_day, detail):
+    """Entries for one day: a Poisson-ish draw around ``per_day * detail``."""
+    mean = per_day * detail
+    whole = int(mean)
+    return whole + (1 if rng.random() < mean - whole else 0)
+
+
+def generate_record(
+    index,
+    seed=0,
+    los_median=4.0,
+    los_sigma=0.6,
+    los_max=60,
+    size_scale=1.0,
+    size_sigma=0.5,
+    discharged_fraction=0.8,
+):
+    """
+    Generate one synthetic patient record.
+
+    Args:
+        index (int): Record number within the corpus
+        seed (int): Corpus seed
+        los_median (float): Median length of stay in days
+        los_sigma (float): Log-normal shape of the length of stay
+        los_max (int): Longest length of stay in days
+        size_scale (float): Multiplier on entries per day for every record
+        size_sigma (float): Log-normal spread of entries per day between records
+        discharged_fraction (float): Share of records with a discharge date
+                                     (the rest have an expected discharge date)
+
+    Returns:
+        dict: Patient record
+    """
+    rng = random.Random(f"{seed}:{index}")
+    profile = rng.choices(PROFILES, weights=_PROFILE_WEIGHTS)[0]
+    values = _lab_values(rng)
+
+    los = int(round(rng.lognormvariate(math.log(los_median), los_sigma)))
+    los = max(1, min(los_max, los))
+    detail = size_scale * rng.lognormvariate(0, size_sigma)
+    admission = _CORPUS_START + timedelta(days=rng.randrange(730))
+    days = [admission + timedelta(days=day) for day in range(los)]
+    discharge = days[-1]
+
+    demographics = {
+        "name": f"{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}",
+        "age": rng.randint(18, 98),
+        "gender": rng.choice(["Male", "Female"]),
+        "admission_date": admission.isoformat(),
+    }
+    if rng.random() < discharged_fraction:
+        demographics["discharge_date"] = discharge.isoformat()
+    else:
+        demographics["expected_discharge_date"] = discharge.isoformat()
+
+    encounters = [
+        {
+            "date": admission.isoformat(),
+            "type": "Admission",
+            "reason": profile["reason"],
+        },
+        {
+            "date": days[min(1, los - 1)].isoformat(),
+            "type": profile["imaging"][0],
+            "findings": profile["imaging"][1].format(**values),
+        },
+    ]
+    for day in days[2:]:
+        if rng.random() < 0.15 * detail:
+            encounters.append(
+                {
+                    "date": day.isoformat(),
+                    "type": "Consultation",
+                    "reason": f"{rng.choice(CONSULT_SERVICES)} review",
+                }
+            )
+
+    flowsheets, labs, ward_round_notes, notes = [], [], [], []
+    for day_number, day in enumerate(days):
+        for reading in range(max(1, _count(rng, 4, detail))):
+            systolic, diastolic = rng.randint(95, 175), rng.randint(55, 100)
+            flowsheets.append(
+                {
+                    "date": day.isoformat(),
+                    "time": f"{(6 + reading * 4) % 24:02d}:00",
+                    "temperature": f"{rng.uniform(36.0, 39.5):.1f}°C",
+                    "heart_rate": f"{rng.randint(55, 125)} bpm",
+                    "blood_pressure": f"{systolic}/{diastolic} mmHg",
+                    "respiratory_rate": f"{rng.randint(12, 28)} breaths/min",
+                    "oxygen_saturation": f"{rng.randint(88, 100)}%",
+                }
+            )
+        if day_number == 0 or rng.random() < 0.6 * detail:
+            labs.append(
+                {
+                    "date": day.isoformat(),
+                    "tests": [
+                        {
+                            "name": name,
+                            "result": rng.choice(results).format(**values),
+                        }
+                        for name, results in profile["labs"]
+                    ],
+                }
+            )
+        for _ in range(max(1, _count(rng, 1, detail))):
+            ward_round_notes.append(
+                {
+                    "date": day.isoformat(),
+                    "time": rng.choice(TIMES_OF_DAY),
+                    "note": rng.choice(profile["progress"]).format(**values),
+                }
+            )
+        for _ in range(_count(rng, 1, detail)):
+            notes.append(
+                {
+                    "date": day.isoformat(),
+                    "author": rng.choice(CLINICIANS + NURSES),
+                    "note_type": "Progress Note",
+                    "content": rng.choice(profile["progress"]).format(**values),
+                }
+            )
+
+    notes.insert(
+        0,
+        {
+            "date": admission.isoformat(),
+            "author": rng.choice(CLINICIANS),
+            "note_type": "Admission Note",
+            "content": f"Admitted with {profile['reason'].lower()}. "
+            f"Working diagnosis: {profile['description'].lower()}.",
+        },
+    )
+    if "discharge_date" in demographics:
+        notes.append(
+            {
+                "date": discharge.isoformat(),
+                "author": rng.choice(CLINICIANS),
+                "note_type": "Discharge Note",
+                "content": "Clinically stable for discharge with follow-up arranged.",
+            }
+        )
+
+    med_orders = [
+        {
+            "date": days[min(rng.randrange(2), los - 1)].isoformat(),
+            "medication": medication,
+            "dose": dose,
+            "frequency": frequency,
+        }
+        for medication, dose, frequency in profile["meds"]
+    ]
+
+    return {
+        "patient_id": f"SYN{seed:03d}{index:09d}",
+        "patient_demographics": demographics,
+        "diagnoses": [
+            {
+                "date": admission.isoformat(),
+                "diagnosis_code": profile["code"],
+                "description": profile["description"],
+            }
+        ],
+        "drg": {"code": profile["drg"][0], "description": profile["drg"][1]},
+        "encounters": encounters,
+        "flowsheets": flowsheets,
+        "labs": labs,
+        "med_orders": med_orders,
+        "ward_round_notes": ward_round_notes,
+        "notes": notes,
+    }
+
+
+def iter_corpus(count, start=0, **options):
+    """
+    Lazily generate ``count`` records, starting at record number ``start``.
+
+    Args:
+        count (int): Number of records
+        start (int): Index of the first record
+        **options: Distribution options for generate_record
+
+    Yields:
+        dict: Patient records
+    """
+    for index in range(start, start + count):
+        yield generate_record(index, **options)
+
+
+def _record_json(index, **options):
+    """Generate and serialize one record (run in worker processes)."""
+    return json.dumps(generate_record(index, **options))
+
+
+def _json_line(record):
+    return (record if isinstance(record, str) else json.dumps(record)) + "\n"
+
+
+def write_jsonl(records, path, append=False):
+    """
+    Stream records to a JSON-lines file.
+
+    Args:
+        records (iterable): Record dicts or already-serialized JSON strings
+        path (str): Output file
+        append (bool): Add to the end of an existing file (to continue a
+                       corpus) instead of replacing it
+
+    Returns:
+        int: Number of records written
+    """
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    written = 0
+    with open(path, "a" if append else "w") as f:
+        for record in records:
+            f.write(_json_line(record))
+            written += 1
+    return written
+
+
+def write_shards(records, directory, shard_size, start=0):
+    """
+    Stream records to ``shard_00000.jsonl``, ``shard_00001.jsonl``, ... files.
+
+    The directory can be passed straight to ``app.py --mode batch --input``.
+
+    Args:
+        records (iterable): Record dicts or already-serialized JSON strings
+        directory (str): Output directory
+        shard_size (int): Records per shard
+        start (int): Index of the first record, to continue a corpus: shards
+                     are numbered from it, a partly written shard is appended
+                     to and existing later shards are never overwritten
+
+    Returns:
+        int: Number of records written
+
+    Raises:
+        FileExistsError: If continuing would overwrite an existing shard
+    """
+    directory = Path(directory)
+    directory.mkdir(parents=True, exist_ok=True)
+    written = 0
+    shard = None
+    try:
+        for record in records:
+            position = start + written
+            if shard is None or position % shard_size == 0:
+                if shard:
+                    shard.close()
+                if position % shard_size:
+                    mode = "a"
+                else:
+                    mode = "x" if start else "w"
+                shard = open(
+                    directory / f"shard_{position // shard_size:05d}.jsonl", mode
+                )
+            shard.write(_json_line(record))
+            written += 1
+    finally:
+        if shard:
+            shard.close()
+    return written
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Synthetic patient corpus generator")
+    parser.add_argument("--count", type=int, required=True)
+    parser.add_argument(
+        "--output", required=True, help="JSONL file, or directory with --shard-size"
+    )
+    parser.add_argument(
+        "--shard-size", type=int, help="Write a directory of JSONL shards"
+    )
+    parser.add_argument(
+        "--workers", type=int, default=1, help="Generator processes (order is kept)"
+    )
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--start", type=int, default=0)
+    parser.add_argument("--los-median", type=float, default=4.0)
+    parser.add_argument("--los-sigma", type=float, default=0.6)
+    parser.add_argument("--los-max", type=int, default=60)
+    parser.add_argument("--size-scale", type=float, default=1.0)
+    parser.add_argument("--size-sigma", type=float, default=0.5)
+    parser.add_argument("--discharged-fraction", type=float, default=0.8)
+    args = parser.parse_args()
+
+    options = {
+        "seed": args.seed,
+        "los_median": args.los_median,
+        "los_sigma": args.los_sigma,
+        "los_max": args.los_max,
+        "size_scale": args.size_scale,
+        "size_sigma": args.size_sigma,
+        "discharged_fraction": args.discharged_fraction,
+    }
+    pool = None
+    if args.workers > 1:
+        # Records are seeded by index, so parallel output matches serial output
+        pool = multiprocessing.Pool(args.workers)
+        records = pool.imap(
+            partial(_record_json, **options),
+            range(args.start, args.start + args.count),
+            chunksize=256,
+        )
+    else:
+        records = iter_corpus(args.count, start=args.start, **options)
+    try:
+        if args.shard_size:
+            written = write_shards(
+                records, args.output, args.shard_size, start=args.start
+            )
+        else:
+            written = write_jsonl(records, args.output, append=args.start > 0)
+    finally:
+        if pool:
+            pool.close()
+            pool.join()
+    print(f"Wrote {written} records to {args.output}", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
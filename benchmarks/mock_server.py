@@ -0,0 +1,490 @@
+"""
+Local stand-in for the OpenAI chat completions API.
+
+Serves ``POST /v1/chat/completions`` (plain and streaming) with a
+configurable response latency, prompt processing and token generation
+rates and injected errors, so the generation pipeline can be benchmarked
+without network calls or API credits. Prompt caching is simulated too:
+once a system message has been seen, later requests starting with it
+report its tokens as ``usage.prompt_tokens_details.cached_tokens``. The
+Batch API is served as well (``POST /v1/files``,
+``GET /v1/files/<id>/content``, ``POST /v1/batches``,
+``GET /v1/batches/<id>`` and ``POST /v1/batches/<id>/cancel``): a batch
+completes ``batch_latency`` seconds after it is created. Can be started
+in-process (``MockLLMServer``) or on its own::
+
+    python -m benchmarks.mock_server --port 8765 --latency 0.2
+
+and used by pointing ``OPENAI_BASE_URL`` at ``http://127.0.0.1:8765/v1``.
+"""
+
+import argparse
+import json
+import random
+import re
+import threading
+import time
+import uuid
+from email import policy
+from email.parser import BytesParser
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    # Headers and body go out as separate writes; with Nagle's algorithm on,
+    # each response would stall on the client's delayed ACK (~40 ms)
+    disable_nagle_algorithm = True
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send_json(self, status, payload, headers=None):
+        body = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header("content-type", "application/json")
+        self.send_header("content-length", str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _write_chunk(self, text):
+        data = text.encode()
+        self.wfile.write(b"%x\r\n%s\r\n" % (len(data), data))
+        self.wfile.flush()
+
+    def _not_found(self):
+        self._send_json(404, {"error": {"message": f"No route for {self.path}"}})
+
+    def do_GET(self):
+        mock = self.server.mock
+        match = re.match(r"^/v1/(files|batches)/([\w-]+)(/content)?$", self.path)
+        if match is None:
+            self._not_found()
+        elif match.group(1) == "files" and match.group(3):
+            content = mock.files.get(match.group(2))
+            if content is None:
+                self._not_found()
+                return
+            self.send_response(200)
+            self.send_header("content-type", "application/octet-stream")
+            self.send_header("content-length", str(len(content)))
+            self.end_headers()
+            self.wfile.write(content)
+        elif match.group(1) == "batches" and not match.group(3):
+            batch = mock.batch(match.group(2))
+            if batch is None:
+                self._not_found()
+            else:
+                self._send_json(200, batch)
+        else:
+            self._not_found()
+
+    def _upload_file(self, raw):
+        """Store a multipart upload (the Files API)."""
+        message = BytesParser(policy=policy.default).parsebytes(
+            f"Content-Type: {self.headers.get('content-type')}\r\n\r\n".encode() + raw
+        )
+        fields = {
+            part.get_param("name", header="content-disposition"): part
+            for part in message.iter_parts()
+        }
+        if "file" not in fields:
+            self._send_json(400, {"error": {"message": "Missing file"}})
+            return
+        part = fields["file"]
+        purpose = fields["purpose"].get_content() if "purpose" in fields else None
+        self._send_json(
+            200,
+            self.server.mock.add_file(
+                part.get_payload(decode=True), part.get_filename(), purpose
+            ),
+        )
+
+    def do_POST(self):
+        mock = self.server.mock
+        length = int(self.headers.get("content-length", 0))
+        raw = self.rfile.read(length)
+        path = self.path.rstrip("/")
+        if path == "/v1/files":
+            self._upload_file(raw)
+            return
+        try:
+            body = json.loads(raw or b"{}")
+        except json.JSONDecodeError:
+            self._send_json(400, {"error": {"message": "Invalid JSON body"}})
+            return
+        if path == "/v1/batches":
+            if body.get("input_file_id") not in mock.files:
+                self._send_json(400, {"error": {"message": "Unknown input_file_id"}})
+                return
+            self._send_json(200, mock.create_batch(body))
+            return
+        match = re.match(r"^/v1/batches/([\w-]+)/cancel$", path)
+        if match is not None:
+            batch = mock.cancel_batch(match.group(1))
+            if batch is None:
+                self._not_found()
+            else:
+                self._send_json(200, batch)
+            return
+        if not path.endswith("/chat/completions"):
+            self._not_found()
+            return
+
+        failure = mock.draw_failure()
+        if failure == "rate_limit":
+            self._send_json(
+                429,
+                {"error": {"message": "Rate limit reached", "type": "requests"}},
+                {"retry-after-ms": "10"},
+            )
+            return
+        if failure == "error":
+            self._send_json(500, {"error": {"message": "Injected server error"}})
+            return
+
+        model, words, usage = mock.completion(body)
+        time.sleep(mock.latency)
+        mock.prefill(
+            usage["prompt_tokens"] - usage["prompt_tokens_details"]["cached_tokens"]
+        )
+
+        if body.get("stream"):
+            self.send_response(200)
+            self.send_header("content-type", "text/event-stream")
+            self.send_header("transfer-encoding", "chunked")
+            self.end_headers()
+            for word in words:
+                chunk = {
+                    "id": "chatcmpl-mock",
+                    "object": "chat.completion.chunk",
+                    "created": int(time.time()),
+                    "model": model,
+                    "choices": [
+                        {
+                            "index": 0,
+                            "delta": {"content": word + " "},
+                            "finish_reason": None,
+                        }
+                    ],
+                }
+                self._write_chunk(f"data: {json.dumps(chunk)}\n\n")
+                mock.pace(1)
+            if (body.get("stream_options") or {}).get("include_usage"):
+                chunk = {
+                    "id": "chatcmpl-mock",
+                    "object": "chat.completion.chunk",
+                    "created": int(time.time()),
+                    "model": model,
+                    "choices": [],
+                    "usage": usage,
+                }
+                self._write_chunk(f"data: {json.dumps(chunk)}\n\n")
+            self._write_chunk("data: [DONE]\n\n")
+            self.wfile.write(b"0\r\n\r\n")
+            return
+
+        mock.pace(len(words))
+        self._send_json(200, mock.completion_response(model, words, usage))
+
+
+class MockLLMServer:
+    """
+    OpenAI-compatible mock server running on a background thread.
+    """
+
+    def __init__(
+        self,
+        host="127.0.0.1",
+        port=0,
+        latency=0.05,
+        tokens_per_second=0,
+        prefill_tokens_per_second=0,
+        completion_tokens=200,
+        error_rate=0.0,
+        rate_limit_rate=0.0,
+        seed=0,
+        batch_latency=1.0,
+    ):
+        """
+        Initialize the server (call start() to begin serving).
+
+        Args:
+            host (str): Interface to bind
+            port (int): Port to bind (0 picks a free port)
+            latency (float): Seconds before the first token of every response
+            tokens_per_second (float): Completion token rate (0 for instant)
+            prefill_tokens_per_second (float): Rate at which uncached prompt
+                                               tokens are processed before the
+                                               first token (0 for instant)
+            completion_tokens (int): Tokens per completion (capped by max_tokens)
+            error_rate (float): Fraction of requests answered with a 500
+            rate_limit_rate (float): Fraction of requests answered with a 429
+            seed (int): Seed for the error injection
+            batch_latency (float): Seconds before a Batch API batch completes
+        """
+        self.latency = latency
+        self.tokens_per_second = tokens_per_second
+        self.prefill_tokens_per_second = prefill_tokens_per_second
+        self.completion_tokens = completion_tokens
+        self.error_rate = error_rate
+        self.rate_limit_rate = rate_limit_rate
+        self.batch_latency = batch_latency
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self.counts = {"requests": 0, "errors": 0, "rate_limited": 0}
+        self._seen_prefixes = set()
+        self.files = {}
+        self._file_info = {}
+        self._batches = {}
+        self._server = ThreadingHTTPServer((host, port), _Handler)
+        self._server.daemon_threads = True
+        self._server.mock = self
+        self._thread = None
+
+    @property
+    def base_url(self):
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}/v1"
+
+    def draw_failure(self):
+        """Count a request and decide whether to fail it."""
+        with self._lock:
+            self.counts["requests"] += 1
+            roll = self._random.random()
+            if roll < self.rate_limit_rate:
+                self.counts["rate_limited"] += 1
+                return "rate_limit"
+            if roll < self.rate_limit_rate + self.error_rate:
+                self.counts["errors"] += 1
+                return "error"
+        return None
+
+    def cached_tokens(self, messages):
+        """Tokens of a previously seen system message that ``messages`` start with."""
+        if not messages or messages[0].get("role") != "system":
+            return 0
+        prefix = json.dumps(messages[0])
+        with self._lock:
+            if prefix in self._seen_prefixes:
+                return len(prefix) // 4
+            self._seen_prefixes.add(prefix)
+        return 0
+
+    def prefill(self, tokens):
+        """Sleep for the time it takes to process ``tokens`` prompt tokens."""
+        if self.prefill_tokens_per_second > 0:
+            time.sleep(tokens / self.prefill_tokens_per_second)
+
+    def pace(self, tokens):
+        """Sleep for the time it takes to generate ``tokens`` tokens."""
+        if self.tokens_per_second > 0:
+            time.sleep(tokens / self.tokens_per_second)
+
+    def completion(self, body):
+        """
+        Work out a chat completion request's answer.
+
+        Returns:
+            tuple: (model, answer words, usage dict)
+        """
+        messages = body.get("messages", [])
+        prompt_tokens = max(1, len(json.dumps(messages)) // 4)
+        completion_tokens = min(
+            self.completion_tokens, body.get("max_tokens") or self.completion_tokens
+        )
+        usage = {
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": completion_tokens,
+            "total_tokens": prompt_tokens + completion_tokens,
+            "prompt_tokens_details": {"cached_tokens": self.cached_tokens(messages)},
+        }
+        words = [f"word{i % 50}" for i in range(completion_tokens)]
+        return body.get("model", "mock"), words, usage
+
+    @staticmethod
+    def completion_response(model, words, usage):
+        """The (non-streaming) chat completion body for an answer."""
+        return {
+            "id": "chatcmpl-mock",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": model,
+            "choices": [
+                {
+                    "index": 0,
+                    "message": {"role": "assistant", "content": " ".join(words)},
+                    "finish_reason": "stop",
+                }
+            ],
+            "usage": usage,
+        }
+
+    def add_file(self, content, filename=None, purpose=None):
+        """Store an uploaded file and return its file object."""
+        file_id = f"file-{uuid.uuid4().hex[:24]}"
+        info = {
+            "id": file_id,
+            "object": "file",
+            "bytes": len(content),
+            "created_at": int(time.time()),
+            "filename": filename or file_id,
+            "purpose": purpose,
+            "status": "processed",
+        }
+        with self._lock:
+            self.files[file_id] = content
+            self._file_info[file_id] = info
+        return info
+
+    def create_batch(self, body):
+        """Create a batch from an uploaded JSONL file of requests."""
+        lines = [
+            json.loads(line)
+            for line in self.files[body["input_file_id"]].decode().splitlines()
+            if line.strip()
+        ]
+        now = int(time.time())
+        batch = {
+            "id": f"batch_{uuid.uuid4().hex[:24]}",
+            "object": "batch",
+            "endpoint": body.get("endpoint"),
+            "input_file_id": body["input_file_id"],
+            "completion_window": body.get("completion_window", "24h"),
+            "status": "in_progress",
+            "output_file_id": None,
+            "error_file_id": None,
+            "created_at": now,
+            "in_progress_at": now,
+            "completed_at": None,
+            "cancelled_at": None,
+            "request_counts": {"total": len(lines), "completed": 0, "failed": 0},
+            "metadata": body.get("metadata"),
+        }
+        with self._lock:
+            self.counts["batches"] = self.counts.get("batches", 0) + 1
+            self._batches[batch["id"]] = (batch, lines, time.time())
+        return dict(batch)
+
+    def batch(self, batch_id):
+        """Return a batch, completing it once batch_latency has passed."""
+        with self._lock:
+            entry = self._batches.get(batch_id)
+        if entry is None:
+            return None
+        batch, lines, created = entry
+        if batch["status"] == "in_progress" and (
+            time.time() - created >= self.batch_latency
+        ):
+            self._complete_batch(batch, lines)
+        return dict(batch)
+
+    def _complete_batch(self, batch, lines):
+        """Answer every request of a batch into output and error files."""
+        outputs, errors = [], []
+        for line in lines:
+            result = {
+                "id": f"batch_req_{uuid.uuid4().hex[:24]}",
+                "custom_id": line.get("custom_id"),
+                "response": None,
+                "error": None,
+            }
+            failure = self.draw_failure()
+            if failure is not None:
+                result["response"] = {
+                    "status_code": 429 if failure == "rate_limit" else 500,
+                    "request_id": uuid.uuid4().hex,
+                    "body": {"error": {"message": f"Injected {failure}"}},
+                }
+                errors.append(result)
+                continue
+            model, words, usage = self.completion(line.get("body", {}))
+            result["response"] = {
+                "status_code": 200,
+                "request_id": uuid.uuid4().hex,
+                "body": self.completion_response(model, words, usage),
+            }
+            outputs.append(result)
+
+        def write(results):
+            content = "".join(json.dumps(result) + "\n" for result in results)
+            return self.add_file(content.encode(), purpose="batch_output")["id"]
+
+        batch["output_file_id"] = write(outputs) if outputs else None
+        batch["error_file_id"] = write(errors) if errors else None
+        batch["request_counts"].update(completed=len(outputs), failed=len(errors))
+        batch["status"] = "completed"
+        batch["completed_at"] = int(time.time())
+
+    def cancel_batch(self, batch_id):
+        """Cancel a batch that has not completed yet."""
+        with self._lock:
+            entry = self._batches.get(batch_id)
+        if entry is None:
+            return None
+        batch = entry[0]
+        if batch["status"] == "in_progress":
+            batch["status"] = "cancelled"
+            batch["cancelled_at"] = int(time.time())
+        return dict(batch)
+
+    def serve_forever(self):
+        """Serve on the calling thread until interrupted or stopped."""
+        self._server.serve_forever()
+
+    def start(self):
+        """Serve on a background thread."""
+        self._thread = threading.Thread(
+            target=self.serve_forever, name="mock-llm-server", daemon=True
+        )
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Mock OpenAI-compatible server")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency", type=float, default=0.05)
+    parser.add_argument("--tokens-per-second", type=float, default=0)
+    parser.add_argument("--prefill-tokens-per-second", type=float, default=0)
+    parser.add_argument("--completion-tokens", type=int, default=200)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--batch-latency", type=float, default=1.0)
+    args = parser.parse_args()
+
+    server = MockLLMServer(
+        host=args.host,
+        port=args.port,
+        latency=args.latency,
+        tokens_per_second=args.tokens_per_second,
+        prefill_tokens_per_second=args.prefill_tokens_per_second,
+        completion_tokens=args.completion_tokens,
+        error_rate=args.error_rate,
+        rate_limit_rate=args.rate_limit_rate,
+        seed=args.seed,
+        batch_latency=args.batch_latency,
+    )
+    print(f"Mock LLM server listening on {server.base_url}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,467 @@
+"""
+Run the offline benchmark suite and write a JSON report.
+
+Scenarios:
+    prompt_build   - _prepare_request on charts of each size (µs/op)
+    generate       - generate_summary from a thread pool
+    map_reduce     - the same, with the section-parallel map-reduce strategy
+    incremental    - regeneration after one new lab result, with the
+                     incremental strategy (after an untimed first summary)
+    async          - agenerate_summary under an asyncio semaphore
+    stream         - stream_summary, with time to first token
+    batch          - run_batch over a JSONL file, as the batch CLI does
+
+Every LLM call goes to an in-process MockLLMServer. Timings are taken with
+tracemalloc off; peak memory comes from a second, traced pass over the
+first few charts (in-flight work is bounded by the concurrency, so the peak
+does not depend on the number of requests). The report is written
+with sorted keys and rounded numbers so two reports can be diffed, and
+``--compare`` prints the change in every metric against an earlier report::
+
+    python -m benchmarks.run --output bench.json
+    python -m benchmarks.run --compare bench.json
+"""
+
+import os
+
+# Measure the generation path itself, not the summary cache, store or audit sink
+os.environ.setdefault("SUMMARY_CACHE_ENABLED", "false")
+os.environ.setdefault("AUDIT_LOG_ENABLED", "false")
+os.environ.setdefault("SUMMARY_STORE_ENABLED", "false")
+
+import argparse
+import asyncio
+import copy
+import json
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from pathlib import Path
+
+import numpy as np
+from loguru import logger
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from benchmarks.charts import REPO_ROOT, make_charts
+from benchmarks.corpus import iter_corpus
+from benchmarks.mock_server import MockLLMServer
+from llm.batch import run_batch
+from llm.discharge_generator import DischargeSummaryGenerator
+from llm.backends import MockBackend
+from llm.scheduler import RequestScheduler
+from llm.utils import consume_stream
+
+SCENARIOS = [
+    "prompt_build",
+    "generate",
+    "map_reduce",
+    "incremental",
+    "async",
+    "stream",
+    "batch",
+]
+
+# Charts replayed under tracemalloc to measure each scenario's memory peak
+MEMORY_SAMPLE = 16
+
+
+def _round(value, digits=3):
+    """Round to ``digits`` significant figures so reports diff cleanly."""
+    if value is None or value == 0:
+        return value
+    return float(f"{value:.{digits}g}")
+
+
+def _latency_summary(latencies_ms):
+    if not latencies_ms:
+        return {}
+    values = np.asarray(latencies_ms)
+    return {
+        "mean": _round(float(values.mean())),
+        "p50": _round(float(np.percentile(values, 50))),
+        "p90": _round(float(np.percentile(values, 90))),
+        "p99": _round(float(np.percentile(values, 99))),
+        "max": _round(float(values.max())),
+    }
+
+
+def _stage_means(all_timings):
+    """Mean milliseconds per pipeline stage across calls."""
+    stages = {}
+    for timings in all_timings:
+        for stage, ms in timings.items():
+            stages.setdefault(stage, []).append(ms)
+    return {stage: _round(float(np.mean(ms))) for stage, ms in stages.items()}
+
+
+class _Measure:
+    """Wall time of one scenario."""
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.seconds = time.perf_counter() - self.started
+
+
+def _peak_memory_mb(fn, *args):
+    """Run ``fn`` under tracemalloc and return its allocation peak in MB."""
+    tracemalloc.start()
+    try:
+        fn(*args)
+        return _round(tracemalloc.get_traced_memory()[1] / (1024 * 1024))
+    finally:
+        tracemalloc.stop()
+
+
+def _result(measure, latencies_ms, errors, all_timings=(), **extra):
+    requests = len(latencies_ms) + errors
+    result = {
+        "requests": requests,
+        "errors": errors,
+        "seconds": _round(measure.seconds),
+        "requests_per_second": _round(requests / measure.seconds),
+        "latency_ms": _latency_summary(latencies_ms),
+    }
+    if all_timings:
+        result["stages_ms"] = _stage_means(all_timings)
+    result.update(extra)
+    return result
+
+
+def bench_prompt_build(generator, sizes, iterations):
+    """Time prompt preparation for each chart size."""
+    results = {}
+    for size in sizes:
+        charts = make_charts(4, sizes=(size,))
+        prepared = [generator._prepare_request(chart) for chart in charts]
+
+        best = None
+        for _ in range(3):
+            started = time.perf_counter()
+            for i in range(iterations):
+                generator._prepare_request(charts[i % len(charts)])
+            elapsed = time.perf_counter() - started
+            best = elapsed if best is None else min(best, elapsed)
+
+        results[f"size_{size}"] = {
+            "us_per_op": _round(best / iterations * 1e6),
+            "chart_bytes": int(np.mean([len(json.dumps(c)) for c in charts])),
+            "prompt_tokens": int(np.mean([p["prompt_tokens"] for p in prepared])),
+            "peak_memory_mb": _peak_memory_mb(generator._prepare_request, charts[0]),
+        }
+    return results
+
+
+def bench_generate(generator, charts, concurrency, strategy="single"):
+    """Blocking generate_summary calls from a thread pool."""
+    latencies, all_timings, errors = [], [], 0
+
+    def one(chart):
+        timings = {}
+        started = time.perf_counter()
+        generator.generate_summary(chart, timings=timings, strategy=strategy)
+        return (time.perf_counter() - started) * 1000, timings
+
+    with _Measure() as measure:
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            futures = [executor.submit(one, chart) for chart in charts]
+            for future in futures:
+                try:
+                    latency, timings = future.result()
+                except Exception:
+                    errors += 1
+                    continue
+                latencies.append(latency)
+                all_timings.append(timings)
+    return _result(measure, latencies, errors, all_timings)
+
+
+def bench_map_reduce(generator, charts, concurrency):
+    """generate_summary with the map-reduce strategy, to compare with generate."""
+    return bench_generate(generator, charts, concurrency, strategy="map_reduce")
+
+
+def _with_new_lab(chart):
+    """Copy a chart with one more lab result, as a daily update would add."""
+    chart = copy.deepcopy(chart)
+    chart.setdefault("labs", []).append(
+        {"date": "2099-01-01", "test": "Potassium", "value": 4.2, "unit": "mmol/L"}
+    )
+    return chart
+
+
+def bench_incremental(generator, charts, concurrency):
+    """Incremental regeneration of charts that gained one lab result."""
+    # Draft every section once; only the updates are measured
+    bench_generate(generator, charts, concurrency, strategy="incremental")
+    updated = [_with_new_lab(chart) for chart in charts]
+    return bench_generate(generator, updated, concurrency, strategy="incremental")
+
+
+def bench_async(generator, charts, concurrency):
+    """agenerate_summary calls on one event loop."""
+    latencies, all_timings = [], []
+
+    async def run():
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def one(chart):
+            async with semaphore:
+                timings = {}
+                started = time.perf_counter()
+                await generator.agenerate_summary(chart, timings=timings)
+                latencies.append((time.perf_counter() - started) * 1000)
+                all_timings.append(timings)
+
+        return await asyncio.gather(
+            *(one(chart) for chart in charts), return_exceptions=True
+        )
+
+    with _Measure() as measure:
+        outcomes = asyncio.run(run())
+    errors = sum(1 for outcome in outcomes if isinstance(outcome, Exception))
+    return _result(measure, latencies, errors, all_timings)
+
+
+def bench_stream(generator, charts, concurrency):
+    """stream_summary calls from a thread pool, fully consumed."""
+    latencies, all_timings, errors = [], [], 0
+
+    def one(chart):
+        timings = {}
+        started = time.perf_counter()
+        consume_stream(generator.stream_summary(chart, timings=timings))
+        return (time.perf_counter() - started) * 1000, timings
+
+    with _Measure() as measure:
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            futures = [executor.submit(one, chart) for chart in charts]
+            for future in futures:
+                try:
+                    latency, timings = future.result()
+                except Exception:
+                    errors += 1
+                    continue
+                latencies.append(latency)
+                all_timings.append(timings)
+
+    first_token = [t["llm_first_token"] for t in all_timings if "llm_first_token" in t]
+    return _result(
+        measure,
+        latencies,
+        errors,
+        all_timings,
+        first_token_ms=_latency_summary(first_token),
+    )
+
+
+def bench_batch(generator, charts, concurrency):
+    """run_batch over a JSONL file of charts, as ``app.py --mode batch`` does."""
+    with tempfile.TemporaryDirectory() as tmp:
+        source = Path(tmp) / "charts.jsonl"
+        with open(source, "w") as f:
+            for chart in charts:
+                f.write(json.dumps(chart) + "\n")
+        with _Measure() as measure:
+            manifest = run_batch(
+                generator, str(source), Path(tmp) / "out", concurrency=concurrency
+            )
+    latencies = [
+        entry["elapsed_seconds"] * 1000
+        for entry in manifest["records"]
+        if entry["status"] == "ok"
+    ]
+    return _result(measure, latencies, manifest["counts"]["failed"])
+
+
+BENCHMARKS = {
+    "generate": bench_generate,
+    "map_reduce": bench_map_reduce,
+    "incremental": bench_incremental,
+    "async": bench_async,
+    "stream": bench_stream,
+    "batch": bench_batch,
+}
+
+
+def _git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=REPO_ROOT,
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def _flatten(report, prefix=""):
+    """Flatten nested numeric results to {"a.b.c": value}."""
+    flat = {}
+    for key, value in report.items():
+        name = f"{prefix}{key}"
+        if isinstance(value, dict):
+            flat.update(_flatten(value, name + "."))
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            flat[name] = value
+    return flat
+
+
+def compare_reports(baseline, current):
+    """
+    Print the change in every metric between two reports.
+
+    Args:
+        baseline (dict): Earlier report
+        current (dict): New report
+    """
+    old = _flatten(baseline["results"])
+    new = _flatten(current["results"])
+    print(f"{'metric':<50} {'baseline':>12} {'current':>12} {'change':>9}")
+    for name in sorted(old.keys() | new.keys()):
+        before, after = old.get(name), new.get(name)
+        if before is None or after is None:
+            change = "n/a"
+        elif before == 0:
+            change = "0.0%" if after == 0 else "new"
+        else:
+            change = f"{(after - before) / before * 100:+.1f}%"
+        print(f"{name:<50} {str(before):>12} {str(after):>12} {change:>9}")
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Offline benchmark suite")
+    parser.add_argument("--output", help="Write the JSON report to this file")
+    parser.add_argument("--compare", help="Earlier report to compare against")
+    parser.add_argument(
+        "--scenarios",
+        default=",".join(SCENARIOS),
+        help=f"Comma-separated scenarios to run (default: all of {SCENARIOS})",
+    )
+    parser.add_argument("--requests", type=int, default=100)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument(
+        "--sizes",
+        default="1,4,16",
+        help="Chart scale factors (times each section is repeated)",
+    )
+    parser.add_argument(
+        "--charts",
+        choices=["samples", "corpus"],
+        default="samples",
+        help="Charts for the LLM scenarios: scaled sample charts, or records "
+        "from the synthetic corpus generator (seeded with --seed)",
+    )
+    parser.add_argument(
+        "--backend",
+        choices=["server", "mock"],
+        default="server",
+        help="LLM backend for the generation scenarios: the mock HTTP server, "
+        "or the in-process mock backend (no HTTP; --latency and "
+        "--completion-tokens apply)",
+    )
+    parser.add_argument("--iterations", type=int, default=200)
+    parser.add_argument("--latency", type=float, default=0.05)
+    parser.add_argument("--tokens-per-second", type=float, default=0)
+    parser.add_argument("--prefill-tokens-per-second", type=float, default=0)
+    parser.add_argument("--completion-tokens", type=int, default=200)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0)
+    parser.add_argument("--seed", type=int, default=0)
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    logger.remove()
+    logger.add(sys.stderr, level="WARNING")
+
+    scenarios = [s.strip() for s in args.scenarios.split(",") if s.strip()]
+    unknown = set(scenarios) - set(SCENARIOS)
+    if unknown:
+        print(f"Error: unknown scenarios {sorted(unknown)}")
+        sys.exit(1)
+    sizes = tuple(int(size) for size in args.sizes.split(","))
+
+    server = MockLLMServer(
+        latency=args.latency,
+        tokens_per_second=args.tokens_per_second,
+        prefill_tokens_per_second=args.prefill_tokens_per_second,
+        completion_tokens=args.completion_tokens,
+        error_rate=args.error_rate,
+        rate_limit_rate=args.rate_limit_rate,
+        seed=args.seed,
+    )
+    with server:
+        generator = DischargeSummaryGenerator(
+            api_key="benchmark",
+            base_url=server.base_url,
+            backend=(
+                MockBackend(
+                    latency=args.latency, completion_tokens=args.completion_tokens
+                )
+                if args.backend == "mock"
+                else "openai"
+            ),
+            # No client-side rate limiting; keep retries fast
+            scheduler=RequestScheduler(
+                requests_per_minute=0,
+                tokens_per_minute=0,
+                base_delay=0.01,
+                max_delay=0.1,
+            ),
+        )
+        if args.charts == "corpus":
+            charts = list(iter_corpus(args.requests, seed=args.seed))
+        else:
+            charts = make_charts(args.requests, sizes=sizes)
+        results = {}
+        for name in scenarios:
+            print(f"Running {name}...", file=sys.stderr)
+            if name == "prompt_build":
+                results[name] = bench_prompt_build(generator, sizes, args.iterations)
+                continue
+            bench = BENCHMARKS[name]
+            results[name] = bench(generator, charts, args.concurrency)
+            results[name]["peak_memory_mb"] = _peak_memory_mb(
+                bench, generator, charts[:MEMORY_SAMPLE], args.concurrency
+            )
+
+    report = {
+        "meta": {
+            "commit": _git_commit(),
+            "created": datetime.now().isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "model": generator.model,
+            "params": {
+                key: value
+                for key, value in vars(args).items()
+                if key not in ("output", "compare")
+            },
+        },
+        "results": results,
+        "mock_server": dict(server.counts),
+    }
+    text = json.dumps(report, indent=2, sort_keys=True)
+    if args.output:
+        Path(args.output).write_text(text + "\n")
+        print(f"Report written to {args.output}", file=sys.stderr)
+    if args.compare:
+        with open(args.compare) as f:
+            compare_reports(json.load(f), report)
+    elif not args.output:
+        print(text)
+
+
+if __name__ == "__main__":
+    main()
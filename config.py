@@ -19,6 +19,113 @@ LLM_MODEL = os.getenv("LLM_MODEL", "gpt-4")
 LLM_TEMPERATURE = float(os.getenv("LLM_TEMPERATURE", "0.2"))
 MAX_TOKENS = int(os.getenv("MAX_TOKENS", "4000"))
 
+# LLM backends (see llm/backends.py): the default backend, extra named backends
+# as a JSON object, per-template backends as a JSON object (e.g.
+# {"emergency": "local"}) and comma-separated backends to fail over to
+LLM_BACKEND = os.getenv("LLM_BACKEND", "openai")
+LLM_BACKENDS = os.getenv("LLM_BACKENDS", "")
+TEMPLATE_BACKENDS = os.getenv("TEMPLATE_BACKENDS", "")
+LLM_FALLBACK_BACKENDS = os.getenv("LLM_FALLBACK_BACKENDS", "")
+
+# Context window sizes (prompt + completion tokens) by model name prefix
+MODEL_CONTEXT_WINDOWS = {
+    "gpt-4": 8192,
+    "gpt-4-32k": 32768,
+    "gpt-4-turbo": 128000,
+    "gpt-4o": 128000,
+    "gpt-4.5-preview": 128000,
+    "gpt-3.5-turbo": 16385,
+}
+DEFAULT_CONTEXT_WINDOW = int(os.getenv("DEFAULT_CONTEXT_WINDOW", "8192"))
+# Smallest completion budget worth sending a request for
+MIN_COMPLETION_TOKENS = int(os.getenv("MIN_COMPLETION_TOKENS", "1000"))
+
+# Render patient data as compact tables trimmed to the model's token budget
+PROMPT_COMPACTION = os.getenv("PROMPT_COMPACTION", "true").lower() == "true"
+
+# Default generation strategy: "single" (one prompt), "map_reduce" (chart
+# sections drafted concurrently, then merged into the letter) or "incremental"
+# (map_reduce, redrafting only sections changed since the last summary)
+SUMMARY_STRATEGY = os.getenv("SUMMARY_STRATEGY", "single").lower()
+MAP_REDUCE_CONCURRENCY = int(os.getenv("MAP_REDUCE_CONCURRENCY", "4"))
+MAP_REDUCE_SECTION_MAX_TOKENS = int(os.getenv("MAP_REDUCE_SECTION_MAX_TOKENS", "800"))
+
+# Section drafts reused by the "incremental" strategy (in memory, plus a
+# SQLite file so drafts survive between runs; empty keeps them in memory only)
+SECTION_CACHE_MAX_ENTRIES = int(os.getenv("SECTION_CACHE_MAX_ENTRIES", "4096"))
+SECTION_CACHE_TTL = float(os.getenv("SECTION_CACHE_TTL", str(7 * 24 * 60 * 60)))
+SECTION_CACHE_PATH = os.getenv("SECTION_CACHE_PATH", str(DATA_DIR / "sections.db"))
+
+# Persistent, versioned store of generated summaries (SQLite)
+SUMMARY_STORE_ENABLED = os.getenv("SUMMARY_STORE_ENABLED", "true").lower() == "true"
+SUMMARY_STORE_PATH = Path(
+    os.getenv("SUMMARY_STORE_PATH", str(DATA_DIR / "summaries.db"))
+)
+
+# Template routing rules (JSON); empty uses the bundled llm/routing_rules.json.
+# The file is reloaded when it changes.
+ROUTING_RULES_PATH = os.getenv("ROUTING_RULES_PATH", "")
+
+# Batch generation settings
+BATCH_CONCURRENCY = int(os.getenv("BATCH_CONCURRENCY", "4"))
+ASYNC_CONCURRENCY = int(os.getenv("ASYNC_CONCURRENCY", "16"))
+
+# Durable job queue for large batches (app.py --mode enqueue/work/queue-status)
+JOB_QUEUE_PATH = Path(os.getenv("JOB_QUEUE_PATH", str(DATA_DIR / "jobs.db")))
+JOB_QUEUE_WORKERS = int(os.getenv("JOB_QUEUE_WORKERS", "4"))
+# Seconds a leased job stays hidden from other workers unless extended
+JOB_VISIBILITY_TIMEOUT = float(os.getenv("JOB_VISIBILITY_TIMEOUT", "300"))
+# Attempts before a job is dead-lettered, and the first retry delay (doubled
+# on each further attempt)
+JOB_MAX_ATTEMPTS = int(os.getenv("JOB_MAX_ATTEMPTS", "3"))
+JOB_RETRY_DELAY = float(os.getenv("JOB_RETRY_DELAY", "30"))
+
+# OpenAI Batch API submissions for non-urgent summaries (app.py --mode
+# batch-submit/batch-status/batch-collect): request files and manifests are
+# kept in BATCH_API_DIR; larger submissions are split into several batches
+BATCH_API_DIR = Path(os.getenv("BATCH_API_DIR", str(DATA_DIR / "batches")))
+BATCH_API_COMPLETION_WINDOW = os.getenv("BATCH_API_COMPLETION_WINDOW", "24h")
+BATCH_API_POLL_INTERVAL = float(os.getenv("BATCH_API_POLL_INTERVAL", "60"))
+BATCH_API_MAX_REQUESTS = int(os.getenv("BATCH_API_MAX_REQUESTS", "50000"))
+BATCH_API_MAX_BYTES = int(os.getenv("BATCH_API_MAX_BYTES", str(200 * 1024 * 1024)))
+
+# Latency-based model routing for the "auto" model/backend (llm/model_router.py):
+# candidate backends or OpenAI models in order of preference, p95 latency SLOs
+# in seconds per template (JSON) and the rolling window they are judged on
+MODEL_ROUTER_CANDIDATES = os.getenv(
+    "MODEL_ROUTER_CANDIDATES", "gpt-4,gpt-4.5-preview,gpt-3.5-turbo"
+)
+TEMPLATE_LATENCY_SLOS = os.getenv("TEMPLATE_LATENCY_SLOS", '{"emergency": 20}')
+MODEL_ROUTER_DEFAULT_SLO = float(os.getenv("MODEL_ROUTER_DEFAULT_SLO", "60"))
+MODEL_ROUTER_WINDOW = int(os.getenv("MODEL_ROUTER_WINDOW", "200"))
+MODEL_ROUTER_MIN_SAMPLES = int(os.getenv("MODEL_ROUTER_MIN_SAMPLES", "5"))
+MODEL_ROUTER_MAX_ERROR_RATE = float(os.getenv("MODEL_ROUTER_MAX_ERROR_RATE", "0.2"))
+# Hedge routed streams with a second candidate when the first token is later
+# than the chosen backend's p95 (or MODEL_ROUTER_HEDGE_DELAY seconds, before
+# there are enough samples)
+MODEL_ROUTER_HEDGE = os.getenv("MODEL_ROUTER_HEDGE", "true").lower() == "true"
+MODEL_ROUTER_HEDGE_DELAY = float(os.getenv("MODEL_ROUTER_HEDGE_DELAY", "5"))
+
+# HTTP generation service (app.py --mode serve)
+SERVICE_HOST = os.getenv("SERVICE_HOST", "127.0.0.1")
+SERVICE_PORT = int(os.getenv("SERVICE_PORT", "8080"))
+SERVICE_WORKERS = int(os.getenv("SERVICE_WORKERS", "4"))
+# Jobs waiting for a worker before new requests get 429 Too Many Requests
+SERVICE_QUEUE_SIZE = int(os.getenv("SERVICE_QUEUE_SIZE", "64"))
+# Seconds /v1/summaries waits before answering with a job to poll instead
+SERVICE_SYNC_TIMEOUT = float(os.getenv("SERVICE_SYNC_TIMEOUT", "120"))
+SERVICE_MAX_JOBS = int(os.getenv("SERVICE_MAX_JOBS", "1000"))
+SERVICE_MAX_BODY_BYTES = int(os.getenv("SERVICE_MAX_BODY_BYTES", str(32 * 1024 * 1024)))
+
+# Summary cache settings (SUMMARY_CACHE_PATH enables the on-disk tier)
+SUMMARY_CACHE_ENABLED = os.getenv("SUMMARY_CACHE_ENABLED", "true").lower() == "true"
+SUMMARY_CACHE_MAX_ENTRIES = int(os.getenv("SUMMARY_CACHE_MAX_ENTRIES", "256"))
+SUMMARY_CACHE_MAX_BYTES = int(
+    os.getenv("SUMMARY_CACHE_MAX_BYTES", str(16 * 1024 * 1024))
+)
+SUMMARY_CACHE_TTL = float(os.getenv("SUMMARY_CACHE_TTL", str(24 * 60 * 60)))
+SUMMARY_CACHE_PATH = os.getenv("SUMMARY_CACHE_PATH", "")
+
 # API keys - set in .env file or use credentials.json as fallback
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY", "")
 
@@ -34,6 +141,25 @@ if not OPENAI_API_KEY:
 if not OPENAI_API_KEY:
     print("Warning: No API key found. Set OPENAI_API_KEY in .env or credentials.json")
 
+# Optional OpenAI-compatible API endpoint (empty for the OpenAI default)
+OPENAI_BASE_URL = os.getenv("OPENAI_BASE_URL", "")
+
+# HTTP connection pool settings for the shared OpenAI clients
+HTTP_MAX_CONNECTIONS = int(os.getenv("HTTP_MAX_CONNECTIONS", "100"))
+HTTP_MAX_KEEPALIVE_CONNECTIONS = int(os.getenv("HTTP_MAX_KEEPALIVE_CONNECTIONS", "20"))
+HTTP_KEEPALIVE_EXPIRY = float(os.getenv("HTTP_KEEPALIVE_EXPIRY", "120"))
+HTTP_TIMEOUT = float(os.getenv("HTTP_TIMEOUT", "600"))
+HTTP_CONNECT_TIMEOUT = float(os.getenv("HTTP_CONNECT_TIMEOUT", "10"))
+
+# Request scheduling: shared rate limits (0 disables), retries and circuit breaker
+RATE_LIMIT_RPM = int(os.getenv("RATE_LIMIT_RPM", "500"))
+RATE_LIMIT_TPM = int(os.getenv("RATE_LIMIT_TPM", "300000"))
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "5"))
+RETRY_BASE_DELAY = float(os.getenv("RETRY_BASE_DELAY", "1.0"))
+RETRY_MAX_DELAY = float(os.getenv("RETRY_MAX_DELAY", "60"))
+CIRCUIT_FAILURE_THRESHOLD = int(os.getenv("CIRCUIT_FAILURE_THRESHOLD", "5"))
+CIRCUIT_RESET_TIMEOUT = float(os.getenv("CIRCUIT_RESET_TIMEOUT", "30"))
+
 # UI settings
 UI_TITLE = "Medical Discharge Summary Generator"
 UI_DESCRIPTION = "Generate professional discharge summaries from patient data"
@@ -42,3 +168,16 @@ UI_DESCRIPTION = "Generate professional discharge summaries from patient data"
 LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO")
 LOG_FORMAT = "{time:YYYY-MM-DD HH:mm:ss} | {level} | {message}"
 LOG_RETENTION = "7 days"
+
+# Structured audit log (JSON lines, one record per generation call)
+AUDIT_LOG_ENABLED = os.getenv("AUDIT_LOG_ENABLED", "true").lower() == "true"
+AUDIT_LOG_DIR = Path(os.getenv("AUDIT_LOG_DIR", str(LOGS_DIR / "audit")))
+AUDIT_QUEUE_SIZE = int(os.getenv("AUDIT_QUEUE_SIZE", "10000"))
+
+# Pipeline instrumentation: stage metrics, optional metrics file and profiler
+INSTRUMENTATION_ENABLED = (
+    os.getenv("INSTRUMENTATION_ENABLED", "false").lower() == "true"
+)
+METRICS_FILE = os.getenv("METRICS_FILE", "")
+PROFILER = os.getenv("PROFILER", "").lower()  # "cprofile" or "pyinstrument"
+PROFILE_DIR = Path(os.getenv("PROFILE_DIR", str(LOGS_DIR / "profiles")))
@@ -0,0 +1,254 @@
+"""
+Structured audit log for summary generation.
+
+Every generation call appends one JSON record to a daily
+``audit_YYYYMMDD.jsonl`` file. Records are queued and written by a
+background thread so logging never blocks generation, and can be queried
+for latency percentiles and throughput per model and template.
+"""
+
+import atexit
+import json
+import queue
+import threading
+import time
+from datetime import datetime, timedelta
+from pathlib import Path
+
+import numpy as np
+from loguru import logger
+
+from config import AUDIT_LOG_ENABLED, AUDIT_LOG_DIR, AUDIT_QUEUE_SIZE
+
+AUDIT_FIELDS = [
+    "timestamp",
+    "ts",
+    "patient_id",
+    "template",
+    "strategy",
+    "backend",
+    "model",
+    "prompt_tokens",
+    "completion_tokens",
+    "cached_tokens",
+    "sections_reused",
+    "latency_ms",
+    "cache_hit",
+    "retries",
+    "error",
+]
+
+
+class AuditLog:
+    """
+    Append-only JSON-lines audit sink with a background writer.
+    """
+
+    def __init__(self, log_dir=AUDIT_LOG_DIR, queue_size=AUDIT_QUEUE_SIZE):
+        """
+        Initialize the audit log and start its writer thread.
+
+        Args:
+            log_dir (str): Directory for the daily JSONL files
+            queue_size (int): Maximum records waiting to be written
+        """
+        self.log_dir = Path(log_dir)
+        self.log_dir.mkdir(parents=True, exist_ok=True)
+        self._queue = queue.Queue(maxsize=queue_size)
+        self.dropped = 0
+        self._writer = threading.Thread(
+            target=self._write_loop, name="audit-log-writer", daemon=True
+        )
+        self._writer.start()
+
+    def _path_for(self, day):
+        return self.log_dir / f"audit_{day.strftime('%Y%m%d')}.jsonl"
+
+    def record(self, **fields):
+        """
+        Queue an audit record without blocking.
+
+        Args:
+            **fields: Values for AUDIT_FIELDS; timestamp and ts are filled in
+
+        Returns:
+            dict: The queued record
+        """
+        now = time.time()
+        entry = {field: fields.get(field) for field in AUDIT_FIELDS}
+        entry["timestamp"] = datetime.fromtimestamp(now).isoformat()
+        entry["ts"] = now
+        try:
+            self._queue.put_nowait(entry)
+        except queue.Full:
+            self.dropped += 1
+            logger.warning("Audit log queue full; dropping record")
+        return entry
+
+    def _write_loop(self):
+        while True:
+            entries = [self._queue.get()]
+            # Drain whatever else is waiting so a burst is one write
+            while True:
+                try:
+                    entries.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            try:
+                by_path = {}
+                for entry in entries:
+                    day = datetime.fromtimestamp(entry["ts"])
+                    by_path.setdefault(self._path_for(day), []).append(entry)
+                for path, path_entries in by_path.items():
+                    with open(path, "a") as f:
+                        f.writelines(json.dumps(e) + "\n" for e in path_entries)
+            except Exception as e:
+                logger.error(f"Error writing audit log: {e}")
+            finally:
+                for _ in entries:
+                    self._queue.task_done()
+
+    def flush(self):
+        """Block until all queued records have been written."""
+        self._queue.join()
+
+    def query(self, since=None, until=None):
+        """
+        Read audit records in a time window.
+
+        Args:
+            since (float, optional): Earliest epoch timestamp (inclusive)
+            until (float, optional): Latest epoch timestamp (exclusive)
+
+        Returns:
+            list: Audit record dicts in file order
+        """
+        if since is not None:
+            first_day = datetime.fromtimestamp(since).date()
+        else:
+            first_day = None
+        last_day = datetime.fromtimestamp(until).date() if until is not None else None
+
+        records = []
+        for path in sorted(self.log_dir.glob("audit_*.jsonl")):
+            day = datetime.strptime(path.stem.split("_", 1)[1], "%Y%m%d").date()
+            if (first_day and day < first_day) or (last_day and day > last_day):
+                continue
+            with open(path) as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except json.JSONDecodeError:
+                        continue
+                    if since is not None and entry["ts"] < since:
+                        continue
+                    if until is not None and entry["ts"] >= until:
+                        continue
+                    records.append(entry)
+        return records
+
+    def latency_stats(self, since=None, until=None, group_by=("model", "template")):
+        """
+        Summarize latency and throughput over a time window.
+
+        Args:
+            since (float, optional): Earliest epoch timestamp (inclusive)
+            until (float, optional): Latest epoch timestamp (exclusive)
+            group_by (tuple): Record fields to group by
+
+        Returns:
+            list: One dict per group with count, errors, cache_hit_rate,
+                  p50_ms and p95_ms (of successful uncached calls),
+                  throughput_per_min, mean token counts and
+                  cached_token_rate (share of prompt tokens served from the
+                  provider's prompt cache, where it reports one)
+        """
+        records = self.query(since, until)
+        if not records:
+            return []
+        window_start = since if since is not None else min(r["ts"] for r in records)
+        window_end = until if until is not None else max(r["ts"] for r in records)
+        window_minutes = max((window_end - window_start) / 60.0, 1 / 60.0)
+
+        groups = {}
+        for entry in records:
+            key = tuple(entry.get(field) for field in group_by)
+            groups.setdefault(key, []).append(entry)
+
+        results = []
+        for key, entries in sorted(groups.items(), key=lambda g: str(g[0])):
+            # Cache hits and failures would skew the generation latency
+            latencies = np.array(
+                [
+                    e["latency_ms"]
+                    for e in entries
+                    if e.get("latency_ms") is not None
+                    and not e.get("cache_hit")
+                    and not e.get("error")
+                ]
+            )
+            prompt_tokens = [e["prompt_tokens"] for e in entries if e["prompt_tokens"]]
+            completion_tokens = [
+                e["completion_tokens"] for e in entries if e["completion_tokens"]
+            ]
+            # Older records predate cached_tokens; providers may not report it
+            cache_reported = [e for e in entries if e.get("cached_tokens") is not None]
+            reported_prompt_tokens = sum(
+                e["prompt_tokens"] or 0 for e in cache_reported
+            )
+            row = dict(zip(group_by, key))
+            row.update(
+                {
+                    "count": len(entries),
+                    "errors": sum(1 for e in entries if e.get("error")),
+                    "cache_hit_rate": sum(1 for e in entries if e.get("cache_hit"))
+                    / len(entries),
+                    "p50_ms": (
+                        float(np.percentile(latencies, 50)) if latencies.size else None
+                    ),
+                    "p95_ms": (
+                        float(np.percentile(latencies, 95)) if latencies.size else None
+                    ),
+                    "throughput_per_min": len(entries) / window_minutes,
+                    "mean_prompt_tokens": (
+                        float(np.mean(prompt_tokens)) if prompt_tokens else None
+                    ),
+                    "mean_completion_tokens": (
+                        float(np.mean(completion_tokens)) if completion_tokens else None
+                    ),
+                    "cached_token_rate": (
+                        sum(e["cached_tokens"] for e in cache_reported)
+                        / reported_prompt_tokens
+                        if reported_prompt_tokens
+                        else None
+                    ),
+                }
+            )
+            results.append(row)
+        return results
+
+    def recent_stats(self, hours=24, group_by=("model", "template")):
+        """Latency and throughput stats for the last ``hours`` hours."""
+        now = time.time()
+        return self.latency_stats(
+            since=now - timedelta(hours=hours).total_seconds(),
+            until=now,
+            group_by=group_by,
+        )
+
+
+_default_audit_log = None
+_default_audit_log_lock = threading.Lock()
+
+
+def get_default_audit_log():
+    """Return the process-wide audit log, or None if auditing is disabled."""
+    global _default_audit_log
+    if not AUDIT_LOG_ENABLED:
+        return None
+    with _default_audit_log_lock:
+        if _default_audit_log is None:
+            _default_audit_log = AuditLog()
+            # Don't lose queued records when a CLI run exits
+            atexit.register(_default_audit_log.flush)
+        return _default_audit_log
@@ -0,0 +1,402 @@
+"""
+LLM backends.
+
+A backend pairs a model with the client that serves it. Every backend
+exposes an OpenAI-style chat completions client, so the generator's request
+path is the same whichever one it talks to:
+
+    openai      The OpenAI API (OPENAI_API_KEY, OPENAI_BASE_URL, LLM_MODEL)
+    compatible  Any OpenAI-compatible server, e.g. vLLM or the llama.cpp
+                server, by its base_url
+    mock        An in-process deterministic model, for offline tests and
+                benchmarks. Answers are derived from a hash of the prompt.
+
+The ``openai`` and ``mock`` backends are always defined. More are added with
+LLM_BACKENDS, a JSON object of named backend specs:
+
+    {"local": {"type": "compatible", "base_url": "http://gpu-1:8000/v1",
+               "model": "llama-3.1-8b-instruct", "timeout": 30,
+               "max_retries": 1}}
+
+Spec keys are ``type``, ``model``, ``base_url``, ``api_key``, ``timeout``
+(seconds per request) and, for the backend's own scheduler,
+``requests_per_minute``, ``tokens_per_minute`` and ``max_retries``; mock
+backends also take ``latency`` and ``completion_tokens``. LLM_BACKEND picks
+the default backend, TEMPLATE_BACKENDS routes templates to backends, and
+LLM_FALLBACK_BACKENDS lists the backends to fail over to, in order.
+"""
+
+import asyncio
+import hashlib
+import json
+import threading
+import time
+import uuid
+from abc import ABC, abstractmethod
+from types import SimpleNamespace
+
+from loguru import logger
+from openai.types.chat import ChatCompletion, ChatCompletionChunk
+
+from config import (
+    LLM_BACKENDS,
+    LLM_FALLBACK_BACKENDS,
+    LLM_MODEL,
+    OPENAI_API_KEY,
+    OPENAI_BASE_URL,
+    TEMPLATE_BACKENDS,
+)
+from . import clients
+from . import tokens
+from .scheduler import RequestScheduler, get_default_scheduler
+
+
+class UnknownBackendError(ValueError):
+    """Raised when a backend name or spec cannot be resolved."""
+
+
+class Backend(ABC):
+    """
+    A model served by an OpenAI-style chat completions client. Subclasses
+    provide the clients.
+    """
+
+    kind = None
+
+    def __init__(self, name, model, timeout=None, scheduler=None):
+        """
+        Args:
+            name (str): Backend name
+            model (str): Model name sent with each request
+            timeout (float, optional): Per-request timeout in seconds
+            scheduler (RequestScheduler, optional): Rate limiting, retries and
+                                                    circuit breaker for this
+                                                    backend. Defaults to the
+                                                    process-wide scheduler.
+        """
+        self.name = name
+        self.model = model
+        self.timeout = timeout
+        self.scheduler = scheduler or get_default_scheduler()
+
+    @property
+    @abstractmethod
+    def client(self):
+        """The synchronous chat client."""
+
+    @property
+    @abstractmethod
+    def async_client(self):
+        """The async chat client for the running event loop."""
+
+    def __repr__(self):
+        return f"{type(self).__name__}({self.name!r}, model={self.model!r})"
+
+
+class OpenAIBackend(Backend):
+    """
+    The OpenAI API or an OpenAI-compatible server, through the pooled clients.
+    """
+
+    kind = "openai"
+
+    def __init__(
+        self,
+        name,
+        model,
+        api_key=OPENAI_API_KEY,
+        base_url=OPENAI_BASE_URL,
+        timeout=None,
+        scheduler=None,
+    ):
+        super().__init__(name, model, timeout, scheduler)
+        self.api_key = api_key
+        self.base_url = base_url
+
+    @property
+    def client(self):
+        return clients.get_client(self.api_key, self.base_url)
+
+    @property
+    def async_client(self):
+        return clients.get_async_client(self.api_key, self.base_url)
+
+
+class _MockRawResponse:
+    """Stands in for the SDK's raw response: no headers, a parsed body."""
+
+    headers = {}
+
+    def __init__(self, parsed):
+        self._parsed = parsed
+
+    def parse(self):
+        return self._parsed
+
+
+class _MockStream:
+    """Iterable over the chunks of a mock completion, like the SDK's Stream."""
+
+    def __init__(self, chunks):
+        self._chunks = chunks
+
+    def __iter__(self):
+        return iter(self._chunks)
+
+    def __aiter__(self):
+        return self._aiter()
+
+    async def _aiter(self):
+        for chunk in self._chunks:
+            yield chunk
+
+    def close(self):
+        self._chunks = []
+
+    async def aclose(self):
+        self.close()
+
+
+class _MockCompletions:
+    """``chat.completions`` of a mock client."""
+
+    def __init__(self, backend, is_async, raw=False):
+        self._backend = backend
+        self._is_async = is_async
+        self._raw = raw
+
+    @property
+    def with_raw_response(self):
+        return _MockCompletions(self._backend, self._is_async, raw=True)
+
+    def create(self, **params):
+        if self._is_async:
+            return self._acreate(params)
+        time.sleep(self._backend.latency)
+        return self._respond(params)
+
+    async def _acreate(self, params):
+        await asyncio.sleep(self._backend.latency)
+        return self._respond(params)
+
+    def _respond(self, params):
+        result = self._backend.complete(params)
+        return _MockRawResponse(result) if self._raw else result
+
+
+class _MockClient:
+    """OpenAI-style client answered by a MockBackend."""
+
+    def __init__(self, backend, is_async=False):
+        self.chat = SimpleNamespace(completions=_MockCompletions(backend, is_async))
+
+
+class MockBackend(Backend):
+    """
+    In-process deterministic model: the same prompt always gets the same
+    answer, with no network calls.
+    """
+
+    kind = "mock"
+
+    def __init__(
+        self, name="mock", model="mock", latency=0.0, completion_tokens=200, **kwargs
+    ):
+        """
+        Args:
+            latency (float): Seconds each request takes
+            completion_tokens (int): Words in each answer (capped by max_tokens)
+        """
+        kwargs.setdefault(
+            "scheduler", RequestScheduler(requests_per_minute=0, tokens_per_minute=0)
+        )
+        super().__init__(name, model, **kwargs)
+        self.latency = float(latency)
+        self.completion_tokens = int(completion_tokens)
+        self._client = _MockClient(self)
+        self._async_client = _MockClient(self, is_async=True)
+
+    @property
+    def client(self):
+        return self._client
+
+    @property
+    def async_client(self):
+        return self._async_client
+
+    def text(self, messages, max_tokens=None):
+        """The deterministic answer to a list of chat messages."""
+        digest = hashlib.sha256(
+            json.dumps(messages, sort_keys=True).encode("utf-8")
+        ).hexdigest()
+        words = self.completion_tokens
+        if max_tokens:
+            words = max(1, min(words, int(max_tokens) - 8))
+        body = " ".join(f"word{i}" for i in range(words))
+        return f"DISCHARGE SUMMARY ({self.name} {digest[:12]})\n\n{body}"
+
+    def complete(self, params):
+        """Answer chat completion parameters with a completion or chunk stream."""
+        messages = params.get("messages", [])
+        text = self.text(messages, params.get("max_tokens"))
+        usage = {
+            "prompt_tokens": tokens.count_message_tokens(messages, self.model),
+            "completion_tokens": tokens.count_tokens(text, self.model),
+        }
+        usage["total_tokens"] = usage["prompt_tokens"] + usage["completion_tokens"]
+        response_id = f"mock-{uuid.uuid4().hex[:12]}"
+        base = {
+            "id": response_id,
+            "created": int(time.time()),
+            "model": params.get("model", self.model),
+        }
+        if not params.get("stream"):
+            return ChatCompletion.model_validate(
+                {
+                    **base,
+                    "object": "chat.completion",
+                    "choices": [
+                        {
+                            "index": 0,
+                            "message": {"role": "assistant", "content": text},
+                            "finish_reason": "stop",
+                        }
+                    ],
+                    "usage": usage,
+                }
+            )
+
+        pieces = text.split(" ")
+        chunks = [
+            ChatCompletionChunk.model_validate(
+                {
+                    **base,
+                    "object": "chat.completion.chunk",
+                    "choices": [
+                        {
+                            "index": 0,
+                            "delta": {"content": piece if i == 0 else f" {piece}"},
+                            "finish_reason": "stop" if i == len(pieces) - 1 else None,
+                        }
+                    ],
+                }
+            )
+            for i, piece in enumerate(pieces)
+        ]
+        stream_options = params.get("stream_options") or (
+            params.get("extra_body") or {}
+        ).get("stream_options", {})
+        if stream_options.get("include_usage"):
+            chunks.append(
+                ChatCompletionChunk.model_validate(
+                    {
+                        **base,
+                        "object": "chat.completion.chunk",
+                        "choices": [],
+                        "usage": usage,
+                    }
+                )
+            )
+        return _MockStream(chunks)
+
+
+BACKEND_TYPES = {
+    "openai": OpenAIBackend,
+    "compatible": OpenAIBackend,
+    "mock": MockBackend,
+}
+
+
+def backend_specs():
+    """
+    Return the configured backend specs by name: the built-in ``openai`` and
+    ``mock`` backends plus those in LLM_BACKENDS.
+
+    Raises:
+        UnknownBackendError: If LLM_BACKENDS is not a JSON object
+    """
+    specs = {
+        "openai": {"type": "openai", "model": LLM_MODEL},
+        "mock": {"type": "mock", "model": "mock"},
+    }
+    specs.update(_load_json_object("LLM_BACKENDS", LLM_BACKENDS))
+    return specs
+
+
+def create_backend(name, spec):
+    """
+    Build a backend from a spec (see the module docstring).
+
+    Raises:
+        UnknownBackendError: If the spec's type is unknown
+    """
+    spec = dict(spec)
+    kind = spec.pop("type", "compatible")
+    if kind not in BACKEND_TYPES:
+        raise UnknownBackendError(
+            f"Backend {name!r} has unknown type {kind!r}; "
+            f"expected one of {sorted(BACKEND_TYPES)}"
+        )
+    scheduler_options = {
+        key: spec.pop(key)
+        for key in ("requests_per_minute", "tokens_per_minute", "max_retries")
+        if key in spec
+    }
+    if scheduler_options:
+        spec["scheduler"] = RequestScheduler(**scheduler_options)
+    spec.setdefault("model", LLM_MODEL)
+    if kind == "compatible":
+        # Local servers usually ignore the key, but the SDK requires one
+        spec.setdefault("api_key", "none")
+    return BACKEND_TYPES[kind](name, **spec)
+
+
+_backends = {}
+_backends_lock = threading.Lock()
+
+
+def get_backend(name):
+    """
+    Return the shared backend with a configured name.
+
+    Raises:
+        UnknownBackendError: If no backend has that name
+    """
+    with _backends_lock:
+        backend = _backends.get(name)
+        if backend is None:
+            specs = backend_specs()
+            if name not in specs:
+                raise UnknownBackendError(
+                    f"Unknown LLM backend {name!r}; configured: {sorted(specs)}"
+                )
+            backend = create_backend(name, specs[name])
+            _backends[name] = backend
+            logger.debug(f"Created LLM backend {backend!r}")
+        return backend
+
+
+def resolve(backend):
+    """Return a Backend for a backend or backend name."""
+    return backend if isinstance(backend, Backend) else get_backend(backend)
+
+
+def fallbacks(primary):
+    """The configured fallback backends for a primary backend, in order."""
+    names = [name.strip() for name in LLM_FALLBACK_BACKENDS.split(",")]
+    return [get_backend(name) for name in names if name and name != primary.name]
+
+
+def _load_json_object(name, text):
+    try:
+        value = json.loads(text or "{}")
+    except json.JSONDecodeError as e:
+        raise UnknownBackendError(f"{name} is not valid JSON: {e}") from e
+    if not isinstance(value, dict):
+        raise UnknownBackendError(f"{name} must be a JSON object")
+    return value
+
+
+def template_backend(template_name):
+    """The backend name TEMPLATE_BACKENDS assigns a template, or None."""
+    return _load_json_object("TEMPLATE_BACKENDS", TEMPLATE_BACKENDS).get(template_name)
@@ -0,0 +1,170 @@
+"""
+Concurrent batch generation of discharge summaries.
+"""
+
+import json
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from pathlib import Path
+from loguru import logger
+
+from . import utils
+from .records import PatientRecord
+
+
+def _record_id(patient_data, source):
+    """Return the patient ID for a record, falling back to its source label."""
+    if isinstance(patient_data, PatientRecord):
+        return patient_data.patient_id
+    return re.sub(r"[^A-Za-z0-9]+", "_", Path(source).name).strip("_")
+
+
+def _output_name(patient_id, used):
+    """
+    Return the summary file name for a record: ``<patient_id>.txt``, or
+    ``<patient_id>_2.txt`` and so on for later records of the same patient,
+    so that they do not overwrite each other. Names depend only on the
+    records' order, so a resumed run maps each record to the same file.
+    """
+    name = utils.safe_filename(patient_id)
+    copy = 1
+    while name in used:
+        copy += 1
+        name = utils.safe_filename(f"{patient_id}_{copy}")
+    if copy > 1:
+        logger.warning(f"Patient {patient_id} appears more than once; writing {name}")
+    used.add(name)
+    return name
+
+
+def run_batch(
+    generator,
+    source,
+    output_dir,
+    template_type=None,
+    concurrency=4,
+    resume=False,
+    strategy=None,
+):
+    """
+    Generate discharge summaries for many patient records concurrently.
+
+    Records are read lazily from ``source`` and submitted to a pool of
+    ``concurrency`` workers, with at most ``2 * concurrency`` records held in
+    memory at once. Each summary is written to ``<output_dir>/<patient_id>.txt``
+    (numbered for further records of the same patient, see _output_name) and
+    a ``manifest.json`` describing every record is written at the end.
+
+    Args:
+        generator (DischargeSummaryGenerator): Shared generator instance
+        source (str): Directory, glob pattern, or JSON/JSONL file path
+        output_dir (str): Directory for summaries and the manifest
+        template_type (str, optional): Template type to use for every record
+        concurrency (int): Maximum number of in-flight generation calls
+        resume (bool): Skip patients whose output file already exists
+        strategy (str, optional): Generation strategy (see
+                                  DischargeSummaryGenerator.STRATEGIES)
+
+    Returns:
+        dict: The manifest written to ``manifest.json``
+    """
+    output_dir = Path(output_dir)
+    output_dir.mkdir(parents=True, exist_ok=True)
+    concurrency = max(1, int(concurrency))
+
+    entries = []
+    used_names = set()
+    entries_lock = threading.Lock()
+    in_flight = threading.BoundedSemaphore(concurrency * 2)
+    started_at = time.time()
+
+    def record_entry(entry):
+        with entries_lock:
+            entries.append(entry)
+
+    def process(index, source_label, patient_data, patient_id, output_path):
+        start = time.perf_counter()
+        entry = {
+            "index": index,
+            "patient_id": patient_id,
+            "source": source_label,
+            "output": str(output_path),
+        }
+        try:
+            summary = generator.generate_summary(
+                patient_data, template_type, strategy=strategy
+            )
+            # Write then rename so an interrupted run never leaves a partial
+            # file behind for --resume to mistake as finished
+            utils.write_atomic(output_path, summary)
+            entry["status"] = "ok"
+        except Exception as e:
+            logger.error(f"Batch record {source_label} failed: {e}")
+            entry["status"] = "failed"
+            entry["error"] = f"{type(e).__name__}: {e}"
+        entry["elapsed_seconds"] = round(time.perf_counter() - start, 3)
+        record_entry(entry)
+
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        # Malformed charts are recorded as failed without an LLM call
+        records = utils.iter_patient_records(source, validate=True)
+        for index, (source_label, patient_data, error) in enumerate(records):
+            patient_id = _record_id(patient_data, source_label)
+            # Named for failed records too, so later records keep their names
+            output_path = output_dir / _output_name(patient_id, used_names)
+
+            if error:
+                record_entry(
+                    {
+                        "index": index,
+                        "patient_id": patient_id,
+                        "source": source_label,
+                        "status": "failed",
+                        "error": error,
+                    }
+                )
+                continue
+
+            if resume and output_path.exists():
+                record_entry(
+                    {
+                        "index": index,
+                        "patient_id": patient_id,
+                        "source": source_label,
+                        "output": str(output_path),
+                        "status": "skipped",
+                    }
+                )
+                continue
+
+            in_flight.acquire()
+            future = executor.submit(
+                process, index, source_label, patient_data, patient_id, output_path
+            )
+            future.add_done_callback(lambda _: in_flight.release())
+
+    counts = {"ok": 0, "failed": 0, "skipped": 0}
+    for entry in entries:
+        counts[entry["status"]] += 1
+
+    manifest = {
+        "source": str(source),
+        "template": template_type,
+        "strategy": strategy,
+        "started_at": datetime.fromtimestamp(started_at).isoformat(),
+        "elapsed_seconds": round(time.time() - started_at, 3),
+        "concurrency": concurrency,
+        "counts": counts,
+        "records": sorted(entries, key=lambda e: e["index"]),
+    }
+    with open(output_dir / "manifest.json", "w") as f:
+        json.dump(manifest, f, indent=2)
+
+    logger.info(
+        f"Batch complete: {counts['ok']} ok, {counts['failed']} failed, "
+        f"{counts['skipped']} skipped -> {output_dir}"
+    )
+    return manifest
@@ -0,0 +1,524 @@
+"""
+OpenAI Batch API submission for summaries that are not needed right away.
+
+Batch requests are billed at a discount and do not count against the
+interactive rate limits, but are only guaranteed to finish within the
+completion window (BATCH_API_COMPLETION_WINDOW, 24 hours). That suits
+next-day discharges and other overnight work.
+
+``submit_batches`` prepares each chart's request exactly as generate_summary
+would (template routing, compaction and token budget, with the single-prompt
+strategy), writes the requests to Batch API JSONL files in BATCH_API_DIR,
+uploads them and creates the batches. Charts whose summary is already cached
+or stored, or whose request is still waiting in an uncollected batch, are not
+submitted. A manifest saved for each batch maps every
+request's ``custom_id`` to its patient, template and input hash, so results
+can be collected later from another process.
+
+``collect_batch`` waits for a batch to finish and passes each result through
+the generator's usual finalization: sanitize_output, prompt/response logging,
+the summary cache and store, and the audit log. The latency recorded for a
+batched summary is the time from submission to collection.
+"""
+
+import json
+import time
+from datetime import datetime
+from pathlib import Path
+
+from loguru import logger
+from openai.types import CompletionUsage
+
+from config import (
+    BATCH_API_COMPLETION_WINDOW,
+    BATCH_API_DIR,
+    BATCH_API_MAX_BYTES,
+    BATCH_API_MAX_REQUESTS,
+    BATCH_API_POLL_INTERVAL,
+)
+from . import backends
+from . import utils
+from .instrumentation import new_timings
+
+BATCH_ENDPOINT = "/v1/chat/completions"
+
+# Batch statuses that no longer change
+TERMINAL_STATUSES = ("completed", "failed", "expired", "cancelled")
+
+
+class BatchRequestError(RuntimeError):
+    """A batch request that the provider answered with an error."""
+
+
+def _batch_backend(generator, name=None):
+    """
+    Return the backend batches go to: the named one or the generator's
+    default. It must be served by an API with the OpenAI Batch API.
+
+    Raises:
+        ValueError: If the backend has no Batch API
+    """
+    if name is None or name == generator.backend.name:
+        backend = generator.backend
+    else:
+        backend = backends.resolve(name)
+    if not isinstance(backend, backends.OpenAIBackend):
+        raise ValueError(f"LLM backend {backend.name!r} has no Batch API")
+    return backend
+
+
+def _api(generator, backend, fn):
+    """Call the backend's API through its scheduler, for retries."""
+    return (generator.scheduler or backend.scheduler).call(fn)
+
+
+def _manifest_path(batch_id, batch_dir):
+    return Path(batch_dir) / f"{batch_id}.json"
+
+
+def _save_manifest(manifest, batch_dir):
+    """Write a manifest atomically, so a crash never leaves half a file."""
+    utils.write_atomic(
+        _manifest_path(manifest["batch_id"], batch_dir),
+        json.dumps(manifest, indent=2),
+    )
+
+
+def load_manifest(batch_id, batch_dir=BATCH_API_DIR):
+    """
+    Load a submitted batch's manifest.
+
+    Raises:
+        KeyError: If no batch with that ID was submitted from batch_dir
+    """
+    path = _manifest_path(batch_id, batch_dir)
+    if not path.exists():
+        raise KeyError(f"No batch {batch_id} in {batch_dir}")
+    return json.loads(path.read_text())
+
+
+def list_batches(batch_dir=BATCH_API_DIR):
+    """Return the manifests of every batch submitted from batch_dir, oldest first."""
+    manifests = [
+        json.loads(path.read_text()) for path in Path(batch_dir).glob("batch_*.json")
+    ]
+    return sorted(manifests, key=lambda manifest: manifest["submitted_at"])
+
+
+def pending_inputs(batch_dir=BATCH_API_DIR):
+    """
+    Return the input hashes of requests still waiting in batches that have
+    not been collected, so they are not submitted twice.
+    """
+    if not Path(batch_dir).exists():
+        return set()
+    return {
+        entry["input_hash"]
+        for manifest in list_batches(batch_dir)
+        if manifest["collected_at"] is None
+        for entry in manifest["requests"].values()
+        if entry["status"] == "submitted" and entry["input_hash"] is not None
+    }
+
+
+class _RequestFile:
+    """A Batch API JSONL file being written, with its manifest entries."""
+
+    def __init__(self, batch_dir):
+        stamp = datetime.now().strftime("%Y%m%d_%H%M%S_%f")
+        self.path = Path(batch_dir) / f"requests_{stamp}.jsonl"
+        self._file = open(self.path, "w")
+        self.entries = {}
+        self.size = 0
+
+    def fits(self, line, max_requests, max_bytes):
+        return len(self.entries) < max_requests and (
+            self.size + len(line.encode("utf-8")) <= max_bytes
+        )
+
+    def add(self, custom_id, line, entry):
+        self._file.write(line)
+        self.size += len(line.encode("utf-8"))
+        self.entries[custom_id] = entry
+
+    def close(self):
+        self._file.close()
+
+
+def _submit_file(generator, backend, request_file, completion_window, batch_dir):
+    """Upload a request file, create its batch and save its manifest."""
+    request_file.close()
+    client = backend.client
+    content = request_file.path.read_bytes()
+    uploaded = _api(
+        generator,
+        backend,
+        lambda: client.files.create(
+            file=(request_file.path.name, content), purpose="batch"
+        ),
+    )
+    batch = _api(
+        generator,
+        backend,
+        lambda: client.post(
+            "/batches",
+            body={
+                "input_file_id": uploaded.id,
+                "endpoint": BATCH_ENDPOINT,
+                "completion_window": completion_window,
+                "metadata": {"description": "discharge summaries"},
+            },
+            cast_to=object,
+        ),
+    )
+    manifest = {
+        "batch_id": batch["id"],
+        "backend": backend.name,
+        "input_file_id": uploaded.id,
+        "input_path": str(request_file.path),
+        "status": batch["status"],
+        "submitted_at": time.time(),
+        "collected_at": None,
+        "requests": request_file.entries,
+    }
+    _save_manifest(manifest, batch_dir)
+    logger.info(
+        f"Submitted batch {batch['id']} with {len(request_file.entries)} "
+        f"requests ({request_file.path.name})"
+    )
+    return manifest
+
+
+def submit_batches(
+    generator,
+    source,
+    template_type=None,
+    backend=None,
+    batch_dir=BATCH_API_DIR,
+    completion_window=BATCH_API_COMPLETION_WINDOW,
+    max_requests=BATCH_API_MAX_REQUESTS,
+    max_bytes=BATCH_API_MAX_BYTES,
+):
+    """
+    Submit summary requests for many patient records as Batch API batches.
+
+    Records are read lazily from ``source``; a new batch is started whenever
+    one reaches ``max_requests`` requests or ``max_bytes`` bytes.
+
+    Args:
+        generator (DischargeSummaryGenerator): Generator whose templates,
+                                               budgets, cache and store are used
+        source (str): Directory, glob pattern, or JSON/JSONL file path
+        template_type (str, optional): Template type for every record (None
+                                       or "auto" routes each chart)
+        backend (str, optional): Backend to submit to. Defaults to the
+                                 generator's.
+        batch_dir (str): Directory for request files and manifests
+        completion_window (str): Batch API completion window
+        max_requests (int): Requests per batch
+        max_bytes (int): Bytes per request file
+
+    Returns:
+        dict: "batches" (the submitted batches' manifests) and counts of
+              "submitted", "skipped" (already summarized), "pending" (waiting
+              in an uncollected batch), "invalid" and "failed" (charts whose
+              request could not be prepared)
+
+    Raises:
+        ValueError: If the backend has no Batch API
+    """
+    backend = _batch_backend(generator, backend)
+    Path(batch_dir).mkdir(parents=True, exist_ok=True)
+    pending = pending_inputs(batch_dir)
+    result = {
+        "batches": [],
+        "submitted": 0,
+        "skipped": 0,
+        "pending": 0,
+        "invalid": 0,
+        "failed": 0,
+    }
+    request_file = None
+
+    for label, record, error in utils.iter_patient_records(source, validate=True):
+        if error:
+            result["invalid"] += 1
+            logger.warning(f"Skipping {label}: {error}")
+            continue
+        try:
+            call = generator._start_call(
+                record, template_type, strategy="single", backend=backend
+            )
+            if generator._cached_summary(call) is not None:
+                result["skipped"] += 1
+                continue
+            if call["input_hash"] in pending:
+                result["pending"] += 1
+                continue
+            request = generator._request_for_call(call)
+        except Exception as e:
+            result["failed"] += 1
+            logger.error(f"Could not prepare a batch request for {label}: {e}")
+            continue
+
+        body = generator._completion_params(request, backend)
+        body.pop("timeout", None)
+        custom_id = f"{call['patient_id']}-{result['submitted']}"
+        line = (
+            json.dumps(
+                {
+                    "custom_id": custom_id,
+                    "method": "POST",
+                    "url": BATCH_ENDPOINT,
+                    "body": body,
+                }
+            )
+            + "\n"
+        )
+        if request_file is not None and not request_file.fits(
+            line, max_requests, max_bytes
+        ):
+            result["batches"].append(
+                _submit_file(
+                    generator, backend, request_file, completion_window, batch_dir
+                )
+            )
+            request_file = None
+        if request_file is None:
+            request_file = _RequestFile(batch_dir)
+        request_file.add(
+            custom_id,
+            line,
+            {
+                "patient_id": call["patient_id"],
+                "source": label,
+                "template": call["template_name"],
+                "model": call["model"],
+                "admission": call["admission"],
+                "input_hash": call["input_hash"],
+                "prompt_tokens": request["prompt_tokens"],
+                "status": "submitted",
+            },
+        )
+        result["submitted"] += 1
+        if call["input_hash"] is not None:
+            pending.add(call["input_hash"])
+
+    if request_file is not None:
+        result["batches"].append(
+            _submit_file(generator, backend, request_file, completion_window, batch_dir)
+        )
+    return result
+
+
+def batch_status(generator, batch_id, batch_dir=BATCH_API_DIR):
+    """
+    Fetch a submitted batch's current state from the API (and note its
+    status in the manifest).
+
+    Returns:
+        dict: The Batch API batch object
+    """
+    manifest = load_manifest(batch_id, batch_dir)
+    backend = _batch_backend(generator, manifest["backend"])
+    client = backend.client
+    batch = _api(
+        generator, backend, lambda: client.get(f"/batches/{batch_id}", cast_to=object)
+    )
+    if batch["status"] != manifest["status"]:
+        manifest["status"] = batch["status"]
+        _save_manifest(manifest, batch_dir)
+    return batch
+
+
+def wait_for_batch(
+    generator,
+    batch_id,
+    poll_interval=BATCH_API_POLL_INTERVAL,
+    timeout=None,
+    batch_dir=BATCH_API_DIR,
+):
+    """
+    Poll a batch until it completes, fails, expires or is cancelled.
+
+    Args:
+        poll_interval (float): Seconds between polls
+        timeout (float, optional): Seconds to wait before giving up
+
+    Returns:
+        dict: The finished batch object
+
+    Raises:
+        TimeoutError: If the batch is still running after ``timeout`` seconds
+    """
+    deadline = time.monotonic() + timeout if timeout is not None else None
+    while True:
+        batch = batch_status(generator, batch_id, batch_dir)
+        if batch["status"] in TERMINAL_STATUSES:
+            return batch
+        counts = batch.get("request_counts") or {}
+        logger.info(
+            f"Batch {batch_id} is {batch['status']}: "
+            f"{counts.get('completed', 0)}/{counts.get('total', '?')} completed, "
+            f"{counts.get('failed', 0)} failed"
+        )
+        if deadline is not None and time.monotonic() + poll_interval > deadline:
+            raise TimeoutError(f"Batch {batch_id} is still {batch['status']}")
+        time.sleep(poll_interval)
+
+
+def _read_results(generator, backend, batch):
+    """Download a finished batch's output and error files."""
+    client = backend.client
+    results = []
+    for file_id in (batch.get("output_file_id"), batch.get("error_file_id")):
+        if not file_id:
+            continue
+        content = _api(generator, backend, lambda: client.files.content(file_id))
+        results.extend(
+            json.loads(line) for line in content.text.splitlines() if line.strip()
+        )
+    return results
+
+
+def _read_messages(input_path):
+    """Map custom_ids to their request messages, from a kept request file."""
+    path = Path(input_path)
+    if not path.exists():
+        return {}
+    with open(path) as f:
+        lines = (json.loads(line) for line in f if line.strip())
+        return {line["custom_id"]: line["body"]["messages"] for line in lines}
+
+
+def _call_for(generator, entry, manifest):
+    """
+    Rebuild a generation call's bookkeeping dict for a batch result, timed
+    from the batch's submission.
+    """
+    waited = time.time() - manifest["submitted_at"]
+    return {
+        "patient_id": entry["patient_id"],
+        "template_name": entry["template"],
+        "strategy": "single",
+        "backend": manifest["backend"],
+        "model": entry["model"],
+        "admission": entry["admission"],
+        "input_hash": entry["input_hash"],
+        "cache_key": entry["input_hash"] if generator.cache is not None else None,
+        "key_model": entry["model"],
+        "started": time.perf_counter() - waited,
+        "timings": new_timings(),
+        "retries": 0,
+        "prompt_tokens": None,
+        "completion_tokens": None,
+        "cached_tokens": None,
+        "sections_reused": None,
+    }
+
+
+def collect_batch(
+    generator,
+    batch_id,
+    output_dir=None,
+    wait=True,
+    poll_interval=BATCH_API_POLL_INTERVAL,
+    timeout=None,
+    batch_dir=BATCH_API_DIR,
+):
+    """
+    Collect a batch's summaries into the summary cache, store and audit log.
+
+    Requests already collected are skipped, so collecting again is safe.
+
+    Args:
+        generator (DischargeSummaryGenerator): Generator used for finalizing
+        batch_id (str): Batch to collect
+        output_dir (str, optional): Also write each summary to
+                                    ``<output_dir>/<patient_id>.txt``
+        wait (bool): Wait for the batch to finish (otherwise a running
+                     batch collects nothing)
+        poll_interval (float): Seconds between polls while waiting
+        timeout (float, optional): Seconds to wait before giving up
+        batch_dir (str): Directory with the batch's manifest
+
+    Returns:
+        dict: The batch "status" and counts of requests "done", "failed"
+              and "pending" (not answered yet, or never, if the batch
+              expired or was cancelled)
+
+    Raises:
+        KeyError: If the batch is unknown
+        TimeoutError: If waiting timed out
+    """
+    if wait:
+        batch = wait_for_batch(generator, batch_id, poll_interval, timeout, batch_dir)
+    else:
+        batch = batch_status(generator, batch_id, batch_dir)
+    manifest = load_manifest(batch_id, batch_dir)
+    entries = manifest["requests"]
+
+    if batch["status"] in TERMINAL_STATUSES:
+        backend = _batch_backend(generator, manifest["backend"])
+        results = _read_results(generator, backend, batch)
+        messages = _read_messages(manifest["input_path"])
+        if output_dir:
+            Path(output_dir).mkdir(parents=True, exist_ok=True)
+
+        for result in results:
+            entry = entries.get(result.get("custom_id"))
+            if entry is None or entry["status"] != "submitted":
+                continue
+            call = _call_for(generator, entry, manifest)
+            response = result.get("response") or {}
+            if response.get("status_code") != 200:
+                error = result.get("error") or (response.get("body") or {}).get("error")
+                message = (error or {}).get("message") or (
+                    f"HTTP {response.get('status_code')}"
+                )
+                logger.error(
+                    f"Batch request for patient {entry['patient_id']} failed: "
+                    f"{message}"
+                )
+                generator._audit(call, error=BatchRequestError(message))
+                entry.update(status="failed", error=message)
+                continue
+
+            body = response["body"]
+            request_messages = messages.get(result["custom_id"], [])
+            request = {
+                "messages": request_messages,
+                "prompt": "\n\n".join(m["content"] for m in request_messages),
+                "prompt_tokens": entry["prompt_tokens"],
+            }
+            usage = body.get("usage")
+            summary = generator._finalize_summary(
+                body["choices"][0]["message"]["content"],
+                request,
+                call,
+                CompletionUsage.model_validate(usage) if usage else None,
+            )
+            generator._audit(call)
+            entry["status"] = "done"
+            if output_dir:
+                utils.write_atomic(
+                    Path(output_dir) / utils.safe_filename(entry["patient_id"]),
+                    summary,
+                )
+
+        manifest["collected_at"] = time.time()
+    manifest["status"] = batch["status"]
+    _save_manifest(manifest, batch_dir)
+
+    statuses = [entry["status"] for entry in entries.values()]
+    counts = {
+        "status": batch["status"],
+        "done": statuses.count("done"),
+        "failed": statuses.count("failed"),
+        "pending": statuses.count("submitted"),
+    }
+    logger.info(
+        f"Collected batch {batch_id} ({batch['status']}): {counts['done']} done, "
+        f"{counts['failed']} failed, {counts['pending']} pending"
+    )
+    return counts
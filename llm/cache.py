@@ -0,0 +1,242 @@
+"""
+Content-addressed cache for generated discharge summaries.
+"""
+
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+from loguru import logger
+
+from config import (
+    SECTION_CACHE_MAX_ENTRIES,
+    SECTION_CACHE_PATH,
+    SECTION_CACHE_TTL,
+    SUMMARY_CACHE_ENABLED,
+    SUMMARY_CACHE_MAX_ENTRIES,
+    SUMMARY_CACHE_MAX_BYTES,
+    SUMMARY_CACHE_TTL,
+    SUMMARY_CACHE_PATH,
+)
+
+
+def canonical_json(data):
+    """Serialize data to a stable JSON string (sorted keys, no whitespace)."""
+    return json.dumps(data, sort_keys=True, separators=(",", ":"), ensure_ascii=False)
+
+
+def make_cache_key(
+    patient_data, template, model, temperature, max_tokens, strategy="single"
+):
+    """
+    Build a stable cache key for a summary request.
+
+    Args:
+        patient_data (dict): Patient data
+        template (str): Resolved template text
+        model (str): LLM model name
+        temperature (float): Sampling temperature
+        max_tokens (int): Maximum completion tokens
+        strategy (str): Generation strategy
+
+    Returns:
+        str: SHA-256 hex digest identifying the request
+    """
+    request = {
+        "patient_data": patient_data,
+        "template": template,
+        "model": model,
+        "temperature": temperature,
+        "max_tokens": max_tokens,
+    }
+    # Only strategies other than single-shot are part of the key
+    if strategy != "single":
+        request["strategy"] = strategy
+    payload = canonical_json(request)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class SummaryCache:
+    """
+    Two-tier summary cache: an in-memory LRU with TTL and size limits, backed
+    by an optional SQLite file that survives restarts.
+    """
+
+    def __init__(
+        self,
+        max_entries=SUMMARY_CACHE_MAX_ENTRIES,
+        max_bytes=SUMMARY_CACHE_MAX_BYTES,
+        ttl=SUMMARY_CACHE_TTL,
+        path=None,
+    ):
+        """
+        Initialize the cache.
+
+        Args:
+            max_entries (int): Maximum number of in-memory entries
+            max_bytes (int): Maximum total length of in-memory summaries (characters)
+            ttl (float): Seconds an entry stays valid (0 disables expiry)
+            path (str, optional): SQLite file for the on-disk tier
+        """
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+        self._stats = {
+            "hits": 0,
+            "disk_hits": 0,
+            "misses": 0,
+            "evictions": 0,
+            "expirations": 0,
+        }
+
+        self._db = None
+        if path:
+            Path(path).parent.mkdir(parents=True, exist_ok=True)
+            self._db = sqlite3.connect(str(path), check_same_thread=False)
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS summaries ("
+                "key TEXT PRIMARY KEY, summary TEXT NOT NULL, created_at REAL NOT NULL)"
+            )
+            self._db.commit()
+            logger.info(f"Summary cache disk tier at {path}")
+
+    def _expired(self, created_at, now):
+        return self.ttl > 0 and now - created_at > self.ttl
+
+    def _store_memory(self, key, summary, created_at):
+        """Insert an entry into the LRU tier and evict down to the limits."""
+        if key in self._entries:
+            self._size -= len(self._entries.pop(key)[0])
+        self._entries[key] = (summary, created_at)
+        self._size += len(summary)
+
+        while self._entries and (
+            len(self._entries) > self.max_entries or self._size > self.max_bytes
+        ):
+            _, (evicted, _) = self._entries.popitem(last=False)
+            self._size -= len(evicted)
+            self._stats["evictions"] += 1
+
+    def get(self, key):
+        """
+        Look up a cached summary.
+
+        Args:
+            key (str): Cache key from make_cache_key
+
+        Returns:
+            str or None: The cached summary, or None on a miss
+        """
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                summary, created_at = entry
+                if not self._expired(created_at, now):
+                    self._entries.move_to_end(key)
+                    self._stats["hits"] += 1
+                    return summary
+                self._size -= len(self._entries.pop(key)[0])
+                self._stats["expirations"] += 1
+
+            if self._db is not None:
+                row = self._db.execute(
+                    "SELECT summary, created_at FROM summaries WHERE key = ?", (key,)
+                ).fetchone()
+                if row is not None:
+                    summary, created_at = row
+                    if not self._expired(created_at, now):
+                        self._store_memory(key, summary, created_at)
+                        self._stats["hits"] += 1
+                        self._stats["disk_hits"] += 1
+                        return summary
+                    self._db.execute("DELETE FROM summaries WHERE key = ?", (key,))
+                    self._db.commit()
+                    self._stats["expirations"] += 1
+
+            self._stats["misses"] += 1
+            return None
+
+    def set(self, key, summary):
+        """
+        Store a summary in the cache.
+
+        Args:
+            key (str): Cache key from make_cache_key
+            summary (str): Generated summary
+        """
+        now = time.time()
+        with self._lock:
+            self._store_memory(key, summary, now)
+            if self._db is not None:
+                self._db.execute(
+                    "INSERT OR REPLACE INTO summaries (key, summary, created_at) "
+                    "VALUES (?, ?, ?)",
+                    (key, summary, now),
+                )
+                self._db.commit()
+
+    def clear(self):
+        """Remove all entries from both tiers."""
+        with self._lock:
+            self._entries.clear()
+            self._size = 0
+            if self._db is not None:
+                self._db.execute("DELETE FROM summaries")
+                self._db.commit()
+
+    def stats(self):
+        """Return hit/miss counters and current in-memory usage."""
+        with self._lock:
+            stats = dict(self._stats)
+            stats["entries"] = len(self._entries)
+            stats["bytes"] = self._size
+        lookups = stats["hits"] + stats["misses"]
+        stats["hit_rate"] = stats["hits"] / lookups if lookups else 0.0
+        return stats
+
+
+_default_cache = None
+_default_cache_lock = threading.Lock()
+
+
+def get_default_cache():
+    """
+    Return the process-wide summary cache, or None if caching is disabled.
+
+    A single instance is shared so that summaries survive across generator
+    instances (e.g. one per Streamlit button press).
+    """
+    global _default_cache
+    if not SUMMARY_CACHE_ENABLED:
+        return None
+    with _default_cache_lock:
+        if _default_cache is None:
+            _default_cache = SummaryCache(path=SUMMARY_CACHE_PATH or None)
+        return _default_cache
+
+
+_section_cache = None
+
+
+def get_section_cache():
+    """
+    Return the process-wide cache of section drafts used by incremental
+    regeneration (see llm.map_reduce). It is created on first use.
+    """
+    global _section_cache
+    with _default_cache_lock:
+        if _section_cache is None:
+            _section_cache = SummaryCache(
+                max_entries=SECTION_CACHE_MAX_ENTRIES,
+                max_bytes=SECTION_CACHE_MAX_ENTRIES * 4096,
+                ttl=SECTION_CACHE_TTL,
+                path=SECTION_CACHE_PATH or None,
+            )
+        return _section_cache
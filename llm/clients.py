@@ -0,0 +1,112 @@
+"""
+Process-wide registry of pooled OpenAI clients.
+
+Creating an ``OpenAI`` client builds a new HTTP connection pool, so every
+fresh client pays for a TCP/TLS handshake on its first request. Clients are
+registered here per (api_key, base_url) and reused, keeping connections warm
+across generator instances, Streamlit reruns and CLI workers.
+
+The SDK's built-in retries are disabled; retries and backoff are handled by
+the shared scheduler in ``llm.scheduler``.
+"""
+
+import asyncio
+import threading
+import weakref
+
+import httpx
+from openai import AsyncOpenAI, OpenAI
+from loguru import logger
+
+from config import (
+    OPENAI_API_KEY,
+    OPENAI_BASE_URL,
+    HTTP_MAX_CONNECTIONS,
+    HTTP_MAX_KEEPALIVE_CONNECTIONS,
+    HTTP_KEEPALIVE_EXPIRY,
+    HTTP_TIMEOUT,
+    HTTP_CONNECT_TIMEOUT,
+)
+
+_clients = {}
+# Async clients are bound to the event loop that created their connections
+_async_clients = weakref.WeakKeyDictionary()
+_lock = threading.Lock()
+
+
+def _limits():
+    return httpx.Limits(
+        max_connections=HTTP_MAX_CONNECTIONS,
+        max_keepalive_connections=HTTP_MAX_KEEPALIVE_CONNECTIONS,
+        keepalive_expiry=HTTP_KEEPALIVE_EXPIRY,
+    )
+
+
+def _timeout():
+    return httpx.Timeout(HTTP_TIMEOUT, connect=HTTP_CONNECT_TIMEOUT)
+
+
+def get_client(api_key=OPENAI_API_KEY, base_url=OPENAI_BASE_URL):
+    """
+    Return the shared OpenAI client for an API key and base URL.
+
+    Args:
+        api_key (str): OpenAI API key
+        base_url (str, optional): API base URL (None/empty for the default)
+
+    Returns:
+        OpenAI: A client backed by a pooled keep-alive HTTP connection pool
+    """
+    key = (api_key, base_url or None)
+    with _lock:
+        client = _clients.get(key)
+        if client is None:
+            client = OpenAI(
+                api_key=api_key,
+                base_url=base_url or None,
+                max_retries=0,
+                http_client=httpx.Client(limits=_limits(), timeout=_timeout()),
+            )
+            _clients[key] = client
+            logger.debug(
+                f"Created pooled OpenAI client for base URL: {client.base_url}"
+            )
+        return client
+
+
+def get_async_client(api_key=OPENAI_API_KEY, base_url=OPENAI_BASE_URL):
+    """
+    Return the shared AsyncOpenAI client for the running event loop.
+
+    Must be called from within a coroutine. Each event loop gets its own
+    client, since async connection pools cannot be shared between loops.
+
+    Args:
+        api_key (str): OpenAI API key
+        base_url (str, optional): API base URL (None/empty for the default)
+
+    Returns:
+        AsyncOpenAI: A client backed by a pooled keep-alive HTTP connection pool
+    """
+    loop = asyncio.get_running_loop()
+    key = (api_key, base_url or None)
+    with _lock:
+        loop_clients = _async_clients.setdefault(loop, {})
+        client = loop_clients.get(key)
+        if client is None:
+            client = AsyncOpenAI(
+                api_key=api_key,
+                base_url=base_url or None,
+                max_retries=0,
+                http_client=httpx.AsyncClient(limits=_limits(), timeout=_timeout()),
+            )
+            loop_clients[key] = client
+        return client
+
+
+def close_clients():
+    """Close all pooled synchronous clients and clear the registry."""
+    with _lock:
+        for client in _clients.values():
+            client.close()
+        _clients.clear()
@@ -2,14 +2,53 @@
 Core functionality for generating discharge summaries using LLMs.
 """
 
+import asyncio
 import json
+import sqlite3
+import time
 import openai
-from openai import OpenAI
 from loguru import logger
+from openai.types import CompletionUsage
 
+from . import backends
+from . import map_reduce
+from . import model_router
 from . import prompt_templates
+from . import routing
+from . import tokens
 from . import utils
-from config import OPENAI_API_KEY, LLM_MODEL, LLM_TEMPERATURE, MAX_TOKENS
+from .audit import get_default_audit_log
+from .instrumentation import (
+    count_summary,
+    new_timings,
+    profiled,
+    profiled_coroutine,
+    profiled_generator,
+    record,
+    span,
+)
+from .cache import get_default_cache, make_cache_key
+from .records import as_record
+from .scheduler import CircuitOpenError, RequestScheduler
+from .store import get_default_store
+from config import (
+    LLM_BACKEND,
+    OPENAI_API_KEY,
+    OPENAI_BASE_URL,
+    LLM_MODEL,
+    LLM_TEMPERATURE,
+    MAX_TOKENS,
+    ASYNC_CONCURRENCY,
+    PROMPT_COMPACTION,
+    SUMMARY_STRATEGY,
+)
+
+SYSTEM_PROMPT = "You are a medical professional creating discharge summaries."
+
+# "single": one prompt with the whole chart; "map_reduce": sections drafted
+# concurrently, then merged; "incremental": map_reduce, redrafting only the
+# sections that changed since the patient's last summary (see llm.map_reduce)
+STRATEGIES = ("single", "map_reduce", "incremental")
 
 
 class DischargeSummaryGenerator:
@@ -17,102 +56,957 @@ class DischargeSummaryGenerator:
     Generates discharge summaries using OpenAI's GPT models.
     """
 
-    def __init__(self, api_key=OPENAI_API_KEY, model=LLM_MODEL):
-        """Initialize the generator with API credentials."""
-        self.client = OpenAI(api_key=api_key)
-        self.model = model
-        logger.info(f"Initialized DischargeSummaryGenerator with model: {model}")
+    def __init__(
+        self,
+        api_key=OPENAI_API_KEY,
+        model=LLM_MODEL,
+        cache=None,
+        base_url=OPENAI_BASE_URL,
+        scheduler=None,
+        audit_log=None,
+        store=None,
+        backend=None,
+        router=None,
+    ):
+        """
+        Initialize the generator with API credentials.
 
-    def _prepare_prompt(self, patient_data, template_type=None):
+        Args:
+            api_key (str): OpenAI API key
+            model (str): LLM model name
+            cache (SummaryCache, optional): Summary cache to use. Defaults to the
+                                            process-wide cache (None if disabled).
+            base_url (str, optional): OpenAI-compatible API base URL
+            scheduler (RequestScheduler, optional): Scheduler for rate limiting and
+                                                    retries on every backend.
+                                                    Defaults to each backend's
+                                                    own (the process-wide
+                                                    scheduler, for OpenAI).
+            audit_log (AuditLog, optional): Structured audit sink. Defaults to the
+                                            process-wide audit log.
+            store (SummaryStore, optional): Persistent summary store. Defaults to
+                                            the process-wide store (None if
+                                            disabled).
+            backend (Backend or str, optional): Default LLM backend (see
+                                                llm.backends). Defaults to
+                                                LLM_BACKEND; the "openai"
+                                                backend uses api_key, base_url
+                                                and model. With backend or
+                                                model "auto", each call is
+                                                routed by latency (see
+                                                llm.model_router).
+            router (ModelRouter, optional): Latency tracker and router. Defaults
+                                            to the process-wide router.
         """
-        Prepare a prompt for the LLM based on patient data.
+        self.api_key = api_key
+        self.base_url = base_url
+        self.router = router or model_router.get_default_router()
+        backend = backend or LLM_BACKEND
+        self.auto_route = model_router.AUTO in (backend, model)
+        if self.auto_route:
+            # Budgets and cache keys default to the most preferred candidate
+            backend = self.router.candidate_backends(api_key, base_url)[0]
+        elif backend == "openai":
+            # Clients come from a process-wide registry so connections stay warm
+            backend = backends.OpenAIBackend("openai", model, api_key, base_url)
+        self.backend = backends.resolve(backend)
+        self.model = self.backend.model
+        self.cache = cache if cache is not None else get_default_cache()
+        self.scheduler = scheduler
+        self.audit_log = audit_log if audit_log is not None else get_default_audit_log()
+        self.store = store if store is not None else get_default_store()
+        logger.info(
+            f"Initialized DischargeSummaryGenerator with model: {self.model} "
+            f"({self.backend.name} backend)"
+        )
+
+    @property
+    def client(self):
+        """The default backend's chat client."""
+        return self.backend.client
+
+    @property
+    def async_client(self):
+        """The default backend's async chat client for the running event loop."""
+        return self.backend.async_client
+
+    def _backends_for(self, template_name, backend=None):
+        """
+        The backends to try for a call, in order: the requested backend (or
+        the template's, per TEMPLATE_BACKENDS, or the default), then the
+        configured fallbacks. "auto" asks the model router for the order.
+
+        Returns:
+            tuple: (backends, whether the model router chose them)
+        """
+        backend = backend or backends.template_backend(template_name)
+        if backend == model_router.AUTO or (backend is None and self.auto_route):
+            return (
+                self.router.choose(template_name, self.api_key, self.base_url),
+                True,
+            )
+        primary = backends.resolve(backend) if backend else self.backend
+        return [primary] + backends.fallbacks(primary), False
+
+    def _resolve_template_type(self, patient_data, template_type=None):
+        """
+        Return the template type to use, routing the chart (see llm.routing)
+        unless a known template type is given.
+        """
+        if template_type and template_type in prompt_templates.TEMPLATE_MAP:
+            return template_type
+        record = as_record(patient_data)
+        decision = routing.route(record)
+        logger.debug(
+            f"Routed patient {record.patient_id} to "
+            f"{decision.template} ({decision.rule or 'default'}: {decision.matched})"
+        )
+        return decision.template
+
+    def _resolve_template(self, patient_data, template_type=None):
+        """Return the template text for a template type or the patient's diagnosis."""
+        return prompt_templates.TEMPLATE_MAP[
+            self._resolve_template_type(patient_data, template_type)
+        ]
+
+    def _start_call(
+        self,
+        patient_data,
+        template_type=None,
+        timings=None,
+        strategy=None,
+        backend=None,
+    ):
+        """
+        Validate the chart and resolve the template and cache key for a
+        generation call, returning the call's bookkeeping dict (used for
+        caching, finalizing and auditing).
+
+        Raises:
+            InvalidPatientRecord: If the chart is malformed, before any LLM call
+            ValueError: If the strategy or backend is unknown
+        """
+        started = time.perf_counter()
+        strategy = strategy or SUMMARY_STRATEGY
+        if strategy not in STRATEGIES:
+            raise ValueError(
+                f"Unknown summary strategy {strategy!r}; expected one of {STRATEGIES}"
+            )
+        if timings is None:
+            timings = new_timings()
+        record = as_record(patient_data)
+        with span(timings, "template_selection"):
+            template_name = self._resolve_template_type(record, template_type)
+            template = prompt_templates.TEMPLATE_MAP[template_name]
+        call_backends, routed = self._backends_for(template_name, backend)
+        input_hash = self._input_hash(
+            record.data, template, strategy, call_backends[0].model
+        )
+        return {
+            "patient_id": record.patient_id,
+            "patient_data": record.data,
+            "template_type": template_type,
+            "template_name": template_name,
+            "template": template,
+            "strategy": strategy,
+            "backends": call_backends,
+            "hedge": routed and self.router.hedge and len(call_backends) > 1,
+            "backend": call_backends[0].name,
+            "model": call_backends[0].model,
+            "admission": record.patient_demographics.admission_date or "",
+            "input_hash": input_hash,
+            "cache_key": input_hash if self.cache is not None else None,
+            # The model input_hash was computed for
+            "key_model": call_backends[0].model,
+            "started": started,
+            "timings": timings,
+            "retries": 0,
+            "prompt_tokens": None,
+            "completion_tokens": None,
+            "cached_tokens": None,
+            "sections_reused": None,
+        }
+
+    def _audit(self, call, cache_hit=False, error=None):
+        """Record the call's total time and queue a structured audit record."""
+        record(call["timings"], "total", time.perf_counter() - call["started"])
+        status = "error" if error else ("cache_hit" if cache_hit else "ok")
+        count_summary(call["model"], call["template_name"], status)
+        if self.audit_log is None:
+            return
+        self.audit_log.record(
+            patient_id=call["patient_id"],
+            template=call["template_name"],
+            strategy=call["strategy"],
+            backend=call["backend"],
+            model=call["model"],
+            prompt_tokens=call["prompt_tokens"],
+            completion_tokens=call["completion_tokens"],
+            cached_tokens=call["cached_tokens"],
+            sections_reused=call["sections_reused"],
+            latency_ms=round((time.perf_counter() - call["started"]) * 1000, 1),
+            cache_hit=cache_hit,
+            retries=call["retries"],
+            error=type(error).__name__ if error is not None else None,
+        )
+
+    def _input_hash(self, patient_data, template, strategy="single", model=None):
+        """
+        Return the hash identifying a request's inputs (the summary cache and
+        store key), or None if neither the cache nor the store is enabled.
+        """
+        if self.cache is None and self.store is None:
+            return None
+        return make_cache_key(
+            patient_data,
+            template,
+            model or self.model,
+            LLM_TEMPERATURE,
+            MAX_TOKENS,
+            strategy,
+        )
+
+    def _cached_summary(self, call):
+        """
+        Return an earlier summary for the call's inputs, from the summary
+        cache or else the summary store, if there is one.
+        """
+        patient_id = call["patient_id"]
+        if call["cache_key"] is not None:
+            with span(call["timings"], "cache_lookup"):
+                summary = self.cache.get(call["cache_key"])
+            if summary is not None:
+                logger.info(
+                    f"Serving cached discharge summary for patient: {patient_id}"
+                )
+                return summary
+
+        if self.store is not None and call["input_hash"] is not None:
+            with span(call["timings"], "store_lookup"):
+                stored = self.store.find_by_input(call["input_hash"])
+            if stored is not None:
+                logger.info(
+                    f"Serving stored discharge summary v{stored['version']} "
+                    f"for patient: {patient_id}"
+                )
+                if call["cache_key"] is not None:
+                    self.cache.set(call["cache_key"], stored["summary"])
+                return stored["summary"]
+        return None
+
+    def _store_summary(self, call, summary):
+        """Save a generated summary to the store; failures are only logged."""
+        if self.store is None or call["input_hash"] is None:
+            return
+        try:
+            self.store.save(
+                call["patient_id"],
+                summary,
+                call["input_hash"],
+                admission=call["admission"],
+                template=call["template_name"],
+                model=call["model"],
+                strategy=call["strategy"],
+                prompt_tokens=call["prompt_tokens"],
+                completion_tokens=call["completion_tokens"],
+                latency_ms=round((time.perf_counter() - call["started"]) * 1000, 1),
+            )
+        except sqlite3.Error as e:
+            logger.warning(
+                f"Could not store summary for patient {call['patient_id']}: {e}"
+            )
+
+    def _patient_data_budget(
+        self, compiled_template, max_tokens=MAX_TOKENS, model=None
+    ):
+        """
+        Tokens left for patient data once the completion, system prompt and
+        template are accounted for in the model's context window (the
+        generator's model unless ``model`` is given).
+        """
+        model = model or self.model
+        overhead = tokens.count_message_tokens(
+            self._build_messages(compiled_template, ""), model
+        )
+        return max(0, tokens.context_window(model) - max_tokens - overhead)
+
+    def _format_patient_data(self, patient_data, budget, model=None):
+        """
+        Format patient data for a prompt, compacted to fit ``budget`` tokens
+        of ``model`` (always, if the uncompacted text would not fit).
+        """
+        model = model or self.model
+        formatted_data = utils.format_patient_json(
+            patient_data,
+            compact=PROMPT_COMPACTION,
+            token_budget=budget,
+            model=model,
+        )
+        if (
+            not PROMPT_COMPACTION
+            and tokens.count_tokens(formatted_data, model) > budget
+        ):
+            patient_id = patient_data.get("patient_id", "unknown")
+            logger.info(f"Patient {patient_id} data exceeds token budget; compacting")
+            formatted_data = utils.format_patient_json(
+                patient_data, compact=True, token_budget=budget, model=model
+            )
+        return formatted_data
+
+    def _request_for_messages(self, messages, max_tokens=MAX_TOKENS, model=None):
+        """
+        Count a prompt's tokens and clamp its completion budget to ``model``'s
+        context window (the generator's model unless given).
+
+        Returns:
+            dict: Prepared request with "messages", "prompt" (the messages as
+                  one text, for logging and previews), "prompt_tokens",
+                  "max_tokens" and the "model" it was fitted to
+
+        Raises:
+            tokens.ContextBudgetError: If the prompt cannot fit the context window
+        """
+        model = model or self.model
+        prompt_tokens = tokens.count_message_tokens(messages, model)
+        return {
+            "messages": messages,
+            "prompt": "\n\n".join(message["content"] for message in messages),
+            "prompt_tokens": prompt_tokens,
+            "max_tokens": tokens.fit_max_tokens(prompt_tokens, model, max_tokens),
+            "model": model,
+        }
+
+    def _prepare_request(
+        self, patient_data, template_type=None, template=None, timings=None, model=None
+    ):
+        """
+        Prepare a prompt and its token budget for the LLM.
+
+        Patient data is compacted to fit the model's context window (always, if
+        the uncompacted prompt would not fit), and max_tokens is clamped to the
+        room left after the prompt. The template's compiled instructions go in
+        the system message and the patient data in the user message after
+        them, so every request for a template shares the same prefix.
 
         Args:
             patient_data (dict): Patient data dictionary
             template_type (str, optional): Template type to use. If None, will be
                                           determined from diagnosis code.
+            template (str, optional): Already-resolved template text
+            timings (dict, optional): Per-call timing dict to record stages into
+            model (str, optional): Model to fit the prompt to. Defaults to the
+                                   generator's model.
 
         Returns:
-            str: Formatted prompt
-        """
-        # Format the patient data for the prompt
-        formatted_data = utils.format_patient_json(patient_data)
+            dict: Prepared request with "messages", "prompt" (the messages as
+                  one text, for logging and previews), "prompt_tokens",
+                  "max_tokens" and "model"
 
+        Raises:
+            tokens.ContextBudgetError: If the prompt cannot fit the context window
+        """
         # Extract patient ID for logging
         patient_id = patient_data.get("patient_id", "unknown")
 
-        # Determine which template to use based on diagnosis or specified template
-        if template_type and template_type in prompt_templates.TEMPLATE_MAP:
-            template = prompt_templates.TEMPLATE_MAP[template_type]
-        else:
-            diagnosis_code = utils.extract_diagnosis_code(patient_data)
-            template = prompt_templates.get_template_by_diagnosis(diagnosis_code)
+        if template is None:
+            template = self._resolve_template(patient_data, template_type)
+        compiled = prompt_templates.compile_template(template)
+
+        # Format the patient data for the prompt, compacted to fit the model
+        with span(timings, "format_patient_json"):
+            formatted_data = self._format_patient_data(
+                patient_data,
+                self._patient_data_budget(compiled, model=model),
+                model,
+            )
+
+        # Place the patient data after the template's static instructions
+        with span(timings, "prompt_build"):
+            request = self._request_for_messages(
+                self._build_messages(compiled, formatted_data), model=model
+            )
+
+        logger.debug(
+            f"Prepared prompt for patient {patient_id} using template type: "
+            f"{template_type} ({request['prompt_tokens']} prompt tokens, "
+            f"max_tokens={request['max_tokens']})"
+        )
+        return request
+
+    def _request_for_call(self, call):
+        """
+        Prepare the request for a call, using the call's strategy, fitted to
+        the model of the call's first backend.
+        """
+        if call["strategy"] in ("map_reduce", "incremental"):
+            return map_reduce.prepare_request(
+                self, call, incremental=call["strategy"] == "incremental"
+            )
+        return self._prepare_request(
+            call["patient_data"],
+            call["template_type"],
+            call["template"],
+            call["timings"],
+            call["backends"][0].model,
+        )
 
-        # Format the prompt with patient data
-        prompt = template.format(patient_data=formatted_data)
+    def _fit_request(self, request, call, backend):
+        """
+        Return ``request`` re-prepared for a backend whose model differs from
+        the one it was fitted to (a failover or hedge to a model with a
+        smaller context window), or ``request`` itself if the model matches.
 
+        Raises:
+            tokens.ContextBudgetError: If the prompt cannot fit the backend's
+                                       context window
+        """
+        if request.get("model", self.model) == backend.model:
+            return request
         logger.debug(
-            f"Prepared prompt for patient {patient_id} using template type: {template_type}"
+            f"Refitting request for patient {call['patient_id']} from "
+            f"{request.get('model', self.model)} to {backend.model}"
         )
-        return prompt
+        if "section" in request or "drafts" in request:
+            return map_reduce.refit_request(self, call, request, backend.model)
+        return self._prepare_request(
+            call["patient_data"],
+            call["template_type"],
+            call["template"],
+            model=backend.model,
+        )
+
+    async def _arequest_for_call(self, call):
+        """Async counterpart of _request_for_call."""
+        if call["strategy"] in ("map_reduce", "incremental"):
+            return await map_reduce.aprepare_request(
+                self, call, incremental=call["strategy"] == "incremental"
+            )
+        return self._request_for_call(call)
 
-    def generate_summary(self, patient_data, template_type=None):
+    def _prepare_prompt(self, patient_data, template_type=None, template=None):
+        """
+        Prepare a prompt for the LLM based on patient data.
+
+        Args:
+            patient_data (dict): Patient data dictionary
+            template_type (str, optional): Template type to use. If None, will be
+                                          determined from diagnosis code.
+            template (str, optional): Already-resolved template text
+
+        Returns:
+            str: Formatted prompt
+        """
+        return self._prepare_request(patient_data, template_type, template)["prompt"]
+
+    def generate_summary(
+        self,
+        patient_data,
+        template_type=None,
+        timings=None,
+        strategy=None,
+        backend=None,
+    ):
         """
         Generate a discharge summary for a patient.
 
         Args:
-            patient_data (dict): Patient data
+            patient_data (dict or PatientRecord): Patient data
             template_type (str, optional): Template type to use
+            timings (dict, optional): Filled with per-stage timings in milliseconds
+            strategy (str, optional): "single", "map_reduce" or "incremental"
+                                      (see STRATEGIES).
+                                      Defaults to SUMMARY_STRATEGY.
+            backend (Backend or str, optional): LLM backend for this call.
+                                                Defaults to the template's
+                                                backend or the generator's.
 
         Returns:
             str: Generated discharge summary
+
+        Raises:
+            InvalidPatientRecord: If the chart is malformed (no LLM call is made)
         """
-        patient_id = patient_data.get("patient_id", "unknown")
-        prompt = self._prepare_prompt(patient_data, template_type)
+        with profiled("generate_summary"):
+            return self._generate_summary(
+                patient_data, template_type, timings, strategy, backend
+            )
+
+    def _generate_summary(
+        self,
+        patient_data,
+        template_type=None,
+        timings=None,
+        strategy=None,
+        backend=None,
+    ):
+        """Body of generate_summary, run under the optional profiler."""
+        call = self._start_call(patient_data, template_type, timings, strategy, backend)
+        patient_id = call["patient_id"]
 
         try:
+            cached = self._cached_summary(call)
+            if cached is not None:
+                self._audit(call, cache_hit=True)
+                return cached
+
+            request = self._request_for_call(call)
+
             logger.info(f"Generating discharge summary for patient: {patient_id}")
-            response = self.client.chat.completions.create(
-                model=self.model,
-                messages=[
-                    {
-                        "role": "system",
-                        "content": "You are a medical professional creating discharge summaries.",
-                    },
-                    {"role": "user", "content": prompt},
-                ],
-                temperature=LLM_TEMPERATURE,
-                max_tokens=MAX_TOKENS,
+            response = self._create_completion(request, call)
+            summary = self._finalize_summary(
+                response.choices[0].message.content, request, call, response.usage
             )
+            self._audit(call)
+            return summary
 
-            summary = response.choices[0].message.content
+        except Exception as e:
+            logger.error(f"Error generating summary for patient {patient_id}: {str(e)}")
+            self._audit(call, error=e)
+            raise
 
-            # Sanitize output
-            summary = utils.sanitize_output(summary)
+    def stream_summary(
+        self,
+        patient_data,
+        template_type=None,
+        timings=None,
+        strategy=None,
+        backend=None,
+    ):
+        """
+        Generate a discharge summary, yielding text chunks as they arrive.
+
+        Sanitization, audit logging and caching run over the assembled text
+        once the stream completes; the sanitized summary is the generator's
+        return value (see utils.consume_stream). Cached summaries are yielded
+        as a single chunk.
+
+        Args:
+            patient_data (dict or PatientRecord): Patient data
+            template_type (str, optional): Template type to use
+            timings (dict, optional): Filled with per-stage timings in milliseconds
+            strategy (str, optional): "single", "map_reduce" or "incremental"
+                                      (see STRATEGIES).
+                                      Defaults to SUMMARY_STRATEGY.
+            backend (Backend or str, optional): LLM backend for this call.
+                                                Defaults to the template's
+                                                backend or the generator's.
+
+        Yields:
+            str: Summary text chunks
+
+        Returns:
+            str: Sanitized discharge summary
+        """
+        return profiled_generator(
+            "stream_summary",
+            self._stream_summary(
+                patient_data, template_type, timings, strategy, backend
+            ),
+        )
+
+    def _stream_summary(
+        self,
+        patient_data,
+        template_type=None,
+        timings=None,
+        strategy=None,
+        backend=None,
+    ):
+        """Body of stream_summary, run under the optional profiler."""
+        call = self._start_call(patient_data, template_type, timings, strategy, backend)
+        patient_id = call["patient_id"]
 
-            # Log the interaction (with privacy considerations)
-            utils.log_prompt_and_response(prompt, summary, patient_id)
+        try:
+            cached = self._cached_summary(call)
+            if cached is not None:
+                self._audit(call, cache_hit=True)
+                yield cached
+                return cached
+
+            request = self._request_for_call(call)
+
+            logger.info(f"Streaming discharge summary for patient: {patient_id}")
+            llm_started = time.perf_counter()
+            # Ask for a final usage chunk, which carries cached-token counts
+            extra_body = {"stream_options": {"include_usage": True}}
+            if call["hedge"]:
+                stream = model_router.HedgedStream(
+                    self,
+                    request,
+                    call,
+                    self.router.hedge_after(call["backends"][0].name),
+                    extra_body=extra_body,
+                )
+            else:
+                stream = self._create_completion(
+                    request, call, stream=True, extra_body=extra_body
+                )
+            chunks = []
+            first_token = None
+            usage = None
+            try:
+                for chunk in stream:
+                    if getattr(chunk, "usage", None) is not None:
+                        usage = chunk.usage
+                        if isinstance(usage, dict):
+                            # Older clients leave stream usage unparsed
+                            usage = CompletionUsage.model_validate(usage)
+                    if not chunk.choices:
+                        continue
+                    text = chunk.choices[0].delta.content
+                    if text:
+                        if not chunks:
+                            first_token = time.perf_counter() - llm_started
+                            record(call["timings"], "llm_first_token", first_token)
+                        chunks.append(text)
+                        yield text
+            finally:
+                # Release the connection if the consumer stops early
+                stream.close()
+            llm_total = time.perf_counter() - llm_started
+            record(call["timings"], "llm_total", llm_total)
+            if not call["hedge"]:
+                # Hedged streams record each backend's own times
+                self.router.record(call["backend"], llm_total, first_token)
 
+            summary = self._finalize_summary("".join(chunks), request, call, usage)
+            self._audit(call)
+            return summary
+
+        except Exception as e:
+            logger.error(f"Error streaming summary for patient {patient_id}: {str(e)}")
+            self._audit(call, error=e)
+            raise
+
+    async def agenerate_summary(
+        self,
+        patient_data,
+        template_type=None,
+        timings=None,
+        strategy=None,
+        backend=None,
+    ):
+        """
+        Generate a discharge summary for a patient without blocking the event loop.
+
+        Args:
+            patient_data (dict or PatientRecord): Patient data
+            template_type (str, optional): Template type to use
+            timings (dict, optional): Filled with per-stage timings in milliseconds
+            strategy (str, optional): "single", "map_reduce" or "incremental"
+                                      (see STRATEGIES).
+                                      Defaults to SUMMARY_STRATEGY.
+            backend (Backend or str, optional): LLM backend for this call.
+                                                Defaults to the template's
+                                                backend or the generator's.
+
+        Returns:
+            str: Generated discharge summary
+        """
+        return await profiled_coroutine(
+            "agenerate_summary",
+            self._agenerate_summary(
+                patient_data, template_type, timings, strategy, backend
+            ),
+        )
+
+    async def _agenerate_summary(
+        self,
+        patient_data,
+        template_type=None,
+        timings=None,
+        strategy=None,
+        backend=None,
+    ):
+        """Body of agenerate_summary, run under the optional profiler."""
+        call = self._start_call(patient_data, template_type, timings, strategy, backend)
+        patient_id = call["patient_id"]
+
+        try:
+            cached = self._cached_summary(call)
+            if cached is not None:
+                self._audit(call, cache_hit=True)
+                return cached
+
+            request = await self._arequest_for_call(call)
+
+            logger.info(f"Generating discharge summary for patient: {patient_id}")
+            response = await self._acreate_completion(request, call)
+            summary = self._finalize_summary(
+                response.choices[0].message.content, request, call, response.usage
+            )
+            self._audit(call)
             return summary
 
         except Exception as e:
             logger.error(f"Error generating summary for patient {patient_id}: {str(e)}")
+            self._audit(call, error=e)
             raise
 
-    def generate_summary_from_file(self, file_path, template_type=None):
+    async def agenerate_many(
+        self,
+        patients,
+        template_type=None,
+        concurrency=ASYNC_CONCURRENCY,
+        return_exceptions=False,
+        strategy=None,
+        backend=None,
+    ):
+        """
+        Generate discharge summaries for many patients concurrently.
+
+        At most ``concurrency`` requests are in flight at once. Results are
+        returned in the same order as ``patients``.
+
+        Args:
+            patients (iterable): Patient data dictionaries
+            template_type (str, optional): Template type to use for every patient
+            concurrency (int): Maximum number of concurrent LLM calls
+            return_exceptions (bool): Return exceptions in place of failed
+                                      summaries instead of raising the first one
+            strategy (str, optional): Generation strategy for every patient
+            backend (Backend or str, optional): LLM backend for every patient
+
+        Returns:
+            list: Generated discharge summaries (or exceptions)
+        """
+        semaphore = asyncio.Semaphore(max(1, int(concurrency)))
+
+        async def generate_one(patient_data):
+            async with semaphore:
+                return await self.agenerate_summary(
+                    patient_data, template_type, strategy=strategy, backend=backend
+                )
+
+        return await asyncio.gather(
+            *(generate_one(patient_data) for patient_data in patients),
+            return_exceptions=return_exceptions,
+        )
+
+    def _build_messages(self, compiled_template, patient_data_text):
+        """
+        Build the chat messages for a compiled template and formatted patient
+        data. The system message depends only on the template, so it is a
+        byte-identical prefix across patients.
+        """
+        return [
+            {
+                "role": "system",
+                "content": f"{SYSTEM_PROMPT}\n\n{compiled_template.instructions}",
+            },
+            {
+                "role": "user",
+                "content": f"{compiled_template.data_heading}\n{patient_data_text}",
+            },
+        ]
+
+    def _completion_params(self, request, backend=None):
+        """Build the chat completion request parameters for a prepared request."""
+        backend = backend or self.backend
+        params = {
+            "model": backend.model,
+            "messages": request["messages"],
+            "temperature": LLM_TEMPERATURE,
+            "max_tokens": request["max_tokens"],
+        }
+        if backend.timeout:
+            params["timeout"] = backend.timeout
+        return params
+
+    def _fail_over(self, error, call, index):
+        """
+        Decide whether a failed call moves on to the next backend: only for
+        provider failures (after the backend's own retries), or a prompt that
+        does not fit the backend's model, when one is left.
+        """
+        failed = call["backends"][index]
+        if index + 1 >= len(call["backends"]) or not (
+            RequestScheduler.is_retryable(error)
+            or isinstance(error, (CircuitOpenError, tokens.ContextBudgetError))
+        ):
+            return False
+        logger.warning(
+            f"LLM backend {failed.name} failed ({type(error).__name__}); "
+            f"failing over to {call['backends'][index + 1].name}"
+        )
+        return True
+
+    def _create_completion(self, request, call, section=False, **params):
+        """
+        Send a chat completion through the shared scheduler.
+
+        Rate limiting, retries and the circuit breaker apply to establishing
+        the response; for streams, failures after the first chunk are not
+        retried. Retries are counted into ``call``. For non-streaming calls,
+        llm_total is recorded here (streams record it once fully consumed). A
+        request failing over to a backend with another model is refitted to
+        it, and ``request`` is updated to what was sent.
+
+        A ``section`` call drafts one section of a map-reduce summary: its
+        time is not recorded as llm_total (concurrent section calls are timed
+        together by the map_sections stage), nor with the model router, whose
+        samples are of whole-summary calls.
+        """
+        started = time.perf_counter()
+        for index, backend in enumerate(call["backends"]):
+            try:
+                fitted = self._fit_request(request, call, backend)
+                response = self._call_backend(
+                    backend, fitted, call, route=not section, **params
+                )
+            except Exception as e:
+                if not self._fail_over(e, call, index):
+                    raise
+                continue
+            call["backend"], call["model"] = backend.name, backend.model
+            request.update(fitted)
+            break
+        if not section and not params.get("stream"):
+            record(call["timings"], "llm_total", time.perf_counter() - started)
+        return response
+
+    def _call_backend(self, backend, request, call, route=True, **params):
+        """
+        Send a chat completion to one backend through its scheduler, recording
+        the outcome with the model router unless ``route`` is false (streams
+        record their latency once consumed, in stream_summary).
+        """
+        started = time.perf_counter()
+        scheduler = self.scheduler or backend.scheduler
+        try:
+            raw = scheduler.call(
+                lambda: backend.client.chat.completions.with_raw_response.create(
+                    **self._completion_params(request, backend), **params
+                ),
+                tokens=request["prompt_tokens"] + request["max_tokens"],
+                stats=call,
+            )
+        except Exception:
+            if route:
+                self.router.record(backend.name, error=True)
+            raise
+        if route and not params.get("stream"):
+            self.router.record(backend.name, time.perf_counter() - started)
+        return raw.parse()
+
+    async def _acreate_completion(self, request, call, section=False, **params):
+        """Async counterpart of _create_completion."""
+        started = time.perf_counter()
+        for index, backend in enumerate(call["backends"]):
+            try:
+                fitted = self._fit_request(request, call, backend)
+                response = await self._acall_backend(
+                    backend, fitted, call, route=not section, **params
+                )
+            except Exception as e:
+                if not self._fail_over(e, call, index):
+                    raise
+                continue
+            call["backend"], call["model"] = backend.name, backend.model
+            request.update(fitted)
+            break
+        if not section:
+            record(call["timings"], "llm_total", time.perf_counter() - started)
+        return response
+
+    async def _acall_backend(self, backend, request, call, route=True, **params):
+        """Async counterpart of _call_backend."""
+        started = time.perf_counter()
+        scheduler = self.scheduler or backend.scheduler
+        client = backend.async_client
+        try:
+            raw = await scheduler.acall(
+                lambda: client.chat.completions.with_raw_response.create(
+                    **self._completion_params(request, backend), **params
+                ),
+                tokens=request["prompt_tokens"] + request["max_tokens"],
+                stats=call,
+            )
+        except Exception:
+            if route:
+                self.router.record(backend.name, error=True)
+            raise
+        if route:
+            self.router.record(backend.name, time.perf_counter() - started)
+        return raw.parse()
+
+    def _finalize_summary(self, summary, request, call, usage=None):
+        """Sanitize, log and cache the raw summary text returned by the LLM."""
+        # Sanitize output
+        with span(call["timings"], "sanitize_output"):
+            summary = utils.sanitize_output(summary)
+
+        # Prefer the provider's token usage, when it reports one
+        if usage is not None:
+            call["prompt_tokens"] = usage.prompt_tokens
+            call["completion_tokens"] = usage.completion_tokens
+            call["cached_tokens"] = tokens.cached_prompt_tokens(usage)
+        else:
+            call["prompt_tokens"] = request["prompt_tokens"]
+            call["completion_tokens"] = tokens.count_tokens(summary, call["model"])
+        # Map-reduce requests carry the usage of their section calls
+        for field, value in request.get("section_usage", {}).items():
+            if value is not None:
+                call[field] = (call[field] or 0) + value
+
+        # Log the interaction (with privacy considerations)
+        utils.log_prompt_and_response(
+            request["prompt"],
+            summary,
+            call["patient_id"],
+            call["prompt_tokens"],
+            call["completion_tokens"],
+        )
+
+        # Key the summary on the model that wrote it: after a failover or a
+        # won hedge, that is not the model the lookup was keyed on
+        if call["input_hash"] is not None and call["model"] != call["key_model"]:
+            call["input_hash"] = self._input_hash(
+                call["patient_data"], call["template"], call["strategy"], call["model"]
+            )
+            call["key_model"] = call["model"]
+            if call["cache_key"] is not None:
+                call["cache_key"] = call["input_hash"]
+        if call["cache_key"] is not None:
+            self.cache.set(call["cache_key"], summary)
+        self._store_summary(call, summary)
+
+        return summary
+
+    def generate_summary_from_file(
+        self,
+        file_path,
+        template_type=None,
+        timings=None,
+        strategy=None,
+        backend=None,
+    ):
         """
         Generate a discharge summary from a patient data file.
 
         Args:
             file_path (str): Path to patient data JSON file
             template_type (str, optional): Template type to use
+            timings (dict, optional): Filled with per-stage timings in milliseconds
+            strategy (str, optional): "single", "map_reduce" or "incremental"
+                                      (see STRATEGIES).
+                                      Defaults to SUMMARY_STRATEGY.
+            backend (Backend or str, optional): LLM backend for this call.
+                                                Defaults to the template's
+                                                backend or the generator's.
 
         Returns:
             str: Generated discharge summary
         """
+        if timings is None:
+            timings = new_timings()
         try:
-            patient_data = utils.load_patient_data(file_path)
-            return self.generate_summary(patient_data, template_type)
+            with profiled("generate_summary_from_file"):
+                with span(timings, "load_patient_data"):
+                    patient_data = utils.load_patient_data(file_path)
+                return self._generate_summary(
+                    patient_data, template_type, timings, strategy, backend
+                )
         except Exception as e:
             logger.error(f"Error generating summary from file {file_path}: {str(e)}")
             raise
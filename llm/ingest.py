@@ -0,0 +1,397 @@
+"""
+Streaming ingestion of patient records from large exports.
+
+EHR exports arrive as NDJSON dumps (one patient per line, often gzip or
+zstd compressed) or, occasionally, as one huge JSON array. Everything here
+reads incrementally, so memory use is bounded by the largest single record
+rather than by the size of the dump. ``PatientIndex`` adds random access to
+uncompressed NDJSON files: a one-off scan records the byte offset of every
+line, after which any patient can be read straight from a memory map.
+"""
+
+import gzip
+import io
+import json
+import mmap
+import os
+import re
+from pathlib import Path
+
+import numpy as np
+from loguru import logger
+
+from .records import InvalidPatientRecord, PatientRecord, validate_jsonl
+
+try:
+    import zstandard
+except ImportError:  # pragma: no cover - optional dependency
+    zstandard = None
+
+NDJSON_SUFFIXES = (".jsonl", ".ndjson")
+COMPRESSED_SUFFIXES = (".gz", ".zst")
+READ_CHUNK_SIZE = 1 << 20
+# Give up on a JSON array element that is still incomplete after this much
+MAX_ELEMENT_SIZE = 256 << 20
+
+# Bumped when the index format or the way IDs are read changes
+INDEX_VERSION = 2
+
+# A record's "patient_id", found without parsing the line; it is only the
+# record's own ID if it sits at the top level (see _line_patient_id)
+_PATIENT_ID = re.compile(rb'"patient_id"\s*:\s*(?:"((?:[^"\\]|\\.)*)"|(-?\d+))')
+
+
+def _nesting_depth(line, end):
+    """Object/array nesting depth of an NDJSON line at byte offset ``end``."""
+    depth = 0
+    in_string = escaped = False
+    for byte in line[:end]:
+        if in_string:
+            if escaped:
+                escaped = False
+            elif byte == 0x5C:  # backslash
+                escaped = True
+            elif byte == 0x22:  # quote
+                in_string = False
+        elif byte == 0x22:
+            in_string = True
+        elif byte in b"{[":
+            depth += 1
+        elif byte in b"}]":
+            depth -= 1
+    return depth
+
+
+def _line_patient_id(line):
+    """
+    Return the top-level patient ID of an NDJSON line, or None.
+
+    The ID is usually the first key of a record, so the first regex match is
+    used when it is at the top level; otherwise the line is parsed.
+    """
+    match = _PATIENT_ID.search(line)
+    if match is None:
+        return None
+    if _nesting_depth(line, match.start()) == 1:
+        string_id, numeric_id = match.groups()
+        if string_id is not None:
+            return json.loads(b'"%s"' % string_id)
+        return numeric_id.decode()
+    try:
+        record = json.loads(line)
+    except (json.JSONDecodeError, UnicodeDecodeError):
+        return None
+    if not isinstance(record, dict) or record.get("patient_id") is None:
+        return None
+    return str(record["patient_id"])
+
+
+def record_format(path):
+    """
+    Classify a file by its suffixes.
+
+    Returns:
+        str or None: "ndjson", "json", or None for anything else
+    """
+    suffixes = Path(path).suffixes
+    if suffixes and suffixes[-1] in COMPRESSED_SUFFIXES:
+        suffixes = suffixes[:-1]
+    if not suffixes:
+        return None
+    if suffixes[-1] in NDJSON_SUFFIXES:
+        return "ndjson"
+    if suffixes[-1] == ".json":
+        return "json"
+    return None
+
+
+def open_text(path):
+    """
+    Open a possibly compressed file for streaming text reads.
+
+    ``.gz`` files are read with gzip and ``.zst`` files with the optional
+    ``zstandard`` package; anything else is opened as plain UTF-8 text.
+    """
+    path = Path(path)
+    if path.suffix == ".gz":
+        return gzip.open(path, "rt", encoding="utf-8")
+    if path.suffix == ".zst":
+        if zstandard is None:
+            raise RuntimeError(
+                f"Reading {path} requires the 'zstandard' package "
+                "(pip install zstandard)"
+            )
+        stream = zstandard.ZstdDecompressor().stream_reader(open(path, "rb"))
+        return io.TextIOWrapper(stream, encoding="utf-8")
+    return open(path, "r", encoding="utf-8")
+
+
+def iter_ndjson(path, validate=False):
+    """
+    Stream records from an NDJSON/JSONL file, one per line.
+
+    Args:
+        path (str): File path (optionally .gz or .zst compressed)
+        validate (bool): Yield PatientRecord objects, and malformed charts
+                         as errors
+
+    Yields:
+        tuple: (source label, record dict/PatientRecord or None,
+                error message or None)
+    """
+    with open_text(path) as f:
+        if validate:
+            for line_number, record, error in validate_jsonl(f):
+                yield f"{path}:{line_number}", record, error
+            return
+        for line_number, line in enumerate(f, start=1):
+            if not line.strip():
+                continue
+            label = f"{path}:{line_number}"
+            try:
+                yield label, json.loads(line), None
+            except json.JSONDecodeError as e:
+                yield label, None, f"Invalid JSON: {e}"
+
+
+def _skip_whitespace(f, buffer, pos):
+    """Advance past whitespace, reading more input as needed."""
+    while True:
+        while pos < len(buffer) and buffer[pos] in " \t\r\n":
+            pos += 1
+        if pos < len(buffer):
+            return buffer, pos
+        more = f.read(READ_CHUNK_SIZE)
+        if not more:
+            return buffer, pos
+        buffer, pos = more, 0
+
+
+def iter_json_array(path):
+    """
+    Incrementally parse a JSON document holding an array of records.
+
+    Elements are decoded one at a time from a sliding buffer, so only the
+    current record is held in memory. A document that is a single object is
+    yielded whole, with an index of None.
+
+    Args:
+        path (str): File path (optionally .gz or .zst compressed)
+
+    Yields:
+        tuple: (element index or None, decoded element)
+
+    Raises:
+        json.JSONDecodeError: If the document is malformed
+    """
+    decoder = json.JSONDecoder()
+    with open_text(path) as f:
+        buffer, pos = _skip_whitespace(f, f.read(READ_CHUNK_SIZE), 0)
+        if pos >= len(buffer):
+            return
+        if buffer[pos] != "[":
+            yield None, json.loads(buffer[pos:] + f.read())
+            return
+
+        pos += 1
+        index = 0
+        while True:
+            buffer, pos = _skip_whitespace(f, buffer, pos)
+            if pos >= len(buffer):
+                raise json.JSONDecodeError("Unterminated array", buffer, pos)
+            if buffer[pos] == "]":
+                return
+            if buffer[pos] == "," and index > 0:
+                buffer, pos = _skip_whitespace(f, buffer, pos + 1)
+            try:
+                element, end = decoder.raw_decode(buffer, pos)
+            except json.JSONDecodeError:
+                # Most likely the element runs past the buffer; read more
+                more = f.read(READ_CHUNK_SIZE)
+                if not more or len(buffer) - pos > MAX_ELEMENT_SIZE:
+                    raise
+                buffer, pos = buffer[pos:] + more, 0
+                continue
+            yield index, element
+            index += 1
+            pos = end
+            if pos >= READ_CHUNK_SIZE:
+                buffer, pos = buffer[pos:], 0
+
+
+def iter_json_document(path, validate=False):
+    """
+    Stream records from a JSON file holding one record or an array of them.
+
+    Args:
+        path (str): File path (optionally .gz or .zst compressed)
+        validate (bool): Yield PatientRecord objects, and malformed charts
+                         as errors
+
+    Yields:
+        tuple: (source label, record dict/PatientRecord or None,
+                error message or None)
+    """
+    try:
+        for index, element in iter_json_array(path):
+            label = f"{path}[{index}]" if index is not None else str(path)
+            if not validate:
+                yield label, element, None
+                continue
+            try:
+                yield label, PatientRecord.from_dict(element), None
+            except InvalidPatientRecord as e:
+                yield label, None, str(e)
+    except (OSError, json.JSONDecodeError) as e:
+        yield str(path), None, f"Invalid JSON: {e}"
+
+
+def iter_file_records(path, validate=False):
+    """Stream records from one NDJSON or JSON file, by its suffix."""
+    if record_format(path) == "ndjson":
+        return iter_ndjson(path, validate)
+    return iter_json_document(path, validate)
+
+
+class PatientIndex:
+    """
+    Line-offset index over an uncompressed NDJSON file, for lookup by ID.
+
+    The index is built with one sequential scan that only pattern-matches
+    each line's ``patient_id``, and is saved next to the file as
+    ``<file>.idx.npz``. It is reused for as long as the file's size and
+    modification time are unchanged.
+    """
+
+    def __init__(self, path):
+        """
+        Load or build the index for an NDJSON file.
+
+        Args:
+            path (str): Uncompressed .jsonl/.ndjson file
+        """
+        self.path = Path(path)
+        if self.path.suffix in COMPRESSED_SUFFIXES:
+            raise ValueError(
+                f"Cannot index compressed file {self.path}; decompress it first"
+            )
+        self.index_path = self.path.with_name(self.path.name + ".idx.npz")
+        self.offsets = None
+        self.patient_ids = None
+        self._rows = None
+        if not self._load():
+            self.build()
+
+    def _signature(self):
+        stat = os.stat(self.path)
+        return np.array(
+            [INDEX_VERSION, stat.st_size, stat.st_mtime_ns], dtype=np.int64
+        )
+
+    def _load(self):
+        if not self.index_path.exists():
+            return False
+        try:
+            with np.load(self.index_path, allow_pickle=False) as saved:
+                if not np.array_equal(saved["signature"], self._signature()):
+                    return False
+                self.offsets = saved["offsets"]
+                self.patient_ids = saved["patient_ids"]
+        except (OSError, KeyError, ValueError) as e:
+            logger.warning(f"Ignoring unreadable index {self.index_path}: {e}")
+            return False
+        return True
+
+    def build(self):
+        """Scan the file and write the index."""
+        offsets, patient_ids = [], []
+        position = 0
+        with open(self.path, "rb") as f:
+            for line in f:
+                patient_id = _line_patient_id(line)
+                if patient_id is not None:
+                    offsets.append(position)
+                    patient_ids.append(patient_id)
+                position += len(line)
+
+        self.offsets = np.asarray(offsets, dtype=np.int64)
+        self.patient_ids = np.asarray(patient_ids, dtype=str)
+        self._rows = None
+        logger.info(f"Indexed {len(self.offsets)} records in {self.path}")
+        tmp_path = self.index_path.with_name(self.index_path.name + ".tmp.npz")
+        try:
+            np.savez(
+                tmp_path,
+                signature=self._signature(),
+                offsets=self.offsets,
+                patient_ids=self.patient_ids,
+            )
+            os.replace(tmp_path, self.index_path)
+        except OSError as e:
+            # A read-only data directory: keep the index in memory only
+            logger.warning(f"Could not save index {self.index_path}: {e}")
+
+    def __len__(self):
+        return len(self.offsets)
+
+    def __contains__(self, patient_id):
+        return self._row_for(patient_id) is not None
+
+    def _row_for(self, patient_id):
+        if self._rows is None:
+            # Later lines win, as in an append-only export
+            self._rows = {pid: row for row, pid in enumerate(self.patient_ids)}
+        return self._rows.get(str(patient_id))
+
+    def get(self, patient_id):
+        """
+        Read one patient's record without scanning the file.
+
+        Args:
+            patient_id (str): Patient ID
+
+        Returns:
+            dict: The patient record
+
+        Raises:
+            KeyError: If the patient is not in the file
+        """
+        row = self._row_for(patient_id)
+        if row is None:
+            raise KeyError(f"Patient {patient_id} not found in {self.path}")
+        start = int(self.offsets[row])
+        with open(self.path, "rb") as f:
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                end = mm.find(b"\n", start)
+                line = mm[start : end if end >= 0 else len(mm)]
+        record = json.loads(line)
+        if str(record.get("patient_id")) != str(patient_id):
+            # The matched "patient_id" was not the top-level one
+            raise KeyError(f"Patient {patient_id} not found in {self.path}")
+        return record
+
+
+def find_patient(path, patient_id):
+    """
+    Return one patient's record from a record file.
+
+    Uncompressed NDJSON files are looked up through their PatientIndex;
+    other files are streamed until the patient is found.
+
+    Args:
+        path (str): Record file
+        patient_id (str): Patient ID
+
+    Returns:
+        dict: The patient record
+
+    Raises:
+        KeyError: If the patient is not in the file
+    """
+    path = Path(path)
+    if record_format(path) == "ndjson" and path.suffix not in COMPRESSED_SUFFIXES:
+        return PatientIndex(path).get(patient_id)
+    for _, data, _ in iter_file_records(path):
+        if isinstance(data, dict) and str(data.get("patient_id")) == str(patient_id):
+            return data
+    raise KeyError(f"Patient {patient_id} not found in {path}")
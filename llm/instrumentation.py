@@ -0,0 +1,336 @@
+"""
+Lightweight timing, metrics and profiling hooks for the generation pipeline.
+
+Stage timings are recorded into a per-call dict with ``span``. When
+instrumentation is enabled they are also aggregated into Prometheus-style
+counters and histograms that can be dumped to a text file. When it is off
+and no timing dict is requested, ``span`` returns a shared no-op context
+manager, so the pipeline pays for little more than a function call.
+"""
+
+import atexit
+import contextlib
+import cProfile
+import threading
+import time
+from bisect import bisect_left
+from datetime import datetime
+from pathlib import Path
+
+from loguru import logger
+
+from config import INSTRUMENTATION_ENABLED, METRICS_FILE, PROFILER, PROFILE_DIR
+
+try:
+    import pyinstrument
+except ImportError:  # pragma: no cover - optional dependency
+    pyinstrument = None
+
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+_NULL_SPAN = contextlib.nullcontext()
+
+
+def _label_key(labels):
+    return tuple(sorted(labels.items()))
+
+
+def _format_labels(key, extra=None):
+    items = list(key) + (list(extra.items()) if extra else [])
+    if not items:
+        return ""
+    return "{" + ",".join(f'{k}="{v}"' for k, v in items) + "}"
+
+
+class Counter:
+    """Monotonic counter with labels."""
+
+    def __init__(self, name, description):
+        self.name = name
+        self.description = description
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        key = _label_key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels):
+        return self._values.get(_label_key(labels), 0)
+
+    def render(self):
+        lines = [
+            f"# HELP {self.name} {self.description}",
+            f"# TYPE {self.name} counter",
+        ]
+        with self._lock:
+            for key, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{_format_labels(key)} {value}")
+        return lines
+
+
+class Histogram:
+    """Cumulative-bucket histogram with labels, in seconds."""
+
+    def __init__(self, name, description, buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.description = description
+        self.buckets = tuple(buckets)
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = _label_key(labels)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = {
+                    "counts": [0] * (len(self.buckets) + 1),
+                    "sum": 0.0,
+                    "count": 0,
+                }
+            series["counts"][bisect_left(self.buckets, value)] += 1
+            series["sum"] += value
+            series["count"] += 1
+
+    def render(self):
+        lines = [
+            f"# HELP {self.name} {self.description}",
+            f"# TYPE {self.name} histogram",
+        ]
+        with self._lock:
+            for key, series in sorted(self._series.items()):
+                cumulative = 0
+                for bound, count in zip(self.buckets, series["counts"]):
+                    cumulative += count
+                    labels = _format_labels(key, {"le": bound})
+                    lines.append(f"{self.name}_bucket{labels} {cumulative}")
+                labels = _format_labels(key, {"le": "+Inf"})
+                lines.append(f"{self.name}_bucket{labels} {series['count']}")
+                lines.append(f"{self.name}_sum{_format_labels(key)} {series['sum']}")
+                lines.append(
+                    f"{self.name}_count{_format_labels(key)} {series['count']}"
+                )
+        return lines
+
+
+STAGE_SECONDS = Histogram(
+    "discharge_stage_seconds", "Time spent in each generation pipeline stage"
+)
+SUMMARIES_TOTAL = Counter(
+    "discharge_summaries_total",
+    "Summary generation calls by model, template and status",
+)
+
+METRICS = [STAGE_SECONDS, SUMMARIES_TOTAL]
+
+
+def new_timings():
+    """Return a fresh timing dict if instrumentation is enabled, else None."""
+    return {} if INSTRUMENTATION_ENABLED else None
+
+
+@contextlib.contextmanager
+def _timed(timings, name):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record(timings, name, time.perf_counter() - start)
+
+
+def span(timings, name):
+    """
+    Time a pipeline stage into ``timings[name]`` (milliseconds).
+
+    Args:
+        timings (dict or None): Per-call timing dict; None disables timing
+        name (str): Stage name
+
+    Returns:
+        A context manager
+    """
+    if timings is None:
+        return _NULL_SPAN
+    return _timed(timings, name)
+
+
+def record(timings, name, seconds):
+    """Record a stage duration measured elsewhere (e.g. time to first byte)."""
+    if timings is None:
+        return
+    timings[name] = round(timings.get(name, 0.0) + seconds * 1000, 3)
+    if INSTRUMENTATION_ENABLED:
+        STAGE_SECONDS.observe(seconds, stage=name)
+
+
+def count_summary(model, template, status):
+    """Count a finished generation call when instrumentation is enabled."""
+    if INSTRUMENTATION_ENABLED:
+        SUMMARIES_TOTAL.inc(model=model, template=template, status=status)
+
+
+def render_metrics():
+    """Render all metrics in the Prometheus text exposition format."""
+    lines = []
+    for metric in METRICS:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+
+def dump_metrics(path=METRICS_FILE):
+    """
+    Write all metrics to a file in the Prometheus text format.
+
+    Args:
+        path (str): Destination file (e.g. for node_exporter's textfile collector)
+    """
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = path.with_suffix(path.suffix + ".tmp")
+    tmp_path.write_text(render_metrics())
+    tmp_path.replace(path)
+
+
+class _Profile:
+    """
+    One profile written under PROFILE_DIR, collected over one or more
+    running periods: ``PROFILER=cprofile`` writes a ``.prof`` file (for
+    pstats/snakeviz) and ``PROFILER=pyinstrument`` an HTML report.
+    """
+
+    def __init__(self, label):
+        self.label = label
+        self.stamp = datetime.now().strftime("%Y%m%d_%H%M%S_%f")
+        if PROFILER == "pyinstrument" and pyinstrument is not None:
+            self._profiler = pyinstrument.Profiler()
+            return
+        if PROFILER != "cprofile":
+            logger.warning(f"Profiler '{PROFILER}' unavailable; using cProfile")
+        self._profiler = cProfile.Profile()
+
+    @contextlib.contextmanager
+    def running(self):
+        """Profile the enclosed block into this profile."""
+        if isinstance(self._profiler, cProfile.Profile):
+            self._profiler.enable()
+            try:
+                yield
+            finally:
+                self._profiler.disable()
+            return
+        self._profiler.start()
+        try:
+            yield
+        finally:
+            self._profiler.stop()
+
+    def write(self):
+        Path(PROFILE_DIR).mkdir(parents=True, exist_ok=True)
+        if isinstance(self._profiler, cProfile.Profile):
+            output = Path(PROFILE_DIR) / f"{self.label}_{self.stamp}.prof"
+            self._profiler.dump_stats(str(output))
+        else:
+            output = Path(PROFILE_DIR) / f"{self.label}_{self.stamp}.html"
+            output.write_text(self._profiler.output_html())
+        logger.debug(f"Wrote profile to {output}")
+
+
+@contextlib.contextmanager
+def profiled(label):
+    """
+    Profile the enclosed block when the PROFILER env var is set.
+
+    ``PROFILER=cprofile`` writes a ``.prof`` file (for pstats/snakeviz) and
+    ``PROFILER=pyinstrument`` an HTML report, both under PROFILE_DIR.
+    """
+    if not PROFILER:
+        yield
+        return
+
+    profile = _Profile(label)
+    try:
+        with profile.running():
+            yield
+    finally:
+        profile.write()
+
+
+def profiled_generator(label, generator):
+    """
+    Profile a generator when the PROFILER env var is set (see ``profiled``).
+
+    Only the generator's own steps are profiled, not the consumer's code
+    between them; the profile is written once the generator finishes or is
+    closed. The generator's return value is passed through.
+
+    Returns:
+        generator: ``generator`` itself, or a profiling wrapper around it
+    """
+    if not PROFILER:
+        return generator
+    return _profile_steps(_Profile(label), generator)
+
+
+def _profile_steps(profile, generator):
+    try:
+        sent = None
+        while True:
+            with profile.running():
+                try:
+                    item = generator.send(sent)
+                except StopIteration as stop:
+                    return stop.value
+            sent = yield item
+    finally:
+        generator.close()
+        profile.write()
+
+
+def profiled_coroutine(label, coroutine):
+    """
+    Profile a coroutine when the PROFILER env var is set (see ``profiled``).
+
+    Only the coroutine's own steps are profiled: other tasks the event loop
+    runs while it awaits are left out. The profile is written once it
+    finishes.
+
+    Returns:
+        awaitable: ``coroutine`` itself, or a profiling wrapper around it
+    """
+    if not PROFILER:
+        return coroutine
+    return _ProfiledCoroutine(_Profile(label), coroutine)
+
+
+class _ProfiledCoroutine:
+    def __init__(self, profile, coroutine):
+        self._profile = profile
+        self._coroutine = coroutine
+
+    def __await__(self):
+        try:
+            sent, error = None, None
+            while True:
+                with self._profile.running():
+                    try:
+                        if error is not None:
+                            future = self._coroutine.throw(error)
+                        else:
+                            future = self._coroutine.send(sent)
+                    except StopIteration as stop:
+                        return stop.value
+                try:
+                    sent, error = (yield future), None
+                except GeneratorExit:
+                    raise
+                except BaseException as e:
+                    sent, error = None, e
+        finally:
+            self._coroutine.close()
+            self._profile.write()
+
+
+if INSTRUMENTATION_ENABLED and METRICS_FILE:
+    atexit.register(dump_metrics, METRICS_FILE)
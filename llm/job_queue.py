@@ -0,0 +1,490 @@
+"""
+Durable job queue for large (e.g. overnight) discharge batches.
+
+Jobs live in a SQLite database, so a batch survives crashes and restarts and
+can be inspected while it runs. Worker processes lease one job at a time:
+a leased job is hidden from other workers until its visibility timeout runs
+out, and a worker extends the lease while it is still generating. If a
+worker dies, its lease expires and the job is handed to another worker.
+Failed jobs are retried with exponential backoff, and jobs that fail
+``max_attempts`` times are moved to the dead-letter state.
+
+A job's summary is saved in the same transaction that marks it done. That
+transaction only succeeds while the worker still holds the lease, so each
+job gets exactly one summary even if a slow worker's lease was taken over.
+
+Jobs are leased in order of the patient's (expected) discharge date, so the
+patients going home soonest are summarized first.
+"""
+
+import hashlib
+import json
+import multiprocessing
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from pathlib import Path
+
+from loguru import logger
+
+from config import (
+    JOB_MAX_ATTEMPTS,
+    JOB_QUEUE_PATH,
+    JOB_RETRY_DELAY,
+    JOB_VISIBILITY_TIMEOUT,
+)
+from . import scheduler, utils
+from .cache import canonical_json
+from .records import PatientRecord
+
+# Sorts after any ISO date, so charts without a discharge date go last
+NO_DISCHARGE_DATE = "9999-12-31"
+
+JOB_STATUSES = ("queued", "leased", "done", "dead")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id INTEGER PRIMARY KEY,
+    dedupe_key TEXT NOT NULL UNIQUE,
+    patient_id TEXT NOT NULL,
+    source TEXT,
+    payload TEXT NOT NULL,
+    template TEXT,
+    strategy TEXT,
+    priority TEXT NOT NULL,
+    status TEXT NOT NULL DEFAULT 'queued',
+    attempts INTEGER NOT NULL DEFAULT 0,
+    max_attempts INTEGER NOT NULL,
+    available_at REAL NOT NULL,
+    lease_owner TEXT,
+    lease_expires REAL,
+    last_error TEXT,
+    summary TEXT,
+    enqueued_at REAL NOT NULL,
+    finished_at REAL
+);
+CREATE INDEX IF NOT EXISTS jobs_ready ON jobs (status, priority, id);
+"""
+
+
+class JobQueue:
+    """
+    SQLite-backed job queue. Open one per process; every method is a short
+    transaction, so any number of processes can share the database.
+    """
+
+    def __init__(self, path=JOB_QUEUE_PATH):
+        """
+        Open (or create) a job queue.
+
+        Args:
+            path (str): SQLite database file
+        """
+        self.path = str(path)
+        Path(self.path).parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        # Autocommit mode: transactions are begun explicitly below
+        self._db = sqlite3.connect(
+            self.path, timeout=30, isolation_level=None, check_same_thread=False
+        )
+        self._db.row_factory = sqlite3.Row
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.executescript(_SCHEMA)
+
+    def _transaction(self, fn):
+        """Run fn(db) in an IMMEDIATE (write-locked) transaction."""
+        with self._lock:
+            self._db.execute("BEGIN IMMEDIATE")
+            try:
+                result = fn(self._db)
+            except BaseException:
+                self._db.execute("ROLLBACK")
+                raise
+            self._db.execute("COMMIT")
+            return result
+
+    def enqueue(
+        self,
+        patient_data,
+        template_type=None,
+        strategy=None,
+        source=None,
+        max_attempts=JOB_MAX_ATTEMPTS,
+    ):
+        """
+        Add a job for a patient. Enqueuing the same chart with the same
+        template and strategy again is a no-op.
+
+        Args:
+            patient_data (dict or PatientRecord): Patient data (validated)
+            template_type (str, optional): Template type (None routes the chart)
+            strategy (str, optional): Generation strategy
+            source (str, optional): Where the record came from
+            max_attempts (int): Attempts before the job is dead-lettered
+
+        Returns:
+            int or None: The new job's ID, or None if it was already queued
+        """
+        record = (
+            patient_data
+            if isinstance(patient_data, PatientRecord)
+            else PatientRecord.from_dict(patient_data)
+        )
+        dedupe_key = hashlib.sha256(
+            canonical_json(
+                {
+                    "patient_data": record.data,
+                    "template": template_type,
+                    "strategy": strategy,
+                }
+            ).encode("utf-8")
+        ).hexdigest()
+        now = time.time()
+        cursor = self._transaction(
+            lambda db: db.execute(
+                "INSERT OR IGNORE INTO jobs (dedupe_key, patient_id, source, "
+                "payload, template, strategy, priority, max_attempts, "
+                "available_at, enqueued_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (
+                    dedupe_key,
+                    record.patient_id,
+                    source,
+                    canonical_json(record.data),
+                    template_type,
+                    strategy,
+                    record.discharge_date or NO_DISCHARGE_DATE,
+                    max(1, int(max_attempts)),
+                    now,
+                    now,
+                ),
+            )
+        )
+        return cursor.lastrowid if cursor.rowcount else None
+
+    def lease(self, worker_id, visibility_timeout=JOB_VISIBILITY_TIMEOUT):
+        """
+        Lease the next ready job: the queued (or expired-lease) job with the
+        earliest discharge date.
+
+        A job whose lease expired after its last allowed attempt (its worker
+        died or hung every time) is dead-lettered instead.
+
+        Args:
+            worker_id (str): Identifier of the leasing worker
+            visibility_timeout (float): Seconds before an unextended lease expires
+
+        Returns:
+            dict or None: The job row, with "patient_data", or None if no job
+                          is ready
+        """
+
+        def take(db):
+            now = time.time()
+            while True:
+                row = db.execute(
+                    "SELECT * FROM jobs WHERE (status = 'queued' AND "
+                    "available_at <= ?) OR (status = 'leased' AND "
+                    "lease_expires < ?) ORDER BY priority, id LIMIT 1",
+                    (now, now),
+                ).fetchone()
+                if row is None:
+                    return None
+                if row["status"] == "leased" and row["attempts"] >= row["max_attempts"]:
+                    db.execute(
+                        "UPDATE jobs SET status = 'dead', lease_owner = NULL, "
+                        "last_error = ?, finished_at = ? WHERE id = ?",
+                        (
+                            f"Lease held by {row['lease_owner']} expired",
+                            now,
+                            row["id"],
+                        ),
+                    )
+                    continue
+                db.execute(
+                    "UPDATE jobs SET status = 'leased', lease_owner = ?, "
+                    "lease_expires = ?, attempts = attempts + 1 WHERE id = ?",
+                    (worker_id, now + visibility_timeout, row["id"]),
+                )
+                job = dict(row)
+                job.update(
+                    status="leased",
+                    lease_owner=worker_id,
+                    attempts=row["attempts"] + 1,
+                    patient_data=json.loads(row["payload"]),
+                )
+                return job
+
+        return self._transaction(take)
+
+    def _update_leased(self, job_id, worker_id, sql, params):
+        """Update a job only while worker_id holds its lease."""
+        cursor = self._transaction(
+            lambda db: db.execute(
+                f"UPDATE jobs SET {sql} WHERE id = ? AND status = 'leased' "
+                "AND lease_owner = ?",
+                (*params, job_id, worker_id),
+            )
+        )
+        return cursor.rowcount == 1
+
+    def extend(self, job_id, worker_id, visibility_timeout=JOB_VISIBILITY_TIMEOUT):
+        """
+        Extend a lease. Returns False if the lease was lost to another worker.
+        """
+        return self._update_leased(
+            job_id,
+            worker_id,
+            "lease_expires = ?",
+            (time.time() + visibility_timeout,),
+        )
+
+    def complete(self, job_id, worker_id, summary):
+        """
+        Save a job's summary and mark it done.
+
+        Returns:
+            bool: False if the worker no longer held the lease (the summary is
+                  discarded, as another worker owns the job)
+        """
+        return self._update_leased(
+            job_id,
+            worker_id,
+            "status = 'done', summary = ?, lease_owner = NULL, "
+            "last_error = NULL, finished_at = ?",
+            (summary, time.time()),
+        )
+
+    def fail(self, job_id, worker_id, error, retry_delay=JOB_RETRY_DELAY):
+        """
+        Record a failed attempt: requeue the job with exponential backoff, or
+        dead-letter it after its last attempt.
+
+        Returns:
+            str or None: The job's new status, or None if the lease was lost
+        """
+
+        def record(db):
+            row = db.execute(
+                "SELECT attempts, max_attempts FROM jobs WHERE id = ? AND "
+                "status = 'leased' AND lease_owner = ?",
+                (job_id, worker_id),
+            ).fetchone()
+            if row is None:
+                return None
+            now = time.time()
+            if row["attempts"] >= row["max_attempts"]:
+                db.execute(
+                    "UPDATE jobs SET status = 'dead', lease_owner = NULL, "
+                    "last_error = ?, finished_at = ? WHERE id = ?",
+                    (str(error), now, job_id),
+                )
+                return "dead"
+            delay = retry_delay * 2 ** (row["attempts"] - 1)
+            db.execute(
+                "UPDATE jobs SET status = 'queued', lease_owner = NULL, "
+                "lease_expires = NULL, last_error = ?, available_at = ? "
+                "WHERE id = ?",
+                (str(error), now + delay, job_id),
+            )
+            return "queued"
+
+        return self._transaction(record)
+
+    def requeue_dead(self):
+        """Give every dead-lettered job a fresh set of attempts."""
+        cursor = self._transaction(
+            lambda db: db.execute(
+                "UPDATE jobs SET status = 'queued', attempts = 0, "
+                "available_at = ?, finished_at = NULL WHERE status = 'dead'",
+                (time.time(),),
+            )
+        )
+        return cursor.rowcount
+
+    def _fetch(self, sql, params=()):
+        with self._lock:
+            return [dict(row) for row in self._db.execute(sql, params).fetchall()]
+
+    def progress(self):
+        """
+        Return job counts by status, plus how many are ready to lease now.
+        """
+        now = time.time()
+        counts = dict.fromkeys(JOB_STATUSES, 0)
+        for row in self._fetch(
+            "SELECT status, COUNT(*) AS n FROM jobs GROUP BY status"
+        ):
+            counts[row["status"]] = row["n"]
+        counts["ready"] = self._fetch(
+            "SELECT COUNT(*) AS n FROM jobs WHERE (status = 'queued' AND "
+            "available_at <= ?) OR (status = 'leased' AND lease_expires < ?)",
+            (now, now),
+        )[0]["n"]
+        counts["total"] = sum(counts[status] for status in JOB_STATUSES)
+        return counts
+
+    def pending(self):
+        """Number of jobs not yet done or dead."""
+        counts = self.progress()
+        return counts["queued"] + counts["leased"]
+
+    def dead_letters(self):
+        """Return the dead-lettered jobs (without their payloads)."""
+        return self._fetch(
+            "SELECT id, patient_id, source, attempts, last_error, finished_at "
+            "FROM jobs WHERE status = 'dead' ORDER BY priority, id"
+        )
+
+    def summaries(self):
+        """Yield (patient_id, summary) for every done job."""
+        for row in self._fetch(
+            "SELECT patient_id, summary FROM jobs WHERE status = 'done' "
+            "ORDER BY priority, id"
+        ):
+            yield row["patient_id"], row["summary"]
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+
+def _keep_lease(queue, job_id, worker_id, visibility_timeout, stop):
+    """Extend a lease every third of its timeout until stop is set."""
+    while not stop.wait(visibility_timeout / 3):
+        if not queue.extend(job_id, worker_id, visibility_timeout):
+            logger.warning(f"{worker_id} lost its lease on job {job_id}")
+            return
+
+
+def work(
+    queue_path=JOB_QUEUE_PATH,
+    output_dir=None,
+    visibility_timeout=JOB_VISIBILITY_TIMEOUT,
+    idle_timeout=0,
+    generator=None,
+    workers=1,
+):
+    """
+    Run one worker: lease jobs and generate their summaries until the queue
+    has no pending jobs (or none become ready within ``idle_timeout``).
+
+    Args:
+        queue_path (str): Job queue database
+        output_dir (str, optional): Also write each summary to
+                                    ``<output_dir>/<patient_id>.txt``
+        visibility_timeout (float): Lease length in seconds
+        idle_timeout (float): Seconds to keep polling when no job is ready
+                              but some are still pending (0 waits for them)
+        generator (DischargeSummaryGenerator, optional): Generator to use;
+                                                         one is created for
+                                                         the worker by default
+        workers (int): Worker processes sharing the provider's rate limits;
+                       a created generator paces to ``1/workers`` of them
+
+    Returns:
+        int: Number of jobs this worker completed
+    """
+    from .discharge_generator import DischargeSummaryGenerator
+
+    queue = JobQueue(queue_path)
+    if generator is None:
+        scheduler.share_rate_limits(workers)
+        generator = DischargeSummaryGenerator()
+    worker_id = f"{os.uname().nodename}:{os.getpid()}:{uuid.uuid4().hex[:6]}"
+    if output_dir:
+        Path(output_dir).mkdir(parents=True, exist_ok=True)
+    completed = 0
+    idle_since = None
+
+    while True:
+        job = queue.lease(worker_id, visibility_timeout)
+        if job is None:
+            if not queue.pending():
+                break
+            idle_since = idle_since or time.monotonic()
+            if idle_timeout and time.monotonic() - idle_since > idle_timeout:
+                break
+            time.sleep(min(1.0, visibility_timeout / 10))
+            continue
+        idle_since = None
+
+        stop = threading.Event()
+        keeper = threading.Thread(
+            target=_keep_lease,
+            args=(queue, job["id"], worker_id, visibility_timeout, stop),
+            daemon=True,
+        )
+        keeper.start()
+        try:
+            summary = generator.generate_summary(
+                job["patient_data"], job["template"], strategy=job["strategy"]
+            )
+        except Exception as e:
+            stop.set()
+            status = queue.fail(job["id"], worker_id, e)
+            logger.error(
+                f"Job {job['id']} (patient {job['patient_id']}) failed on "
+                f"attempt {job['attempts']}: {e}; now {status or 'owned elsewhere'}"
+            )
+            continue
+        finally:
+            stop.set()
+            keeper.join()
+
+        # Write the file first: once the job is done no worker will retry it,
+        # so a crash between the two must not leave the summary only in the DB
+        if output_dir:
+            utils.write_atomic(
+                Path(output_dir) / utils.safe_filename(job["patient_id"]), summary
+            )
+        if queue.complete(job["id"], worker_id, summary):
+            completed += 1
+        else:
+            logger.warning(
+                f"Not completing job {job['id']}: its lease was taken over"
+            )
+
+    queue.close()
+    logger.info(f"Worker {worker_id} finished after {completed} jobs")
+    return completed
+
+
+def run_workers(
+    queue_path=JOB_QUEUE_PATH,
+    workers=4,
+    output_dir=None,
+    visibility_timeout=JOB_VISIBILITY_TIMEOUT,
+):
+    """
+    Drain the queue with ``workers`` worker processes, each with its own
+    generator (and connection pool) pacing to an equal share of the rate
+    limits.
+
+    Returns:
+        dict: Final job counts (see JobQueue.progress)
+    """
+    workers = max(1, int(workers))
+    processes = [
+        multiprocessing.Process(
+            target=work,
+            args=(queue_path, output_dir, visibility_timeout),
+            kwargs={"workers": workers},
+            name=f"summary-worker-{i}",
+        )
+        for i in range(workers)
+    ]
+    for process in processes:
+        process.start()
+    for process in processes:
+        process.join()
+        if process.exitcode:
+            logger.error(f"{process.name} exited with code {process.exitcode}")
+
+    queue = JobQueue(queue_path)
+    try:
+        return queue.progress()
+    finally:
+        queue.close()
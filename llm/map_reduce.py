@@ -0,0 +1,396 @@
+"""
+Section-parallel ("map-reduce") summary generation.
+
+Long admissions make for one very large prompt and a single long, serial
+generation. With the ``map_reduce`` strategy the chart is split into
+sections instead (hospital course, lab trends, medications, follow-up).
+Each section is drafted by its own smaller LLM call, all of them
+concurrently. A final merge call then writes the letter in the selected
+template's format from the section drafts and the patient's demographics and
+diagnoses. The merge call uses the same compiled template prefix as
+single-shot generation, so it benefits from prompt caching too.
+
+The ``incremental`` strategy is for charts that keep changing during a stay.
+Section drafts are cached by a hash of their input, and only the sections
+whose data changed since the patient's last summary (a new lab, a medication
+change) are drafted again before the merge.
+"""
+
+import asyncio
+import json
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+
+from loguru import logger
+
+from config import (
+    LLM_TEMPERATURE,
+    MAP_REDUCE_CONCURRENCY,
+    MAP_REDUCE_SECTION_MAX_TOKENS,
+)
+from . import tokens
+from .cache import get_section_cache, make_cache_key
+from .instrumentation import span
+from .prompt_templates import DEFAULT_DATA_HEADING, CompiledTemplate, compile_template
+
+Section = namedtuple("Section", ["name", "title", "keys", "instructions"])
+
+# Chart keys every section (and the merge) sees, for context
+CONTEXT_KEYS = ("patient_id", "patient_demographics", "diagnoses", "drg")
+
+SECTIONS = [
+    Section(
+        "hospital_course",
+        "Hospital Course",
+        ("encounters", "notes", "ward_round_notes", "flowsheets", "imaging"),
+        "Write the Hospital Course: presentation, investigations, procedures, "
+        "treatment and clinical progress in chronological order, with "
+        "significant observations and imaging findings.",
+    ),
+    Section(
+        "labs",
+        "Laboratory Results",
+        ("labs",),
+        "Summarize the laboratory results: key abnormal values and how they "
+        "trended over the admission, with dates and units.",
+    ),
+    Section(
+        "medications",
+        "Medications",
+        ("med_orders",),
+        "List the medications: each with dose, route and frequency, marking "
+        "which were started, changed or stopped during the admission and "
+        "which continue after discharge.",
+    ),
+    Section(
+        "follow_up",
+        "Follow-up",
+        ("follow_up_care", "lifestyle_modifications"),
+        "Write the Follow-up Instructions: appointments, monitoring, "
+        "lifestyle advice and warning signs the patient should act on.",
+    ),
+]
+
+# Chart keys no section claims are drafted with the hospital course
+CATCH_ALL_SECTION = "hospital_course"
+
+SECTION_INSTRUCTIONS = """
+You are drafting one section of a hospital discharge summary from part of a patient's chart.
+Use ONLY the patient data provided. Do NOT include any information that isn't explicitly in the data.
+Write concise, professional clinical text suitable for physician-to-physician communication.
+Write only the section itself: no letterhead, greeting, other sections or sign-off.
+If the data for this section is missing or insufficient, say so in one sentence.
+""".strip()
+
+SECTION_TEMPLATES = {
+    section.name: CompiledTemplate(
+        f"{SECTION_INSTRUCTIONS}\n\n{section.instructions}", DEFAULT_DATA_HEADING
+    )
+    for section in SECTIONS
+}
+
+DRAFTS_HEADING = "Section drafts, written from the rest of the patient's chart:"
+
+
+def split_sections(patient_data):
+    """
+    Split a chart into one smaller chart per section.
+
+    Each section chart holds the CONTEXT_KEYS plus that section's keys;
+    sections with no data are left out.
+
+    Args:
+        patient_data (dict): Patient data
+
+    Returns:
+        list: (Section, section chart) pairs
+    """
+    context = {key: patient_data[key] for key in CONTEXT_KEYS if key in patient_data}
+    claimed = set(CONTEXT_KEYS).union(*(section.keys for section in SECTIONS))
+    unclaimed = [key for key in patient_data if key not in claimed]
+
+    parts = []
+    for section in SECTIONS:
+        keys = list(section.keys)
+        if section.name == CATCH_ALL_SECTION:
+            keys += unclaimed
+        data = {key: patient_data[key] for key in keys if patient_data.get(key)}
+        if data:
+            parts.append((section, {**context, **data}))
+    return parts
+
+
+def _section_request(generator, section, chart, model):
+    """Prepare the LLM request drafting one section, fitted to ``model``."""
+    compiled = SECTION_TEMPLATES[section.name]
+    budget = generator._patient_data_budget(
+        compiled, MAP_REDUCE_SECTION_MAX_TOKENS, model
+    )
+    messages = generator._build_messages(
+        compiled, generator._format_patient_data(chart, budget, model)
+    )
+    request = generator._request_for_messages(
+        messages, MAP_REDUCE_SECTION_MAX_TOKENS, model
+    )
+    # Kept so the request can be refitted to another model on failover
+    request["section"], request["chart"] = section, chart
+    return request
+
+
+def _merge_request(generator, call, drafts, model):
+    """
+    Prepare the merge request, fitted to ``model``: the template's
+    instructions, then the patient's context data and the section drafts.
+    """
+    compiled = compile_template(call["template"])
+    drafts_text = "\n\n".join(f"## {title}\n{text.strip()}" for title, text in drafts)
+    drafts_text = f"{DRAFTS_HEADING}\n\n{drafts_text}"
+    budget = generator._patient_data_budget(compiled, model=model)
+    budget -= tokens.count_tokens(drafts_text, model)
+    context = {
+        key: call["patient_data"][key]
+        for key in CONTEXT_KEYS
+        if key in call["patient_data"]
+    }
+    formatted = generator._format_patient_data(context, max(0, budget), model)
+    request = generator._request_for_messages(
+        generator._build_messages(compiled, f"{formatted}\n\n{drafts_text}"),
+        model=model,
+    )
+    request["drafts"] = drafts
+    return request
+
+
+def refit_request(generator, call, request, model):
+    """
+    Prepare a section or merge request again for another model (see
+    DischargeSummaryGenerator._fit_request).
+
+    Returns:
+        dict: The refitted request
+    """
+    if "section" in request:
+        return _section_request(generator, request["section"], request["chart"], model)
+    return _merge_request(generator, call, request["drafts"], model)
+
+
+def section_key(model, section, chart):
+    """Content hash of a section's input, identifying its draft in the section cache."""
+    return make_cache_key(
+        chart,
+        SECTION_TEMPLATES[section.name].instructions,
+        model,
+        LLM_TEMPERATURE,
+        MAP_REDUCE_SECTION_MAX_TOKENS,
+    )
+
+
+def _manifest_key(patient_id):
+    """Section cache key of a patient's last section hashes."""
+    return f"sections:{patient_id}"
+
+
+def changed_sections(patient_data, model, cache=None):
+    """
+    Compare a chart's sections with those of the patient's last incremental
+    summary.
+
+    Args:
+        patient_data (dict): Patient data
+        model (str): LLM model name
+        cache (SummaryCache, optional): Section cache. Defaults to the
+                                        process-wide section cache.
+
+    Returns:
+        list: Names of sections that are new or changed (every section, if
+              the patient has no earlier summary)
+    """
+    cache = cache or get_section_cache()
+    previous = json.loads(cache.get(_manifest_key(patient_data["patient_id"])) or "{}")
+    return [
+        section.name
+        for section, chart in split_sections(patient_data)
+        if previous.get(section.name) != section_key(model, section, chart)
+    ]
+
+
+def _plan(generator, call, incremental):
+    """
+    Split the call's chart into sections, reusing cached drafts of unchanged
+    sections when ``incremental`` and preparing requests for the rest.
+
+    Returns:
+        list: One dict per section with "section", "key", "draft" (None
+              until drafted) and "request" (None for reused drafts)
+    """
+    cache = get_section_cache() if incremental else None
+    model = call["backends"][0].model
+    plan = []
+    with span(call["timings"], "section_prompt_build"):
+        for section, chart in split_sections(call["patient_data"]):
+            item = {"section": section, "key": None, "draft": None, "request": None}
+            if cache is not None:
+                item["key"] = section_key(model, section, chart)
+                item["draft"] = cache.get(item["key"])
+            if item["draft"] is None:
+                item["request"] = _section_request(generator, section, chart, model)
+            plan.append(item)
+
+    if cache is not None:
+        reused = [item["section"].name for item in plan if item["draft"] is not None]
+        call["sections_reused"] = len(reused)
+        if not reused:
+            logger.info(
+                f"No reusable sections for patient {call['patient_id']}; "
+                "drafting every section"
+            )
+        else:
+            # Drafts also go missing when evicted, so say what actually changed
+            changed = changed_sections(call["patient_data"], model, cache)
+            logger.info(
+                f"Sections changed since the last summary for patient "
+                f"{call['patient_id']}: {changed}; reusing {reused}, "
+                f"drafting {[i['section'].name for i in plan if i['draft'] is None]}"
+            )
+    return plan
+
+
+def _collect(drafted, responses):
+    """Fill in section drafts and sum the token usage of the section calls."""
+    usage = {"prompt_tokens": 0, "completion_tokens": 0, "cached_tokens": None}
+    for item, response in zip(drafted, responses):
+        item["draft"] = response.choices[0].message.content or ""
+        if response.usage is None:
+            usage["prompt_tokens"] += item["request"]["prompt_tokens"]
+            continue
+        usage["prompt_tokens"] += response.usage.prompt_tokens
+        usage["completion_tokens"] += response.usage.completion_tokens
+        cached = tokens.cached_prompt_tokens(response.usage)
+        if cached is not None:
+            usage["cached_tokens"] = (usage["cached_tokens"] or 0) + cached
+    return usage
+
+
+def _section_call(call):
+    """
+    Bookkeeping dict for one concurrent section call: a copy of ``call``
+    with its own retry count and serving backend, so that the section calls
+    do not write to the shared dict (see _merge_section_calls).
+    """
+    return {**call, "retries": 0, "wait_seconds": 0}
+
+
+def _merge_section_calls(call, section_calls):
+    """Fold the section calls' retries, rate-limit waits and backend into ``call``."""
+    for section_call in section_calls:
+        call["retries"] += section_call["retries"]
+        call["wait_seconds"] = (
+            call.get("wait_seconds", 0) + section_call["wait_seconds"]
+        )
+        # The merge call records the backend it is served by in turn
+        call["backend"], call["model"] = section_call["backend"], section_call["model"]
+
+
+def _finish(generator, call, plan, drafted, responses):
+    usage = _collect(drafted, responses)
+    if plan[0]["key"] is not None:
+        cache = get_section_cache()
+        for item in drafted:
+            cache.set(item["key"], item["draft"])
+        cache.set(
+            _manifest_key(call["patient_id"]),
+            json.dumps({item["section"].name: item["key"] for item in plan}),
+        )
+
+    drafts = [(item["section"].title, item["draft"]) for item in plan]
+    with span(call["timings"], "prompt_build"):
+        request = _merge_request(generator, call, drafts, call["backends"][0].model)
+    # Added to the merge call's usage when the summary is finalized
+    request["section_usage"] = usage
+    logger.debug(
+        f"Drafted {len(drafted)} of {len(plan)} sections for patient "
+        f"{call['patient_id']} ({usage['prompt_tokens']} prompt tokens); merging"
+    )
+    return request
+
+
+def prepare_request(generator, call, incremental=False):
+    """
+    Draft the chart's sections concurrently and prepare the merge request.
+
+    With ``incremental``, drafts of sections whose input is unchanged since
+    an earlier summary are taken from the section cache and only the other
+    sections are drafted; a patient with no cached drafts gets every section
+    drafted. Charts with no section data are prepared for a single-shot call
+    instead.
+
+    Args:
+        generator (DischargeSummaryGenerator): Generator making the calls
+        call (dict): The generation call's bookkeeping dict
+        incremental (bool): Reuse cached drafts of unchanged sections
+
+    Returns:
+        dict: Prepared merge request (see DischargeSummaryGenerator._prepare_request),
+              with the section calls' token usage under "section_usage"
+    """
+    plan = _plan(generator, call, incremental)
+    if not plan:
+        return generator._prepare_request(
+            call["patient_data"],
+            template=call["template"],
+            timings=call["timings"],
+            model=call["backends"][0].model,
+        )
+    drafted = [item for item in plan if item["draft"] is None]
+    section_calls = [_section_call(call) for _ in drafted]
+    responses = []
+    if drafted:
+        workers = max(1, min(len(drafted), MAP_REDUCE_CONCURRENCY))
+        with span(call["timings"], "map_sections"):
+            try:
+                with ThreadPoolExecutor(max_workers=workers) as executor:
+                    responses = list(
+                        executor.map(
+                            lambda item, section_call: generator._create_completion(
+                                item["request"], section_call, section=True
+                            ),
+                            drafted,
+                            section_calls,
+                        )
+                    )
+            finally:
+                _merge_section_calls(call, section_calls)
+    return _finish(generator, call, plan, drafted, responses)
+
+
+async def aprepare_request(generator, call, incremental=False):
+    """Async counterpart of prepare_request."""
+    plan = _plan(generator, call, incremental)
+    if not plan:
+        return generator._prepare_request(
+            call["patient_data"],
+            template=call["template"],
+            timings=call["timings"],
+            model=call["backends"][0].model,
+        )
+    drafted = [item for item in plan if item["draft"] is None]
+    section_calls = [_section_call(call) for _ in drafted]
+    semaphore = asyncio.Semaphore(max(1, MAP_REDUCE_CONCURRENCY))
+
+    async def draft(request, section_call):
+        async with semaphore:
+            return await generator._acreate_completion(
+                request, section_call, section=True
+            )
+
+    with span(call["timings"], "map_sections"):
+        try:
+            responses = await asyncio.gather(
+                *(
+                    draft(item["request"], section_call)
+                    for item, section_call in zip(drafted, section_calls)
+                )
+            )
+        finally:
+            _merge_section_calls(call, section_calls)
+    return _finish(generator, call, plan, drafted, responses)
@@ -0,0 +1,444 @@
+"""
+Latency-based model routing and hedged streaming.
+
+Every LLM call's latency (and, for streams, time to first token) and outcome
+are recorded per backend in a rolling window. When a call asks for the
+``auto`` backend (or the generator was created with model ``auto``), the
+router picks among MODEL_ROUTER_CANDIDATES, in their order of preference:
+the first healthy candidate whose p95 latency meets the template's SLO
+(TEMPLATE_LATENCY_SLOS, else MODEL_ROUTER_DEFAULT_SLO) wins. If none does,
+the healthy candidate with the lowest p95 wins. Candidates with too few
+samples count as meeting the SLO, so a new candidate gets tried. The other
+candidates follow as fallbacks.
+
+Routed streams can be hedged. If the chosen backend has not sent its first
+chunk within its p95 time to first token, the same request is also sent to
+the next candidate. Whichever stream starts first is used and the other is
+closed. This trades an occasional duplicate request for a shorter tail. The
+loser's real latency is never seen, so a lost race is not a latency sample:
+it counts as an SLO miss, and a backend losing more than 5% of its calls
+does not meet its SLO.
+
+Candidates are backend names (see llm.backends). Names that are not
+configured backends are taken as OpenAI model names.
+"""
+
+import json
+import queue
+import threading
+import time
+from collections import deque
+
+import numpy as np
+from loguru import logger
+
+from config import (
+    MODEL_ROUTER_CANDIDATES,
+    MODEL_ROUTER_DEFAULT_SLO,
+    MODEL_ROUTER_HEDGE,
+    MODEL_ROUTER_HEDGE_DELAY,
+    MODEL_ROUTER_MAX_ERROR_RATE,
+    MODEL_ROUTER_MIN_SAMPLES,
+    MODEL_ROUTER_WINDOW,
+    TEMPLATE_LATENCY_SLOS,
+)
+from . import backends
+
+AUTO = "auto"
+
+# Share of calls a p95 SLO lets run over it (here: lost hedge races)
+SLO_TAIL = 0.05
+
+
+class ModelStats:
+    """
+    Rolling latency, time-to-first-token and error samples for one backend.
+    """
+
+    def __init__(self, window=MODEL_ROUTER_WINDOW):
+        self.latencies = deque(maxlen=window)
+        self.first_tokens = deque(maxlen=window)
+        self.outcomes = deque(maxlen=window)
+        self.lost_races = deque(maxlen=window)
+
+    def record(self, latency=None, first_token=None, error=False, lost_race=False):
+        if latency is not None:
+            self.latencies.append(latency)
+        if first_token is not None:
+            self.first_tokens.append(first_token)
+        self.outcomes.append(not error)
+        self.lost_races.append(lost_race)
+
+    @staticmethod
+    def _percentile(samples, q):
+        return float(np.percentile(samples, q)) if samples else None
+
+    def p95_latency(self):
+        return self._percentile(list(self.latencies), 95)
+
+    def p95_first_token(self):
+        """p95 time to first token, or to the whole answer for non-streams."""
+        return self._percentile(list(self.first_tokens) or list(self.latencies), 95)
+
+    def error_rate(self):
+        if not self.outcomes:
+            return 0.0
+        return 1 - sum(self.outcomes) / len(self.outcomes)
+
+    def lost_race_rate(self):
+        """Share of calls cancelled after losing a hedge race."""
+        if not self.lost_races:
+            return 0.0
+        return sum(self.lost_races) / len(self.lost_races)
+
+    def meets_slo(self, slo):
+        """Whether the p95 latency meets ``slo``, counting lost races as misses."""
+        if self.lost_race_rate() > SLO_TAIL:
+            return False
+        p95 = self.p95_latency()
+        return p95 is None or p95 <= slo
+
+    def tail_rank(self):
+        """Sort key ordering backends from the shortest tail latency."""
+        p95 = self.p95_latency()
+        return (
+            self.lost_race_rate() > SLO_TAIL,
+            p95 if p95 is not None else float("inf"),
+        )
+
+    def snapshot(self):
+        return {
+            "samples": len(self.outcomes),
+            "p50_latency": self._percentile(list(self.latencies), 50),
+            "p95_latency": self.p95_latency(),
+            "p95_first_token": self.p95_first_token(),
+            "error_rate": round(self.error_rate(), 3),
+            "lost_race_rate": round(self.lost_race_rate(), 3),
+        }
+
+
+class ModelRouter:
+    """
+    Tracks per-backend latency and errors and picks backends for calls.
+    """
+
+    def __init__(
+        self,
+        candidates=MODEL_ROUTER_CANDIDATES,
+        slos=None,
+        default_slo=MODEL_ROUTER_DEFAULT_SLO,
+        min_samples=MODEL_ROUTER_MIN_SAMPLES,
+        max_error_rate=MODEL_ROUTER_MAX_ERROR_RATE,
+        hedge=MODEL_ROUTER_HEDGE,
+        hedge_delay=MODEL_ROUTER_HEDGE_DELAY,
+        window=MODEL_ROUTER_WINDOW,
+    ):
+        """
+        Args:
+            candidates (str or list): Backend (or OpenAI model) names, most
+                                      preferred first
+            slos (dict, optional): p95 latency SLO in seconds by template type.
+                                   Defaults to TEMPLATE_LATENCY_SLOS.
+            default_slo (float): SLO for templates without one
+            min_samples (int): Samples needed before a backend's stats count
+            max_error_rate (float): Error rate above which a backend is skipped
+            hedge (bool): Hedge routed streams
+            hedge_delay (float): Seconds before hedging while the chosen
+                                 backend has too few samples
+            window (int): Samples kept per backend
+        """
+        if isinstance(candidates, str):
+            candidates = [name.strip() for name in candidates.split(",")]
+        self.candidates = [name for name in candidates if name]
+        self.slos = slos if slos is not None else json.loads(TEMPLATE_LATENCY_SLOS)
+        self.default_slo = default_slo
+        self.min_samples = min_samples
+        self.max_error_rate = max_error_rate
+        self.hedge = hedge
+        self.hedge_delay = hedge_delay
+        self.window = window
+        self._stats = {}
+        self._backends = {}
+        self._lock = threading.Lock()
+
+    def _stats_for(self, name):
+        stats = self._stats.get(name)
+        if stats is None:
+            stats = self._stats[name] = ModelStats(self.window)
+        return stats
+
+    def record(
+        self, backend, latency=None, first_token=None, error=False, lost_race=False
+    ):
+        """
+        Record one call's outcome for a backend.
+
+        Args:
+            backend (str): Backend name
+            latency (float, optional): Seconds until the answer was complete
+            first_token (float, optional): Seconds until the first chunk
+            error (bool): Whether the call failed
+            lost_race (bool): Whether the call was cancelled after losing a
+                              hedge race (no latency is known for it)
+        """
+        with self._lock:
+            self._stats_for(backend).record(latency, first_token, error, lost_race)
+
+    def stats(self):
+        """Return a snapshot of every backend's rolling stats."""
+        with self._lock:
+            return {name: stats.snapshot() for name, stats in self._stats.items()}
+
+    def candidate_backends(self, api_key=None, base_url=None):
+        """
+        Resolve the candidates to backends. Names that are not configured
+        backends become OpenAI backends for that model, with the given
+        credentials.
+        """
+        resolved = []
+        for name in self.candidates:
+            try:
+                resolved.append(backends.get_backend(name))
+                continue
+            except backends.UnknownBackendError:
+                pass
+            key = (name, api_key, base_url)
+            with self._lock:
+                backend = self._backends.get(key)
+                if backend is None:
+                    backend = backends.OpenAIBackend(name, name, api_key, base_url)
+                    self._backends[key] = backend
+            resolved.append(backend)
+        return resolved
+
+    def choose(self, template_name, api_key=None, base_url=None):
+        """
+        Order the candidates for a call: the chosen backend first, then the
+        other healthy candidates by preference, then the unhealthy ones.
+
+        Args:
+            template_name (str): Template type, for its latency SLO
+            api_key (str, optional): Credentials for model-name candidates
+            base_url (str, optional): Base URL for model-name candidates
+
+        Returns:
+            list: Backends, best first
+        """
+        candidates = self.candidate_backends(api_key, base_url)
+        if not candidates:
+            raise backends.UnknownBackendError("No model router candidates")
+        slo = float(self.slos.get(template_name, self.default_slo))
+
+        with self._lock:
+            snapshots = {
+                backend.name: self._stats_for(backend.name) for backend in candidates
+            }
+            healthy, meets_slo = [], []
+            for backend in candidates:
+                stats = snapshots[backend.name]
+                if len(stats.outcomes) < self.min_samples:
+                    healthy.append(backend)
+                    meets_slo.append(backend)
+                    continue
+                if stats.error_rate() > self.max_error_rate:
+                    continue
+                healthy.append(backend)
+                if stats.meets_slo(slo):
+                    meets_slo.append(backend)
+
+            if meets_slo:
+                chosen = meets_slo[0]
+            elif healthy:
+                chosen = min(
+                    healthy, key=lambda backend: snapshots[backend.name].tail_rank()
+                )
+            else:
+                # Everything is failing; fall back to plain preference order
+                chosen = candidates[0]
+
+        ordered = [chosen]
+        ordered += [backend for backend in healthy if backend is not chosen]
+        ordered += [backend for backend in candidates if backend not in ordered]
+        logger.debug(
+            f"Routed {template_name} (SLO {slo:.1f}s) to {chosen.name}; "
+            f"then {[backend.name for backend in ordered[1:]]}"
+        )
+        return ordered
+
+    def hedge_after(self, backend):
+        """Seconds to wait for a backend's first chunk before hedging."""
+        with self._lock:
+            stats = self._stats_for(backend)
+            if len(stats.outcomes) < self.min_samples:
+                return self.hedge_delay
+            return stats.p95_first_token() or self.hedge_delay
+
+
+_END = object()
+
+
+class HedgedStream:
+    """
+    A chat completion stream raced against a hedge on a second backend.
+
+    Iterates over the chunks of whichever backend's stream starts first; the
+    other stream is closed. Each attempt keeps its own retry stats; only the
+    winner's are recorded into ``call``, with the backend that won. Both
+    backends' times are recorded with the generator's router.
+    """
+
+    def __init__(self, generator, request, call, delay, **params):
+        """
+        Start the request on the call's first backend.
+
+        Args:
+            generator (DischargeSummaryGenerator): Generator making the calls
+            request (dict): Prepared request
+            call (dict): The generation call's bookkeeping dict; its
+                         "backends" are the primary and the hedge
+            delay (float): Seconds to wait for the first chunk before hedging
+            **params: Extra completion parameters (stream=True is implied)
+        """
+        self._generator = generator
+        self._request = request
+        self._call = call
+        self._params = {**params, "stream": True}
+        self._delay = delay
+        self._queue = queue.Queue()
+        self._attempts = []
+        self._started = time.perf_counter()
+        self.winner = None
+        self._start(call["backends"][0])
+
+    def _start(self, backend):
+        attempt = {
+            "backend": backend,
+            "request": self._request,
+            # Its own copy, so the attempts do not race on the call's stats
+            "call": {**self._call, "retries": 0, "wait_seconds": 0},
+            "stream": None,
+            "cancelled": threading.Event(),
+            "started": time.perf_counter(),
+        }
+        self._attempts.append(attempt)
+        threading.Thread(target=self._run, args=(attempt,), daemon=True).start()
+
+    def _run(self, attempt):
+        """Pull one backend's stream into the shared queue."""
+        try:
+            # The hedge may use a model with another context window
+            attempt["request"] = self._generator._fit_request(
+                self._request, attempt["call"], attempt["backend"]
+            )
+            stream = self._generator._call_backend(
+                attempt["backend"], attempt["request"], attempt["call"], **self._params
+            )
+            attempt["stream"] = stream
+            try:
+                for chunk in stream:
+                    if attempt["cancelled"].is_set():
+                        return
+                    self._queue.put((attempt, chunk, None))
+            finally:
+                stream.close()
+        except Exception as e:
+            if not attempt["cancelled"].is_set():
+                self._queue.put((attempt, None, e))
+            return
+        self._queue.put((attempt, _END, None))
+
+    def _can_hedge(self):
+        return len(self._attempts) < min(2, len(self._call["backends"]))
+
+    def _hedge(self, reason):
+        backend = self._call["backends"][len(self._attempts)]
+        logger.info(
+            f"Hedging {self._attempts[0]['backend'].name} with {backend.name} "
+            f"for patient {self._call['patient_id']} ({reason})"
+        )
+        self._start(backend)
+
+    def _record_stats(self, attempt):
+        """Fold an attempt's retries and rate-limit waits into the call."""
+        self._call["retries"] += attempt["call"]["retries"]
+        self._call["wait_seconds"] = (
+            self._call.get("wait_seconds", 0) + attempt["call"]["wait_seconds"]
+        )
+
+    def _win(self, attempt):
+        self.winner = attempt
+        attempt["first_chunk"] = time.perf_counter() - attempt["started"]
+        backend = attempt["backend"]
+        self._call["backend"], self._call["model"] = backend.name, backend.model
+        self._record_stats(attempt)
+        self._request.update(attempt["request"])
+        for other in self._attempts:
+            if other is not attempt:
+                # Lost the race: its latency is unknown (only bounded below),
+                # so it counts as an SLO miss rather than a latency sample
+                self._generator.router.record(other["backend"].name, lost_race=True)
+                other["cancelled"].set()
+                if other["stream"] is not None:
+                    try:
+                        other["stream"].close()
+                    except Exception:
+                        pass
+                logger.debug(f"Cancelled hedged request to {other['backend'].name}")
+
+    def __iter__(self):
+        failed = 0
+        while True:
+            timeout = None
+            if self.winner is None and self._can_hedge():
+                timeout = max(0.0, self._delay - (time.perf_counter() - self._started))
+            try:
+                attempt, chunk, error = self._queue.get(timeout=timeout)
+            except queue.Empty:
+                self._hedge(f"no first token after {self._delay:.2f}s")
+                continue
+            if self.winner is not None and attempt is not self.winner:
+                continue
+            if error is not None:
+                failed += 1
+                if self.winner is None and self._can_hedge():
+                    self._hedge(type(error).__name__)
+                    continue
+                if self.winner is None and failed < len(self._attempts):
+                    # The other request is still running
+                    continue
+                if self.winner is None:
+                    self._record_stats(attempt)
+                raise error
+            if self.winner is None:
+                self._win(attempt)
+            if chunk is _END:
+                self._generator.router.record(
+                    attempt["backend"].name,
+                    time.perf_counter() - attempt["started"],
+                    attempt["first_chunk"],
+                )
+                return
+            yield chunk
+
+    def close(self):
+        """Close every stream still open."""
+        for attempt in self._attempts:
+            attempt["cancelled"].set()
+            if attempt["stream"] is not None:
+                try:
+                    attempt["stream"].close()
+                except Exception:
+                    pass
+
+
+_default_router = None
+_default_router_lock = threading.Lock()
+
+
+def get_default_router():
+    """Return the process-wide model router."""
+    global _default_router
+    with _default_router_lock:
+        if _default_router is None:
+            _default_router = ModelRouter()
+        return _default_router
@@ -1,8 +1,24 @@
 """
 Prompt templates for discharge summary generation.
 These templates are designed for specific medical contexts.
+
+Templates are written as a single text with a ``{patient_data}`` placeholder,
+which keeps them easy to edit (see the Prompt Editor page). Before use they
+are compiled with ``compile_template``: everything except the patient data
+becomes a static instruction block that is byte-identical on every call for
+that template, and the patient data is sent last. Providers that cache
+prompt prefixes can then reuse the instructions across patients.
 """
 
+from collections import namedtuple
+from functools import lru_cache
+
+PATIENT_DATA_PLACEHOLDER = "{patient_data}"
+DEFAULT_DATA_HEADING = "Patient Data:"
+
+# Static instructions of a template, and the heading placed before the data
+CompiledTemplate = namedtuple("CompiledTemplate", ["instructions", "data_heading"])
+
 # Base discharge summary prompt template
 BASE_TEMPLATE = """
 You are an experienced medical professional tasked with creating a discharge summary letter for a patient.
@@ -99,6 +115,26 @@ TEMPLATE_MAP = {
 }
 
 
+def get_template_type_by_diagnosis(diagnosis_code):
+    """
+    Select an appropriate template type based on the diagnosis code.
+
+    Uses the ICD-10 rules of the routing table (see llm.routing); routing a
+    whole chart with ``routing.route`` also considers secondary diagnoses,
+    DRG codes and encounters.
+
+    Args:
+        diagnosis_code (str): ICD-10 diagnosis code
+
+    Returns:
+        str: The template type (a TEMPLATE_MAP key)
+    """
+    # Imported here: the routing module validates rules against TEMPLATE_MAP
+    from .routing import get_routing_table
+
+    return get_routing_table().route_code(diagnosis_code)
+
+
 def get_template_by_diagnosis(diagnosis_code):
     """
     Select an appropriate template based on the diagnosis code.
@@ -109,12 +145,35 @@ def get_template_by_diagnosis(diagnosis_code):
     Returns:
         str: The appropriate prompt template
     """
-    # I codes generally indicate cardiovascular conditions
-    if diagnosis_code.startswith("I2"):
-        return TEMPLATE_MAP["cardiac"]
-    # J codes indicate respiratory conditions
-    elif diagnosis_code.startswith("J"):
-        return TEMPLATE_MAP["respiratory"]
-    # Fallback to general template
-    else:
-        return TEMPLATE_MAP["general"]
+    return TEMPLATE_MAP[get_template_type_by_diagnosis(diagnosis_code)]
+
+
+@lru_cache(maxsize=64)
+def compile_template(template):
+    """
+    Split a template into its static instructions and patient data heading.
+
+    Instructions that follow the ``{patient_data}`` placeholder (such as the
+    specialty guidance appended to BASE_TEMPLATE) are moved ahead of the
+    data, so the instructions form one stable block. A heading line ending in
+    ":" directly above the placeholder (e.g. "Patient Data:") is kept with
+    the data. Compiled results are cached per template text, so edited
+    templates compile once too.
+
+    Args:
+        template (str): Template text with a {patient_data} placeholder
+
+    Returns:
+        CompiledTemplate: (instructions, data_heading)
+    """
+    head, placeholder, tail = template.partition(PATIENT_DATA_PLACEHOLDER)
+    data_heading = DEFAULT_DATA_HEADING
+    if placeholder:
+        lines = head.rstrip().splitlines()
+        if lines and lines[-1].strip().endswith(":"):
+            data_heading = lines.pop().strip()
+        head = "\n".join(lines)
+    instructions = "\n\n".join(part.strip() for part in (head, tail) if part.strip())
+    # Templates used to go through str.format, so honour its brace escapes
+    instructions = instructions.replace("{{", "{").replace("}}", "}")
+    return CompiledTemplate(instructions, data_heading)
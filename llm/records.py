@@ -0,0 +1,224 @@
+"""
+Validated patient record model.
+
+Charts arrive in several schema variants: ``discharge_date`` or
+``expected_discharge_date``, ``notes`` entries with ``content`` or
+``ward_round_notes`` entries with ``note``. ``PatientRecord`` validates a
+chart once, when it is loaded, and resolves those variants behind one set
+of attributes. Sections the model does not know about are kept as they are.
+"""
+
+import json
+from typing import Any, Dict, List, Optional
+
+from pydantic import (
+    BaseModel,
+    ConfigDict,
+    Field,
+    PrivateAttr,
+    ValidationError,
+    field_validator,
+)
+
+
+class InvalidPatientRecord(ValueError):
+    """Raised when patient data does not match the expected chart structure."""
+
+    def __init__(self, message, errors=None):
+        super().__init__(message)
+        self.errors = errors or []
+
+
+def _format_errors(error):
+    """One-line description of a pydantic ValidationError."""
+    problems = [
+        f"{'.'.join(str(part) for part in e['loc']) or 'record'}: {e['msg']}"
+        for e in error.errors()[:5]
+    ]
+    more = error.error_count() - len(problems)
+    if more > 0:
+        problems.append(f"and {more} more")
+    return "Invalid patient record: " + "; ".join(problems)
+
+
+class _Section(BaseModel):
+    model_config = ConfigDict(extra="allow", coerce_numbers_to_str=True)
+
+
+class Demographics(_Section):
+    name: Optional[str] = None
+    age: Optional[int] = None
+    gender: Optional[str] = None
+    admission_date: Optional[str] = None
+    discharge_date: Optional[str] = None
+    expected_discharge_date: Optional[str] = None
+
+
+class Diagnosis(_Section):
+    diagnosis_code: str
+    date: Optional[str] = None
+    description: Optional[str] = None
+
+
+class ClinicalNote(_Section):
+    """A ``notes`` or ``ward_round_notes`` entry."""
+
+    date: Optional[str] = None
+    time: Optional[str] = None
+    author: Optional[str] = None
+    note_type: Optional[str] = None
+    content: Optional[str] = None
+    note: Optional[str] = None
+
+    @property
+    def text(self):
+        return self.content or self.note or ""
+
+
+class PatientRecord(_Section):
+    """
+    A validated patient chart.
+
+    Build one with ``from_dict`` (or ``as_record``) for charts already parsed
+    into a dict, or ``from_json`` to validate JSON text directly.
+    """
+
+    patient_id: str
+    patient_demographics: Demographics = Field(default_factory=Demographics)
+    diagnoses: List[Diagnosis] = []
+    encounters: List[Dict[str, Any]] = []
+    flowsheets: List[Dict[str, Any]] = []
+    labs: List[Dict[str, Any]] = []
+    med_orders: List[Dict[str, Any]] = []
+    notes: List[ClinicalNote] = []
+    ward_round_notes: List[ClinicalNote] = []
+
+    _data: Optional[dict] = PrivateAttr(default=None)
+    _json: Optional[str] = PrivateAttr(default=None)
+
+    @field_validator("patient_id")
+    @classmethod
+    def _patient_id_not_blank(cls, value):
+        value = value.strip()
+        if not value:
+            raise ValueError("must not be blank")
+        return value
+
+    @classmethod
+    def from_dict(cls, data):
+        """
+        Validate a chart dict, keeping the dict as the record's ``data``.
+
+        Raises:
+            InvalidPatientRecord: If the chart is malformed
+        """
+        if not isinstance(data, dict):
+            raise InvalidPatientRecord("Patient record is not a JSON object")
+        try:
+            record = cls.model_validate(data)
+        except ValidationError as e:
+            raise InvalidPatientRecord(_format_errors(e), e.errors()) from e
+        record._data = data
+        return record
+
+    @classmethod
+    def from_json(cls, text):
+        """
+        Parse and validate a chart from JSON text in one pass.
+
+        The text is kept so ``data`` can be rebuilt exactly as written, and
+        only for records that are actually used.
+
+        Raises:
+            InvalidPatientRecord: If the text is not valid JSON or the chart
+                                  is malformed
+        """
+        try:
+            record = cls.model_validate_json(text)
+        except ValidationError as e:
+            raise InvalidPatientRecord(_format_errors(e), e.errors()) from e
+        record._json = text
+        return record
+
+    @property
+    def data(self):
+        """The chart as a plain dict, as sent to the LLM."""
+        if self._data is None:
+            if self._json is not None:
+                self._data = json.loads(self._json)
+                self._json = None
+            else:
+                self._data = self.model_dump(mode="json", exclude_unset=True)
+        return self._data
+
+    @property
+    def primary_diagnosis(self):
+        return self.diagnoses[0] if self.diagnoses else None
+
+    @property
+    def diagnosis_code(self):
+        """The primary ICD-10 diagnosis code, or "" if there is none."""
+        diagnosis = self.primary_diagnosis
+        return diagnosis.diagnosis_code if diagnosis else ""
+
+    @property
+    def drg_code(self):
+        """The DRG code (``drg`` may be a {"code": ...} object or the code)."""
+        drg = (self.model_extra or {}).get("drg")
+        if isinstance(drg, dict):
+            drg = drg.get("code")
+        return str(drg).strip() if drg not in (None, "") else ""
+
+    @property
+    def discharge_date(self):
+        """The discharge date, or the expected one for a current admission."""
+        demographics = self.patient_demographics
+        return demographics.discharge_date or demographics.expected_discharge_date
+
+    @property
+    def discharge_is_expected(self):
+        demographics = self.patient_demographics
+        return not demographics.discharge_date and bool(
+            demographics.expected_discharge_date
+        )
+
+    @property
+    def clinical_notes(self):
+        """Entries from ``notes`` and ``ward_round_notes``, ordered by date."""
+        return sorted(
+            self.notes + self.ward_round_notes, key=lambda note: note.date or ""
+        )
+
+
+def as_record(patient_data):
+    """
+    Return a PatientRecord for a chart dict (or an existing record).
+
+    Raises:
+        InvalidPatientRecord: If the chart is malformed
+    """
+    if isinstance(patient_data, PatientRecord):
+        return patient_data
+    return PatientRecord.from_dict(patient_data)
+
+
+def validate_jsonl(lines):
+    """
+    Validate JSON-lines input, one chart per line.
+
+    Each line is parsed and validated in a single pass by pydantic's native
+    JSON parser, without building an intermediate dict.
+
+    Args:
+        lines (iterable): Lines of text or bytes
+
+    Yields:
+        tuple: (line number, PatientRecord or None, error message or None)
+    """
+    for line_number, line in enumerate(lines, start=1):
+        if not line.strip():
+            continue
+        try:
+            yield line_number, PatientRecord.from_json(line), None
+        except InvalidPatientRecord as e:
+            yield line_number, None, str(e)
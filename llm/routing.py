@@ -0,0 +1,323 @@
+"""
+Rule-based template routing.
+
+Which prompt template a chart gets is decided by a declarative table of
+rules (``routing_rules.json`` by default, see ROUTING_RULES_PATH). Each rule
+names a template and a priority, and matches a chart by any of:
+
+    icd10            ICD-10 codes, category prefixes or ranges ("I60-I64"),
+                     checked against every diagnosis (or only the primary
+                     one, with ``"diagnoses": "primary"``)
+    drg              DRG codes or numeric ranges ("280-316")
+    encounter_types  Encounter types (case-insensitive)
+    min_med_orders   A minimum number of medication orders
+
+The matching rule with the highest priority wins; ties go to the rule that
+matched the earlier diagnosis, then to the more specific ICD-10 prefix, then
+to the rule listed first. Charts no rule matches get the table's default.
+
+ICD-10 entries are compiled into a prefix trie, so looking up a code walks
+at most ``len(code)`` nodes however many rules there are. The rules file is
+re-read whenever its modification time changes, so routing can be adjusted
+while the app is running.
+"""
+
+import json
+import os
+import threading
+from collections import namedtuple
+from pathlib import Path
+
+from loguru import logger
+
+from config import ROUTING_RULES_PATH
+from .prompt_templates import TEMPLATE_MAP
+from .records import as_record
+
+DEFAULT_RULES_PATH = Path(__file__).with_name("routing_rules.json")
+
+# The template chosen for a chart, the rule that chose it (None for the
+# default) and what matched, e.g. "icd10:I61.9"
+RouteDecision = namedtuple("RouteDecision", ["template", "rule", "matched"])
+
+_Rule = namedtuple("_Rule", ["name", "template", "priority", "order", "primary_only"])
+
+
+class RoutingRulesError(ValueError):
+    """Raised when a routing table is malformed."""
+
+
+def _normalize_code(code):
+    """Upper-case an ICD-10 code and drop its dot ("i61.9" -> "I619")."""
+    return str(code).strip().upper().replace(".", "")
+
+
+def _expand_numeric(prefix, low, high):
+    """Codes ``prefix + n`` for n from low to high, zero-padded to their width."""
+    if not (low.isdigit() and high.isdigit()) or len(low) != len(high):
+        raise RoutingRulesError(f"Unsupported code range {prefix}{low}-{prefix}{high}")
+    if int(low) > int(high):
+        raise RoutingRulesError(f"Empty code range {prefix}{low}-{prefix}{high}")
+    return [f"{prefix}{n:0{len(low)}d}" for n in range(int(low), int(high) + 1)]
+
+
+def expand_icd10_range(entry):
+    """
+    Expand an ICD-10 entry into the code prefixes it covers.
+
+    A range's ends must have the same length and may differ in their leading
+    letter ("C00-D49" covers C00-C99 and D00-D49).
+
+    Args:
+        entry (str): A code or prefix ("I61", "T78.2") or a range ("I60-I64")
+
+    Returns:
+        list: Normalized code prefixes
+
+    Raises:
+        RoutingRulesError: If the range is malformed
+    """
+    start, _, end = entry.partition("-")
+    start, end = _normalize_code(start), _normalize_code(end or start)
+    if not start or len(start) != len(end):
+        raise RoutingRulesError(f"Malformed ICD-10 range {entry!r}")
+    if start == end:
+        return [start]
+    common = os.path.commonprefix([start, end])
+    if common or start[0].isdigit():
+        return _expand_numeric(common, start[len(common) :], end[len(common) :])
+    if start[0] > end[0]:
+        raise RoutingRulesError(f"Empty ICD-10 range {entry!r}")
+    width = len(start) - 1
+    prefixes = []
+    for letter in map(chr, range(ord(start[0]), ord(end[0]) + 1)):
+        low = start[1:] if letter == start[0] else "0" * width
+        high = end[1:] if letter == end[0] else "9" * width
+        prefixes.extend(_expand_numeric(letter, low, high))
+    return prefixes
+
+
+def _expand_drg_range(entry):
+    start, _, end = str(entry).strip().partition("-")
+    if not end:
+        return [start.zfill(3)]
+    return _expand_numeric("", start.zfill(3), end.strip().zfill(3))
+
+
+class _TrieNode:
+    __slots__ = ("children", "rules")
+
+    def __init__(self):
+        self.children = {}
+        self.rules = []
+
+
+class RoutingTable:
+    """
+    A compiled routing table.
+    """
+
+    def __init__(self, spec, source=None):
+        """
+        Compile a routing table.
+
+        Args:
+            spec (dict): {"default": template, "rules": [rule, ...]}
+            source (str, optional): Where the spec came from, for messages
+
+        Raises:
+            RoutingRulesError: If a rule is malformed or names an unknown
+                               template
+        """
+        if not isinstance(spec, dict) or not isinstance(spec.get("rules", []), list):
+            raise RoutingRulesError("Routing rules must be an object with a rules list")
+        self.source = source
+        self.default = spec.get("default", "general")
+        if self.default not in TEMPLATE_MAP:
+            raise RoutingRulesError(f"Unknown default template {self.default!r}")
+
+        self._trie = _TrieNode()
+        self._drg = {}
+        self._encounter_types = {}
+        self._med_order_rules = []
+        self.rules = []
+        for order, rule_spec in enumerate(spec.get("rules", [])):
+            self._add_rule(order, rule_spec)
+
+    def _add_rule(self, order, spec):
+        if not isinstance(spec, dict):
+            raise RoutingRulesError(f"Rule {order + 1} is not an object")
+        template = spec.get("template")
+        name = spec.get("name") or f"rule {order + 1}"
+        if template not in TEMPLATE_MAP:
+            raise RoutingRulesError(f"{name}: unknown template {template!r}")
+        scope = spec.get("diagnoses", "any")
+        if scope not in ("any", "primary"):
+            raise RoutingRulesError(f"{name}: diagnoses must be 'any' or 'primary'")
+        try:
+            priority = int(spec.get("priority", 0))
+            min_med_orders = spec.get("min_med_orders")
+            if min_med_orders is not None:
+                min_med_orders = int(min_med_orders)
+        except (TypeError, ValueError):
+            raise RoutingRulesError(
+                f"{name}: priority and min_med_orders must be integers"
+            ) from None
+        rule = _Rule(name, template, priority, order, scope == "primary")
+        self.rules.append(rule)
+
+        for entry in spec.get("icd10", []):
+            for prefix in expand_icd10_range(str(entry)):
+                node = self._trie
+                for char in prefix:
+                    node = node.children.setdefault(char, _TrieNode())
+                node.rules.append(rule)
+        for entry in spec.get("drg", []):
+            for code in _expand_drg_range(entry):
+                self._drg.setdefault(code, []).append(rule)
+        for encounter_type in spec.get("encounter_types", []):
+            key = str(encounter_type).strip().lower()
+            self._encounter_types.setdefault(key, []).append(rule)
+        if min_med_orders is not None:
+            self._med_order_rules.append((min_med_orders, rule))
+
+    @classmethod
+    def load(cls, path):
+        """
+        Load and compile a routing table from a JSON file.
+
+        Raises:
+            RoutingRulesError: If the file is not valid JSON or a rule is
+                               malformed
+        """
+        try:
+            with open(path, "r") as f:
+                spec = json.load(f)
+        except json.JSONDecodeError as e:
+            raise RoutingRulesError(f"Invalid routing rules in {path}: {e}") from e
+        return cls(spec, source=str(path))
+
+    def _icd10_matches(self, code):
+        """Rules whose ICD-10 prefixes match a code, with the prefix length."""
+        node = self._trie
+        matches = []
+        for depth, char in enumerate(_normalize_code(code), start=1):
+            node = node.children.get(char)
+            if node is None:
+                break
+            matches.extend((rule, depth) for rule in node.rules)
+        return matches
+
+    def route_code(self, diagnosis_code):
+        """
+        Route on a single (primary) ICD-10 diagnosis code.
+
+        Returns:
+            str: The template type
+        """
+        best = max(
+            self._icd10_matches(diagnosis_code or ""),
+            key=lambda match: (match[0].priority, match[1], -match[0].order),
+            default=None,
+        )
+        return best[0].template if best else self.default
+
+    def route(self, patient_data):
+        """
+        Route a chart to a template.
+
+        Args:
+            patient_data (dict or PatientRecord): Patient data
+
+        Returns:
+            RouteDecision: The chosen template and why
+
+        Raises:
+            InvalidPatientRecord: If the chart is malformed
+        """
+        record = as_record(patient_data)
+        # (priority, -diagnosis position, prefix length, -rule order)
+        candidates = []
+
+        def consider(rule, matched, position=0, depth=0):
+            candidates.append(
+                ((rule.priority, -position, depth, -rule.order), rule, matched)
+            )
+
+        for position, diagnosis in enumerate(record.diagnoses):
+            for rule, depth in self._icd10_matches(diagnosis.diagnosis_code):
+                if position == 0 or not rule.primary_only:
+                    consider(rule, f"icd10:{diagnosis.diagnosis_code}", position, depth)
+
+        drg_code = record.drg_code
+        if drg_code:
+            for rule in self._drg.get(drg_code.zfill(3), []):
+                consider(rule, f"drg:{drg_code}")
+
+        for encounter in record.encounters:
+            encounter_type = str(encounter.get("type") or "").strip().lower()
+            for rule in self._encounter_types.get(encounter_type, []):
+                consider(rule, f"encounter:{encounter.get('type')}")
+
+        for minimum, rule in self._med_order_rules:
+            if len(record.med_orders) >= minimum:
+                consider(rule, f"med_orders:{len(record.med_orders)}")
+
+        if not candidates:
+            return RouteDecision(self.default, None, "default")
+        _, rule, matched = max(candidates, key=lambda candidate: candidate[0])
+        return RouteDecision(rule.template, rule.name, matched)
+
+
+_tables = {}
+_tables_lock = threading.Lock()
+
+
+def get_routing_table(path=None):
+    """
+    Return the compiled routing table for a rules file, reloading it if the
+    file has changed since it was last compiled.
+
+    A file that fails to load or compile is logged and the previously
+    compiled table is kept (the bundled rules, if there is none).
+
+    Args:
+        path (str, optional): Rules file. Defaults to ROUTING_RULES_PATH, or
+                              the bundled routing_rules.json
+
+    Returns:
+        RoutingTable: The compiled table
+    """
+    path = Path(path or ROUTING_RULES_PATH or DEFAULT_RULES_PATH)
+    try:
+        stat = os.stat(path)
+        signature = (stat.st_mtime_ns, stat.st_size)
+    except OSError:
+        signature = None
+
+    with _tables_lock:
+        cached = _tables.get(path)
+        if cached is not None and cached[0] == signature:
+            return cached[1]
+        table = None
+        if signature is not None:
+            try:
+                table = RoutingTable.load(path)
+                logger.info(f"Loaded {len(table.rules)} routing rules from {path}")
+            except (OSError, RoutingRulesError) as e:
+                logger.error(f"Keeping previous routing rules: {e}")
+        else:
+            logger.warning(f"Routing rules file {path} not found")
+        if table is None:
+            table = (
+                cached[1]
+                if cached is not None
+                else RoutingTable.load(DEFAULT_RULES_PATH)
+            )
+        _tables[path] = (signature, table)
+        return table
+
+
+def route(patient_data):
+    """Route a chart with the current routing table (see RoutingTable.route)."""
+    return get_routing_table().route(patient_data)
@@ -0,0 +1,361 @@
+"""
+Rate-limit-aware request scheduling for LLM calls.
+
+All calls in the process share one scheduler, which paces requests with
+token buckets for requests/min and tokens/min, retries transient failures
+with exponential backoff and jitter (honoring Retry-After and the
+x-ratelimit-* headers), and trips a circuit breaker when the provider keeps
+failing.
+"""
+
+import asyncio
+import random
+import re
+import threading
+import time
+
+import openai
+from loguru import logger
+
+from config import (
+    RATE_LIMIT_RPM,
+    RATE_LIMIT_TPM,
+    LLM_MAX_RETRIES,
+    RETRY_BASE_DELAY,
+    RETRY_MAX_DELAY,
+    CIRCUIT_FAILURE_THRESHOLD,
+    CIRCUIT_RESET_TIMEOUT,
+)
+
+RETRYABLE_STATUS_CODES = {408, 409, 429}
+
+_DURATION_PART = re.compile(r"([\d.]+)(ms|h|m|s)")
+
+
+class CircuitOpenError(RuntimeError):
+    """Raised when the circuit breaker is open and calls are being rejected."""
+
+    def __init__(self, retry_after):
+        super().__init__(
+            f"LLM circuit breaker is open; retry in {retry_after:.1f} seconds"
+        )
+        self.retry_after = retry_after
+
+
+def parse_duration(value):
+    """
+    Parse a rate-limit reset duration such as "1s", "6m0s" or "20ms".
+
+    Returns:
+        float or None: Duration in seconds, or None if it cannot be parsed
+    """
+    if not value:
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    seconds = 0.0
+    matched = False
+    for amount, unit in _DURATION_PART.findall(value):
+        matched = True
+        seconds += float(amount) * {"ms": 0.001, "s": 1, "m": 60, "h": 3600}[unit]
+    return seconds if matched else None
+
+
+class TokenBucket:
+    """
+    Token bucket refilled continuously at ``per_minute / 60`` units per second.
+
+    Callers reserve capacity up front and are told how long to wait, which
+    lets the same bucket serve threads and coroutines. A bucket with a
+    non-positive rate never limits.
+    """
+
+    def __init__(self, per_minute):
+        self.capacity = float(per_minute)
+        self.rate = self.capacity / 60.0
+        self._level = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self, now):
+        self._level = min(
+            self.capacity, self._level + (now - self._updated) * self.rate
+        )
+        self._updated = now
+
+    def reserve(self, amount):
+        """
+        Debit ``amount`` from the bucket.
+
+        Returns:
+            float: Seconds the caller must wait before sending
+        """
+        if self.capacity <= 0:
+            return 0.0
+        amount = min(float(amount), self.capacity)
+        with self._lock:
+            self._refill(time.monotonic())
+            self._level -= amount
+            return max(0.0, -self._level / self.rate)
+
+    def limit_to(self, remaining):
+        """Lower the bucket level to what the provider reports as remaining."""
+        if self.capacity <= 0 or remaining is None:
+            return
+        with self._lock:
+            self._refill(time.monotonic())
+            self._level = min(self._level, float(remaining))
+
+
+class CircuitBreaker:
+    """
+    Stops sending requests after repeated failures.
+
+    After ``failure_threshold`` consecutive failures the breaker opens and
+    rejects calls for ``reset_timeout`` seconds, then lets a single trial call
+    through (half-open). A success closes it again; a failure reopens it.
+    """
+
+    def __init__(
+        self,
+        failure_threshold=CIRCUIT_FAILURE_THRESHOLD,
+        reset_timeout=CIRCUIT_RESET_TIMEOUT,
+    ):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = "closed"
+        self._failures = 0
+        self._opened_at = 0.0
+        self._trial_in_flight = False
+        self._lock = threading.Lock()
+
+    def check(self):
+        """Raise CircuitOpenError if a call may not be made right now."""
+        with self._lock:
+            if self.state == "closed":
+                return
+            remaining = self._opened_at + self.reset_timeout - time.monotonic()
+            if self.state == "open" and remaining <= 0:
+                self.state = "half_open"
+                self._trial_in_flight = False
+            if self.state == "half_open" and not self._trial_in_flight:
+                self._trial_in_flight = True
+                return
+            raise CircuitOpenError(max(remaining, 0.0))
+
+    def record_success(self):
+        with self._lock:
+            if self.state != "closed":
+                logger.info("LLM circuit breaker closed")
+            self.state = "closed"
+            self._failures = 0
+            self._trial_in_flight = False
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            if self.state == "half_open" or self._failures >= self.failure_threshold:
+                if self.state != "open":
+                    logger.warning(
+                        f"LLM circuit breaker opened after {self._failures} failures"
+                    )
+                self.state = "open"
+                self._opened_at = time.monotonic()
+                self._trial_in_flight = False
+
+
+class RequestScheduler:
+    """
+    Shared scheduler that paces, retries and guards LLM API calls.
+    """
+
+    def __init__(
+        self,
+        requests_per_minute=RATE_LIMIT_RPM,
+        tokens_per_minute=RATE_LIMIT_TPM,
+        max_retries=LLM_MAX_RETRIES,
+        base_delay=RETRY_BASE_DELAY,
+        max_delay=RETRY_MAX_DELAY,
+        breaker=None,
+    ):
+        """
+        Initialize the scheduler.
+
+        Args:
+            requests_per_minute (int): Request budget (0 disables the limit)
+            tokens_per_minute (int): Token budget (0 disables the limit)
+            max_retries (int): Retries for transient failures
+            base_delay (float): Initial backoff delay in seconds
+            max_delay (float): Maximum backoff delay in seconds
+            breaker (CircuitBreaker, optional): Circuit breaker to use
+        """
+        self.request_bucket = TokenBucket(requests_per_minute / _rate_shares)
+        self.token_bucket = TokenBucket(tokens_per_minute / _rate_shares)
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.breaker = breaker or CircuitBreaker()
+
+    @staticmethod
+    def is_retryable(error):
+        """Return True for rate limits, timeouts, connection errors and 5xx."""
+        if isinstance(error, openai.APIConnectionError):
+            return True
+        if isinstance(error, openai.APIStatusError):
+            return (
+                error.status_code in RETRYABLE_STATUS_CODES or error.status_code >= 500
+            )
+        return False
+
+    def observe_headers(self, headers):
+        """Align the local buckets with the provider's x-ratelimit-* headers."""
+        if not headers:
+            return
+        for header, bucket in (
+            ("x-ratelimit-remaining-requests", self.request_bucket),
+            ("x-ratelimit-remaining-tokens", self.token_bucket),
+        ):
+            value = headers.get(header)
+            if value is not None:
+                try:
+                    bucket.limit_to(float(value))
+                except ValueError:
+                    pass
+
+    def _retry_delay(self, error, attempt):
+        """Seconds to wait before retrying after ``error`` on ``attempt``."""
+        headers = getattr(getattr(error, "response", None), "headers", None) or {}
+        self.observe_headers(headers)
+
+        retry_after = None
+        if headers.get("retry-after-ms"):
+            retry_after = parse_duration(headers["retry-after-ms"] + "ms")
+        if retry_after is None:
+            retry_after = parse_duration(headers.get("retry-after"))
+        if retry_after is None and getattr(error, "status_code", None) == 429:
+            resets = [
+                parse_duration(headers.get("x-ratelimit-reset-requests")),
+                parse_duration(headers.get("x-ratelimit-reset-tokens")),
+            ]
+            resets = [r for r in resets if r is not None]
+            retry_after = max(resets) if resets else None
+        if retry_after is not None:
+            return min(retry_after, self.max_delay)
+
+        # Exponential backoff with full jitter
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2**attempt))
+
+    def _before_attempt(self, tokens):
+        """Check the breaker and reserve capacity; return seconds to wait."""
+        self.breaker.check()
+        return max(self.request_bucket.reserve(1), self.token_bucket.reserve(tokens))
+
+    def _after_error(self, error, attempt, stats):
+        """Record a failed attempt; return the retry delay or re-raise."""
+        if not self.is_retryable(error):
+            # The provider answered; the request itself was bad
+            self.breaker.record_success()
+            raise error
+        self.breaker.record_failure()
+        if attempt >= self.max_retries:
+            raise error
+        delay = self._retry_delay(error, attempt)
+        if stats is not None:
+            stats["retries"] = stats.get("retries", 0) + 1
+        logger.warning(
+            f"LLM call failed ({type(error).__name__}); retry {attempt + 1}/"
+            f"{self.max_retries} in {delay:.2f}s"
+        )
+        return delay
+
+    def _after_success(self, result):
+        self.breaker.record_success()
+        self.observe_headers(getattr(result, "headers", None))
+        return result
+
+    def call(self, fn, tokens=0, stats=None):
+        """
+        Run a blocking LLM call under the rate limits with retries.
+
+        Args:
+            fn (callable): Zero-argument function making the API call
+            tokens (int): Tokens the call counts against tokens/min
+            stats (dict, optional): Updated with "retries" and "wait_seconds"
+
+        Returns:
+            The result of ``fn``
+        """
+        attempt = 0
+        while True:
+            wait = self._before_attempt(tokens)
+            if wait:
+                if stats is not None:
+                    stats["wait_seconds"] = stats.get("wait_seconds", 0) + wait
+                time.sleep(wait)
+            try:
+                result = fn()
+            except Exception as e:
+                time.sleep(self._after_error(e, attempt, stats))
+                attempt += 1
+                continue
+            return self._after_success(result)
+
+    async def acall(self, fn, tokens=0, stats=None):
+        """
+        Run an async LLM call under the rate limits with retries.
+
+        Args:
+            fn (callable): Zero-argument function returning an awaitable
+            tokens (int): Tokens the call counts against tokens/min
+            stats (dict, optional): Updated with "retries" and "wait_seconds"
+
+        Returns:
+            The awaited result of ``fn``
+        """
+        attempt = 0
+        while True:
+            wait = self._before_attempt(tokens)
+            if wait:
+                if stats is not None:
+                    stats["wait_seconds"] = stats.get("wait_seconds", 0) + wait
+                await asyncio.sleep(wait)
+            try:
+                result = await fn()
+            except Exception as e:
+                await asyncio.sleep(self._after_error(e, attempt, stats))
+                attempt += 1
+                continue
+            return self._after_success(result)
+
+
+_default_scheduler = None
+_default_scheduler_lock = threading.Lock()
+_rate_shares = 1
+
+
+def share_rate_limits(shares):
+    """
+    Split the rate limits with ``shares`` processes calling the same API keys.
+
+    Every scheduler created afterwards in this process (the default one and
+    backends' own) paces to ``1/shares`` of its configured requests/min and
+    tokens/min, so that worker processes together stay within the budget.
+
+    Args:
+        shares (int): Number of processes sharing the budget
+    """
+    global _default_scheduler, _rate_shares
+    with _default_scheduler_lock:
+        _rate_shares = max(1, int(shares))
+        _default_scheduler = None
+
+
+def get_default_scheduler():
+    """Return the process-wide request scheduler shared by all callers."""
+    global _default_scheduler
+    with _default_scheduler_lock:
+        if _default_scheduler is None:
+            _default_scheduler = RequestScheduler()
+        return _default_scheduler
@@ -0,0 +1,433 @@
+"""
+HTTP generation service.
+
+Exposes a DischargeSummaryGenerator over a small JSON API (``app.py --mode
+serve``):
+
+    POST /v1/summaries          Generate and wait for the summary
+    POST /v1/jobs               Submit a generation job (202 + job ID)
+    GET  /v1/jobs/<id>          Job status, with the summary once done
+    GET  /v1/jobs/<id>/summary  The summary as plain text (409 until done)
+    GET  /healthz               Queue depth and job counts
+
+Request bodies are ``{"patient_data": {...}, "template": "auto",
+"strategy": "single"}`` (template and strategy are optional).
+
+Jobs are run by a fixed pool of worker threads that take them from a bounded
+queue. When the queue is full, new requests get ``429 Too Many Requests``
+with a Retry-After header instead of piling onto the provider. Identical
+requests in flight (the same patient data, resolved template and strategy)
+are coalesced onto one job, so they share a single LLM call.
+"""
+
+import json
+import queue
+import re
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from http import HTTPStatus
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from loguru import logger
+
+from config import (
+    LLM_TEMPERATURE,
+    MAX_TOKENS,
+    SERVICE_MAX_BODY_BYTES,
+    SERVICE_MAX_JOBS,
+    SERVICE_QUEUE_SIZE,
+    SERVICE_SYNC_TIMEOUT,
+    SERVICE_WORKERS,
+    SUMMARY_STRATEGY,
+)
+from .cache import make_cache_key
+from .discharge_generator import STRATEGIES
+from .records import InvalidPatientRecord, as_record
+
+_JOB_PATH = re.compile(r"^/v1/jobs/([0-9a-f]{32})(/summary)?$")
+
+
+class ServiceBusy(RuntimeError):
+    """Raised when the job queue is full or the service is shutting down."""
+
+    def __init__(self, message, retry_after=None):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class Job:
+    """
+    One generation job, shared by every request coalesced onto it.
+    """
+
+    def __init__(self, key, patient_id, patient_data, template_type, strategy):
+        self.id = uuid.uuid4().hex
+        self.key = key
+        self.patient_id = patient_id
+        self.patient_data = patient_data
+        self.template_type = template_type
+        self.strategy = strategy
+        self.status = "queued"
+        self.summary = None
+        self.error = None
+        self.submitted_at = time.time()
+        self.finished_at = None
+        self.requests = 1
+        self.done = threading.Event()
+
+    def to_dict(self, include_summary=True):
+        """Return the job's public status."""
+        status = {
+            "job_id": self.id,
+            "patient_id": self.patient_id,
+            "status": self.status,
+            "template": self.template_type,
+            "strategy": self.strategy,
+            "submitted_at": self.submitted_at,
+            "finished_at": self.finished_at,
+            "coalesced_requests": self.requests - 1,
+        }
+        if self.error is not None:
+            status["error"] = self.error
+        if include_summary and self.summary is not None:
+            status["summary"] = self.summary
+        return status
+
+
+class GenerationService:
+    """
+    Runs generation jobs on a worker pool fed by a bounded queue.
+    """
+
+    def __init__(
+        self,
+        generator,
+        workers=SERVICE_WORKERS,
+        queue_size=SERVICE_QUEUE_SIZE,
+        max_jobs=SERVICE_MAX_JOBS,
+    ):
+        """
+        Start the worker pool.
+
+        Args:
+            generator (DischargeSummaryGenerator): Generator shared by the workers
+            workers (int): Number of concurrent generation calls
+            queue_size (int): Jobs that may wait for a worker before new
+                              requests are rejected
+            max_jobs (int): Finished jobs kept for polling (oldest are dropped)
+        """
+        self.generator = generator
+        self.max_jobs = max(1, int(max_jobs))
+        self._queue = queue.Queue(maxsize=max(1, int(queue_size)))
+        self._lock = threading.Lock()
+        self._jobs = OrderedDict()
+        self._in_flight = {}
+        self._running = 0
+        self._closed = False
+        self._workers = [
+            threading.Thread(target=self._work, name=f"summary-worker-{i}", daemon=True)
+            for i in range(max(1, int(workers)))
+        ]
+        for worker in self._workers:
+            worker.start()
+
+    def request_key(self, record, template_name, strategy):
+        """
+        Key identifying identical requests: the patient data hash, resolved
+        template and strategy.
+        """
+        return make_cache_key(
+            record.data,
+            template_name,
+            self.generator.model,
+            LLM_TEMPERATURE,
+            MAX_TOKENS,
+            strategy,
+        )
+
+    def submit(self, patient_data, template_type=None, strategy=None):
+        """
+        Queue a generation job, or join an identical one already in flight.
+
+        Args:
+            patient_data (dict): Patient data
+            template_type (str, optional): Template type ("auto" or None routes
+                                           the chart)
+            strategy (str, optional): Generation strategy
+
+        Returns:
+            tuple: (Job, whether the request was coalesced onto an existing job)
+
+        Raises:
+            InvalidPatientRecord: If the chart is malformed
+            ValueError: If the strategy is unknown
+            ServiceBusy: If the queue is full or the service is closed
+        """
+        strategy = strategy or SUMMARY_STRATEGY
+        if strategy not in STRATEGIES:
+            raise ValueError(
+                f"Unknown summary strategy {strategy!r}; expected one of {STRATEGIES}"
+            )
+        record = as_record(patient_data)
+        template_name = self.generator._resolve_template_type(record, template_type)
+        key = self.request_key(record, template_name, strategy)
+
+        with self._lock:
+            if self._closed:
+                raise ServiceBusy("Service is shutting down")
+            job = self._in_flight.get(key)
+            if job is not None:
+                job.requests += 1
+                logger.debug(
+                    f"Coalesced request for patient {record.patient_id} onto "
+                    f"job {job.id}"
+                )
+                return job, True
+
+            job = Job(key, record.patient_id, record, template_name, strategy)
+            try:
+                self._queue.put_nowait(job)
+            except queue.Full:
+                raise ServiceBusy(
+                    f"Job queue is full ({self._queue.maxsize} waiting)",
+                    retry_after=self._retry_after(),
+                ) from None
+            self._in_flight[key] = job
+            self._jobs[job.id] = job
+            self._trim_jobs()
+        return job, False
+
+    def _retry_after(self):
+        """Retry-After hint: the queue depth per worker, at least one second."""
+        return max(1, round(self._queue.qsize() / len(self._workers)))
+
+    def _trim_jobs(self):
+        """Drop the oldest finished jobs beyond max_jobs (lock held)."""
+        excess = len(self._jobs) - self.max_jobs
+        for job_id in list(self._jobs):
+            if excess <= 0:
+                break
+            if self._jobs[job_id].done.is_set():
+                del self._jobs[job_id]
+                excess -= 1
+
+    def get(self, job_id):
+        """Return a job by ID, or None."""
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def _work(self):
+        while True:
+            job = self._queue.get()
+            if job is None:
+                return
+            with self._lock:
+                job.status = "running"
+                self._running += 1
+            try:
+                job.summary = self.generator.generate_summary(
+                    job.patient_data, job.template_type, strategy=job.strategy
+                )
+                job.status = "done"
+            except Exception as e:
+                logger.error(f"Job {job.id} for patient {job.patient_id} failed: {e}")
+                job.error = str(e)
+                job.status = "failed"
+            finally:
+                job.finished_at = time.time()
+                job.patient_data = None
+                with self._lock:
+                    self._running -= 1
+                    if self._in_flight.get(job.key) is job:
+                        del self._in_flight[job.key]
+                job.done.set()
+
+    def stats(self):
+        """Return queue and job counts."""
+        with self._lock:
+            statuses = [job.status for job in self._jobs.values()]
+            return {
+                "workers": len(self._workers),
+                "queued": self._queue.qsize(),
+                "queue_size": self._queue.maxsize,
+                "running": self._running,
+                "done": statuses.count("done"),
+                "failed": statuses.count("failed"),
+            }
+
+    def close(self, timeout=None):
+        """Stop accepting jobs, finish the queued ones and stop the workers."""
+        with self._lock:
+            if self._closed:
+                return
+            self._closed = True
+        for _ in self._workers:
+            self._queue.put(None)
+        for worker in self._workers:
+            worker.join(timeout)
+
+
+class _Handler(BaseHTTPRequestHandler):
+    """JSON API over a GenerationService (set as the ``service`` attribute)."""
+
+    service = None
+    sync_timeout = SERVICE_SYNC_TIMEOUT
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        logger.debug(f"{self.address_string()} {format % args}")
+
+    def _send(self, status, body, headers=None, content_type="application/json"):
+        if content_type == "application/json":
+            body = json.dumps(body)
+        payload = body.encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", f"{content_type}; charset=utf-8")
+        self.send_header("Content-Length", str(len(payload)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def _error(self, status, message, headers=None):
+        self._send(status, {"error": message}, headers)
+
+    def _error_and_close(self, status, message):
+        """Reply with an error and close the connection (the body is unread)."""
+        self.close_connection = True
+        self._error(status, message, {"Connection": "close"})
+
+    def _read_request(self):
+        """Parse the request body, replying with an error if it is unusable."""
+        try:
+            length = int(self.headers.get("Content-Length") or 0)
+        except ValueError:
+            length = -1
+        if length < 0:
+            # The body's extent is unknown, so the connection cannot be reused
+            self._error_and_close(HTTPStatus.BAD_REQUEST, "Invalid Content-Length")
+            return None
+        if length > SERVICE_MAX_BODY_BYTES:
+            # The unread body would otherwise be parsed as the next request
+            self._error_and_close(
+                HTTPStatus.REQUEST_ENTITY_TOO_LARGE, "Request body too large"
+            )
+            return None
+        try:
+            body = json.loads(self.rfile.read(length) or b"null")
+        except (json.JSONDecodeError, UnicodeDecodeError) as e:
+            self._error(HTTPStatus.BAD_REQUEST, f"Invalid JSON: {e}")
+            return None
+        if not isinstance(body, dict) or not isinstance(body.get("patient_data"), dict):
+            self._error(HTTPStatus.BAD_REQUEST, "Body must have a patient_data object")
+            return None
+        return body
+
+    def _submit(self, body):
+        """Submit a job, replying with an error if it is rejected."""
+        try:
+            return self.service.submit(
+                body["patient_data"], body.get("template"), body.get("strategy")
+            )
+        except (InvalidPatientRecord, ValueError) as e:
+            self._error(HTTPStatus.BAD_REQUEST, str(e))
+        except ServiceBusy as e:
+            if e.retry_after is None:
+                self._error(HTTPStatus.SERVICE_UNAVAILABLE, str(e))
+            else:
+                self._error(
+                    HTTPStatus.TOO_MANY_REQUESTS,
+                    str(e),
+                    {"Retry-After": str(e.retry_after)},
+                )
+        return None, None
+
+    def do_POST(self):
+        if self.path not in ("/v1/summaries", "/v1/jobs"):
+            self._error_and_close(HTTPStatus.NOT_FOUND, f"No such endpoint {self.path}")
+            return
+        body = self._read_request()
+        if body is None:
+            return
+        job, coalesced = self._submit(body)
+        if job is None:
+            return
+
+        location = {"Location": f"/v1/jobs/{job.id}"}
+        if self.path == "/v1/jobs":
+            self._send(
+                HTTPStatus.ACCEPTED,
+                {**job.to_dict(include_summary=False), "coalesced": coalesced},
+                location,
+            )
+            return
+
+        if not job.done.wait(self.sync_timeout):
+            # Still running: hand the caller the job to poll instead
+            self._send(
+                HTTPStatus.ACCEPTED,
+                {**job.to_dict(include_summary=False), "coalesced": coalesced},
+                location,
+            )
+        elif job.status == "failed":
+            self._error(HTTPStatus.BAD_GATEWAY, job.error)
+        else:
+            self._send(HTTPStatus.OK, {**job.to_dict(), "coalesced": coalesced})
+
+    def do_GET(self):
+        if self.path == "/healthz":
+            self._send(HTTPStatus.OK, self.service.stats())
+            return
+        match = _JOB_PATH.match(self.path)
+        job = self.service.get(match.group(1)) if match else None
+        if job is None:
+            self._error(HTTPStatus.NOT_FOUND, f"No such job or endpoint {self.path}")
+        elif not match.group(2):
+            self._send(HTTPStatus.OK, job.to_dict())
+        elif job.status == "done":
+            self._send(HTTPStatus.OK, job.summary, content_type="text/plain")
+        else:
+            self._error(HTTPStatus.CONFLICT, f"Job {job.id} is {job.status}")
+
+
+def make_server(service, host, port, sync_timeout=SERVICE_SYNC_TIMEOUT):
+    """
+    Build an HTTP server for a generation service.
+
+    Args:
+        service (GenerationService): Service handling the requests
+        host (str): Interface to listen on
+        port (int): Port to listen on (0 picks a free one)
+        sync_timeout (float): Seconds /v1/summaries waits before answering
+                              with the job to poll instead
+
+    Returns:
+        ThreadingHTTPServer: The (not yet serving) server
+    """
+    handler = type(
+        "GenerationHandler",
+        (_Handler,),
+        {"service": service, "sync_timeout": sync_timeout},
+    )
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    return server
+
+
+def serve(generator, host, port):
+    """Serve a generator over HTTP until interrupted."""
+    service = GenerationService(generator)
+    server = make_server(service, host, port)
+    logger.info(
+        f"Serving discharge summaries on http://{host}:{server.server_port} "
+        f"({len(service._workers)} workers, queue of {service._queue.maxsize})"
+    )
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        service.close()
@@ -0,0 +1,248 @@
+"""
+Persistent, versioned store of generated discharge summaries.
+
+Every summary generated is saved to a SQLite database (in WAL mode, so
+readers such as the web UI never block the writer) together with the hash
+of its inputs, the model, strategy, token counts and latency. Summaries are
+versioned per patient, admission and template: regenerating after the chart
+changed adds a new version instead of replacing the old one. Lookups by
+patient or by input hash go through B-tree indexes, so serving a stored
+summary costs O(log n) however large the store grows.
+"""
+
+import sqlite3
+import threading
+import time
+from pathlib import Path
+
+from loguru import logger
+
+from config import SUMMARY_STORE_ENABLED, SUMMARY_STORE_PATH
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS summaries (
+    id INTEGER PRIMARY KEY,
+    patient_id TEXT NOT NULL,
+    admission TEXT NOT NULL,
+    template TEXT NOT NULL,
+    version INTEGER NOT NULL,
+    input_hash TEXT NOT NULL,
+    model TEXT,
+    strategy TEXT,
+    summary TEXT NOT NULL,
+    prompt_tokens INTEGER,
+    completion_tokens INTEGER,
+    latency_ms REAL,
+    created_at REAL NOT NULL,
+    UNIQUE (patient_id, admission, template, version)
+);
+CREATE INDEX IF NOT EXISTS summaries_input_hash ON summaries (input_hash);
+"""
+
+_COLUMNS = (
+    "patient_id",
+    "admission",
+    "template",
+    "version",
+    "input_hash",
+    "model",
+    "strategy",
+    "summary",
+    "prompt_tokens",
+    "completion_tokens",
+    "latency_ms",
+    "created_at",
+)
+_SELECT = f"SELECT {', '.join(_COLUMNS)} FROM summaries"
+
+
+class SummaryStore:
+    """
+    SQLite-backed summary store, safe to share between threads and processes.
+    """
+
+    def __init__(self, path=SUMMARY_STORE_PATH):
+        """
+        Open (or create) a store.
+
+        Args:
+            path (str): SQLite database file (":memory:" for a throwaway store)
+        """
+        self.path = str(path)
+        if self.path != ":memory:":
+            Path(self.path).parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(
+            self.path, timeout=30, isolation_level=None, check_same_thread=False
+        )
+        self._db.row_factory = sqlite3.Row
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.executescript(_SCHEMA)
+
+    def _transaction(self, fn):
+        """Run fn(db) in an IMMEDIATE (write-locked) transaction."""
+        with self._lock:
+            self._db.execute("BEGIN IMMEDIATE")
+            try:
+                result = fn(self._db)
+            except BaseException:
+                self._db.execute("ROLLBACK")
+                raise
+            self._db.execute("COMMIT")
+            return result
+
+    def save(
+        self,
+        patient_id,
+        summary,
+        input_hash,
+        admission="",
+        template="general",
+        model=None,
+        strategy=None,
+        prompt_tokens=None,
+        completion_tokens=None,
+        latency_ms=None,
+    ):
+        """
+        Save a summary as the next version for its patient, admission and
+        template. Saving the same inputs as the latest version again does not
+        add a version.
+
+        Args:
+            patient_id (str): Patient ID
+            summary (str): Generated summary
+            input_hash (str): Hash identifying the generation inputs
+            admission (str): Admission identifier (the admission date)
+            template (str): Template type
+            model (str, optional): LLM model name
+            strategy (str, optional): Generation strategy
+            prompt_tokens (int, optional): Prompt tokens used
+            completion_tokens (int, optional): Completion tokens used
+            latency_ms (float, optional): Generation time in milliseconds
+
+        Returns:
+            int: The version number of the saved summary
+        """
+        admission = admission or ""
+
+        def save_version(db):
+            latest = db.execute(
+                "SELECT version, input_hash FROM summaries "
+                "WHERE patient_id = ? AND admission = ? AND template = ? "
+                "ORDER BY version DESC LIMIT 1",
+                (patient_id, admission, template),
+            ).fetchone()
+            if latest is not None and latest["input_hash"] == input_hash:
+                return latest["version"], False
+            version = latest["version"] + 1 if latest is not None else 1
+            db.execute(
+                f"INSERT INTO summaries ({', '.join(_COLUMNS)}) "
+                f"VALUES ({', '.join('?' * len(_COLUMNS))})",
+                (
+                    patient_id,
+                    admission,
+                    template,
+                    version,
+                    input_hash,
+                    model,
+                    strategy,
+                    summary,
+                    prompt_tokens,
+                    completion_tokens,
+                    latency_ms,
+                    time.time(),
+                ),
+            )
+            return version, True
+
+        # IMMEDIATE takes the write lock before reading the latest version, so
+        # processes sharing the store cannot both save the same next version
+        version, added = self._transaction(save_version)
+        if not added:
+            return version
+        logger.debug(
+            f"Stored summary v{version} for patient {patient_id} "
+            f"({template}, admission {admission or 'unknown'})"
+        )
+        return version
+
+    def _fetch(self, sql, params):
+        with self._lock:
+            return [dict(row) for row in self._db.execute(sql, params).fetchall()]
+
+    def find_by_input(self, input_hash):
+        """
+        Return the stored summary generated from exactly these inputs.
+
+        Args:
+            input_hash (str): Hash identifying the generation inputs
+
+        Returns:
+            dict or None: The most recent matching summary row
+        """
+        rows = self._fetch(
+            f"{_SELECT} WHERE input_hash = ? ORDER BY created_at DESC LIMIT 1",
+            (input_hash,),
+        )
+        return rows[0] if rows else None
+
+    def versions(self, patient_id, admission=None, template=None):
+        """
+        List a patient's stored summaries, newest first.
+
+        Args:
+            patient_id (str): Patient ID
+            admission (str, optional): Only this admission
+            template (str, optional): Only this template type
+
+        Returns:
+            list: Summary rows (dicts with the summary and its metadata)
+        """
+        sql = f"{_SELECT} WHERE patient_id = ?"
+        params = [str(patient_id)]
+        if admission is not None:
+            sql += " AND admission = ?"
+            params.append(admission)
+        if template is not None:
+            sql += " AND template = ?"
+            params.append(template)
+        return self._fetch(sql + " ORDER BY created_at DESC, version DESC", params)
+
+    def latest(self, patient_id, admission=None, template=None):
+        """Return a patient's most recent stored summary, or None."""
+        rows = self.versions(patient_id, admission, template)
+        return rows[0] if rows else None
+
+    def get(self, patient_id, version, admission=None, template=None):
+        """
+        Return one stored version, or None.
+
+        Without an admission or template, the most recently created summary
+        with that version number is returned.
+        """
+        for row in self.versions(patient_id, admission, template):
+            if row["version"] == int(version):
+                return row
+        return None
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+
+_default_store = None
+_default_store_lock = threading.Lock()
+
+
+def get_default_store():
+    """Return the process-wide summary store, or None if the store is disabled."""
+    global _default_store
+    if not SUMMARY_STORE_ENABLED:
+        return None
+    with _default_store_lock:
+        if _default_store is None:
+            _default_store = SummaryStore(SUMMARY_STORE_PATH)
+            logger.info(f"Summary store at {SUMMARY_STORE_PATH}")
+        return _default_store
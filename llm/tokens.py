@@ -0,0 +1,153 @@
+"""
+Token accounting and context-window budgeting for LLM prompts.
+
+Uses tiktoken (a requirement) for exact counts. Should it be missing, or
+its encoding files unavailable offline, counts fall back to a
+character-based estimate and a warning is logged.
+"""
+
+from functools import lru_cache
+from loguru import logger
+
+from config import (
+    LLM_MODEL,
+    MAX_TOKENS,
+    MODEL_CONTEXT_WINDOWS,
+    DEFAULT_CONTEXT_WINDOW,
+    MIN_COMPLETION_TOKENS,
+)
+
+try:
+    import tiktoken
+except ImportError:  # pragma: no cover - listed in requirements.txt
+    tiktoken = None
+
+# Tokens added per chat message, and to prime the assistant's reply
+MESSAGE_OVERHEAD_TOKENS = 3
+REPLY_PRIMING_TOKENS = 3
+
+
+class ContextBudgetError(ValueError):
+    """Raised when a prompt leaves too little room in the context window."""
+
+
+def estimate_tokens(text):
+    """Roughly estimate the number of LLM tokens in a text (~4 characters each)."""
+    return (len(text) + 3) // 4
+
+
+@lru_cache(maxsize=None)
+def _encoding_for(model):
+    """Return the tiktoken encoding for a model, or None if unavailable."""
+    if tiktoken is None:
+        logger.warning(
+            f"tiktoken is not installed; estimating token counts for {model}"
+        )
+        return None
+    try:
+        try:
+            return tiktoken.encoding_for_model(model)
+        except KeyError:
+            return tiktoken.get_encoding("cl100k_base")
+    except Exception as e:
+        # Encodings are downloaded on first use; stay usable offline
+        logger.warning(f"Falling back to estimated token counts: {e}")
+        return None
+
+
+def count_tokens(text, model=LLM_MODEL):
+    """
+    Count the tokens in a text for a model.
+
+    Args:
+        text (str): Text to count
+        model (str): LLM model name
+
+    Returns:
+        int: Token count (exact with tiktoken, estimated otherwise)
+    """
+    encoding = _encoding_for(model)
+    if encoding is None:
+        return estimate_tokens(text)
+    return len(encoding.encode(text, disallowed_special=()))
+
+
+def count_message_tokens(messages, model=LLM_MODEL):
+    """
+    Count the prompt tokens used by a list of chat messages.
+
+    Args:
+        messages (list): Chat messages with "role" and "content"
+        model (str): LLM model name
+
+    Returns:
+        int: Prompt token count including per-message overhead
+    """
+    total = REPLY_PRIMING_TOKENS
+    for message in messages:
+        total += MESSAGE_OVERHEAD_TOKENS + count_tokens(message["content"], model)
+    return total
+
+
+def context_window(model):
+    """
+    Return the context window size for a model.
+
+    The longest matching prefix in MODEL_CONTEXT_WINDOWS wins, so
+    "gpt-4-turbo-2024-04-09" resolves via "gpt-4-turbo" rather than "gpt-4".
+    """
+    for prefix in sorted(MODEL_CONTEXT_WINDOWS, key=len, reverse=True):
+        if model.startswith(prefix):
+            return MODEL_CONTEXT_WINDOWS[prefix]
+    return DEFAULT_CONTEXT_WINDOW
+
+
+def fit_max_tokens(prompt_tokens, model, max_tokens=MAX_TOKENS):
+    """
+    Clamp the completion budget to what fits after the prompt.
+
+    Args:
+        prompt_tokens (int): Tokens used by the prompt
+        model (str): LLM model name
+        max_tokens (int): Requested maximum completion tokens
+
+    Returns:
+        int: max_tokens, reduced to fit the model's context window
+
+    Raises:
+        ContextBudgetError: If fewer than MIN_COMPLETION_TOKENS would remain
+    """
+    available = context_window(model) - prompt_tokens
+    if available < min(max_tokens, MIN_COMPLETION_TOKENS):
+        raise ContextBudgetError(
+            f"Prompt uses {prompt_tokens} tokens, leaving {available} of "
+            f"{context_window(model)} for the completion on {model}"
+        )
+    return min(max_tokens, available)
+
+
+def cached_prompt_tokens(usage):
+    """
+    Prompt tokens the provider served from its prompt cache.
+
+    Read from ``usage.prompt_tokens_details.cached_tokens``. Older client
+    versions don't model that field, so it is also looked up in the raw
+    usage data; providers that don't report it yield None.
+
+    Args:
+        usage: Completion usage object (or dict) from the response
+
+    Returns:
+        int or None: Cached prompt tokens
+    """
+    if usage is None:
+        return None
+    details = getattr(usage, "prompt_tokens_details", None)
+    if details is None:
+        extra = usage if isinstance(usage, dict) else (usage.model_extra or {})
+        details = extra.get("prompt_tokens_details")
+    if details is None:
+        return None
+    if isinstance(details, dict):
+        return details.get("cached_tokens")
+    return getattr(details, "cached_tokens", None)
@@ -2,13 +2,21 @@
 Utility functions for the discharge summary generator.
 """
 
+import glob
 import json
 import logging
+import os
+import re
 from datetime import datetime
 from pathlib import Path
 from loguru import logger
 import sys
 
+from . import ingest
+from .records import InvalidPatientRecord, as_record
+from .tokens import count_tokens
+from config import LLM_MODEL
+
 
 # Set up logging configuration
 def setup_logging(log_dir, log_level="INFO"):
@@ -34,6 +42,22 @@ def setup_logging(log_dir, log_level="INFO"):
     return logger
 
 
+def safe_filename(name, suffix=".txt"):
+    """Build a filesystem-safe file name (e.g. for a patient's summary)."""
+    return f"{re.sub(r'[^A-Za-z0-9._-]', '_', str(name))}{suffix}"
+
+
+def write_atomic(path, text):
+    """
+    Write a text file atomically: the text goes to a temporary file that is
+    then renamed over ``path``, so a crash never leaves half a file.
+    """
+    path = Path(path)
+    tmp_path = path.with_name(f".{path.name}.{os.getpid()}.tmp")
+    tmp_path.write_text(text)
+    os.replace(tmp_path, path)
+
+
 def load_patient_data(file_path):
     """Load patient data from JSON file."""
     try:
@@ -44,22 +68,188 @@ def load_patient_data(file_path):
         raise
 
 
+def iter_patient_records(source, validate=False):
+    """
+    Iterate over patient records from a directory, glob pattern or file.
+
+    Directories are scanned for ``.json``, ``.jsonl`` and ``.ndjson`` files,
+    optionally gzip (``.gz``) or zstd (``.zst``) compressed. JSON-lines files
+    hold one patient record per line; ``.json`` files hold a single record or
+    a list of records. Files are streamed (see ``llm.ingest``), so memory use
+    does not grow with the size of the input. Records that cannot be parsed
+    are yielded with an error instead of raising, so one bad chart doesn't
+    stop a batch.
+
+    Args:
+        source (str): Directory, glob pattern, or record file path
+        validate (bool): Yield PatientRecord objects, and yield malformed
+                         charts as errors
+
+    Yields:
+        tuple: (source label, patient data dict/PatientRecord or None,
+                error message or None)
+    """
+    path = Path(source)
+    if path.is_dir():
+        files = sorted(
+            f for f in path.iterdir() if f.is_file() and ingest.record_format(f)
+        )
+    elif path.is_file():
+        files = [path]
+    else:
+        files = sorted(Path(f) for f in glob.glob(str(source)) if Path(f).is_file())
+
+    if not files:
+        logger.warning(f"No patient records found for: {source}")
+
+    for file_path in files:
+        yield from ingest.iter_file_records(file_path, validate)
+
+
 def extract_diagnosis_code(patient_data):
-    """Extract primary diagnosis code from patient data."""
+    """Extract primary diagnosis code from patient data (dict or PatientRecord)."""
     try:
-        if "diagnoses" in patient_data and len(patient_data["diagnoses"]) > 0:
-            return patient_data["diagnoses"][0].get("diagnosis_code", "")
-        return ""
-    except (KeyError, IndexError) as e:
+        return as_record(patient_data).diagnosis_code
+    except InvalidPatientRecord as e:
         logger.warning(f"Could not extract diagnosis code: {e}")
         return ""
 
 
-def format_patient_json(patient_data):
+# Repeated-record sections that may be trimmed to fit a token budget, in the
+# order they are sacrificed (lowest clinical value for the summary first)
+TRUNCATABLE_SECTIONS = [
+    "flowsheets",
+    "labs",
+    "med_orders",
+    "encounters",
+    "ward_round_notes",
+    "notes",
+]
+
+
+def _drop_empty(value):
+    """Recursively remove None, empty strings, lists and dicts."""
+    if isinstance(value, dict):
+        cleaned = {k: _drop_empty(v) for k, v in value.items()}
+        return {k: v for k, v in cleaned.items() if v not in (None, "", [], {})}
+    if isinstance(value, list):
+        cleaned = [_drop_empty(v) for v in value]
+        return [v for v in cleaned if v not in (None, "", [], {})]
+    return value
+
+
+def _tabulate(value):
+    """
+    Render arrays of two or more records as {"columns": [...], "rows": [[...]]}
+    so repeated keys are written once per array instead of once per record.
+    """
+    if isinstance(value, dict):
+        return {k: _tabulate(v) for k, v in value.items()}
+    if isinstance(value, list):
+        if len(value) >= 2 and all(isinstance(v, dict) for v in value):
+            columns = []
+            for record in value:
+                columns.extend(k for k in record if k not in columns)
+            return {
+                "columns": columns,
+                "rows": [[_tabulate(r.get(c)) for c in columns] for r in value],
+            }
+        return [_tabulate(v) for v in value]
+    return value
+
+
+def _truncate_oldest(data, section):
+    """
+    Drop the oldest quarter (at least one) of a section's entries, recording
+    how many were omitted and the dates they covered. Returns False if the
+    section cannot be trimmed further.
+    """
+    entries = data.get(section)
+    if not isinstance(entries, list) or len(entries) <= 1:
+        return False
+
+    drop = max(1, len(entries) // 4)
+    dropped, data[section] = entries[:drop], entries[drop:]
+
+    omitted = data.setdefault("omitted_entries", {}).setdefault(section, {"count": 0})
+    omitted["count"] += len(dropped)
+    dates = [e.get("date") for e in dropped if isinstance(e, dict) and e.get("date")]
+    if dates:
+        omitted.setdefault("from", dates[0])
+        omitted["to"] = dates[-1]
+    return True
+
+
+def compact_patient_json(patient_data, token_budget=None, model=None):
+    """
+    Render patient data as compact JSON for prompts.
+
+    Null and empty fields are dropped, repeated-record arrays (flowsheets,
+    labs, med_orders, ...) are rendered as column/row tables, and whitespace
+    is removed. If a token budget is given, the oldest entries of
+    TRUNCATABLE_SECTIONS are dropped until the data fits, with a note of what
+    was omitted.
+
+    Args:
+        patient_data (dict): Patient data
+        token_budget (int, optional): Maximum tokens for the rendered data
+        model (str, optional): Model whose tokenizer is used for counting
+
+    Returns:
+        tuple: (compact JSON string, stats dict with before/after token counts)
+    """
+    model = model or LLM_MODEL
+    original_tokens = count_tokens(json.dumps(patient_data, indent=2), model)
+    data = _drop_empty(patient_data)
+
+    def render(d):
+        return json.dumps(_tabulate(d), separators=(",", ":"), ensure_ascii=False)
+
+    text = render(data)
+    truncated = False
+    if token_budget is not None:
+        while count_tokens(text, model) > token_budget:
+            # Trims only the first section that still has entries to spare
+            if not any(_truncate_oldest(data, s) for s in TRUNCATABLE_SECTIONS):
+                logger.warning(
+                    f"Patient data still exceeds token budget ({token_budget}) "
+                    "after truncation"
+                )
+                break
+            truncated = True
+            text = render(data)
+
+    stats = {
+        "original_tokens": original_tokens,
+        "compact_tokens": count_tokens(text, model),
+        "truncated": truncated,
+    }
+    return text, stats
+
+
+def format_patient_json(patient_data, compact=False, token_budget=None, model=None):
     """
     Format patient JSON data for better readability in prompts.
     Removes potentially sensitive or irrelevant information.
+
+    Args:
+        patient_data (dict): Patient data
+        compact (bool): Render with compact_patient_json instead of indented JSON
+        token_budget (int, optional): Token budget for compact rendering
+        model (str, optional): Model whose tokenizer is used for counting
+
+    Returns:
+        str: Formatted patient data
     """
+    if compact:
+        formatted_data, stats = compact_patient_json(patient_data, token_budget, model)
+        logger.debug(
+            f"Compacted patient data for {patient_data.get('patient_id', 'unknown')}: "
+            f"{stats['original_tokens']} -> {stats['compact_tokens']} tokens"
+            f"{' (truncated)' if stats['truncated'] else ''}"
+        )
+        return formatted_data
+
     # Create a copy to avoid modifying the original
     formatted_data = json.dumps(patient_data, indent=2)
     return formatted_data
@@ -73,30 +263,56 @@ def sanitize_output(summary_text):
     return summary_text
 
 
+def consume_stream(stream, on_chunk=None):
+    """
+    Drive a summary stream to completion.
+
+    Args:
+        stream (generator): Generator from DischargeSummaryGenerator.stream_summary
+        on_chunk (callable, optional): Called with each text chunk as it arrives
+
+    Returns:
+        str: The sanitized summary returned by the stream
+    """
+    while True:
+        try:
+            chunk = next(stream)
+        except StopIteration as stop:
+            return stop.value
+        if on_chunk is not None:
+            on_chunk(chunk)
+
+
 def extract_patient_demographics(patient_data):
-    """Extract key patient demographics from data."""
-    demographics = {}
-    if "patient_demographics" in patient_data:
-        demo = patient_data["patient_demographics"]
-        demographics = {
-            "name": demo.get("name", "Unknown"),
-            "age": demo.get("age", "Unknown"),
-            "gender": demo.get("gender", "Unknown"),
-            "admission_date": demo.get("admission_date", "Unknown"),
-            "discharge_date": demo.get(
-                "discharge_date", demo.get("expected_discharge_date", "Unknown")
-            ),
-        }
-    return demographics
-
-
-def log_prompt_and_response(prompt, response, patient_id=None):
+    """Extract key patient demographics from data (dict or PatientRecord)."""
+    try:
+        record = as_record(patient_data)
+    except InvalidPatientRecord as e:
+        logger.warning(f"Could not extract patient demographics: {e}")
+        return {}
+    if "patient_demographics" not in record.model_fields_set:
+        return {}
+    demo = record.patient_demographics
+    return {
+        "name": demo.name or "Unknown",
+        "age": demo.age if demo.age is not None else "Unknown",
+        "gender": demo.gender or "Unknown",
+        "admission_date": demo.admission_date or "Unknown",
+        "discharge_date": record.discharge_date or "Unknown",
+    }
+
+
+def log_prompt_and_response(
+    prompt, response, patient_id=None, prompt_tokens=None, completion_tokens=None
+):
     """Log the prompt and response for auditing and training purposes."""
     log_entry = {
         "timestamp": datetime.now().isoformat(),
         "patient_id": patient_id,
         "prompt_length": len(prompt),
         "response_length": len(response),
+        "prompt_tokens": prompt_tokens,
+        "completion_tokens": completion_tokens,
         # For privacy reasons, we don't log the full prompt and response
         "prompt_excerpt": prompt[:100] + "..." if len(prompt) > 100 else prompt,
         "response_excerpt": response[:100] + "..." if len(response) > 100 else response,
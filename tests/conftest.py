@@ -0,0 +1,38 @@
+import json
+import os
+import sys
+from pathlib import Path
+
+import pytest
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+# Keep test runs from writing audit logs, summaries or section drafts into the
+# repo, and from reaching a real provider. Set before config is first imported.
+os.environ.update(
+    {
+        "OPENAI_API_KEY": "sk-test",
+        "AUDIT_LOG_ENABLED": "false",
+        "SUMMARY_STORE_ENABLED": "false",
+        "SUMMARY_CACHE_ENABLED": "false",
+        "SECTION_CACHE_PATH": "",
+        "LLM_MAX_RETRIES": "0",
+    }
+)
+
+
+@pytest.fixture
+def chart():
+    """A valid patient chart from the bundled sample data."""
+    return json.loads((ROOT / "data_3.json").read_text())
+
+
+@pytest.fixture
+def make_chart(chart):
+    """Build copies of the sample chart for other patient IDs."""
+
+    def make(patient_id):
+        return {**chart, "patient_id": patient_id}
+
+    return make
@@ -0,0 +1,100 @@
+import json
+
+import pytest
+
+from benchmarks.mock_server import MockLLMServer
+from llm import backends
+from llm.batch_api import collect_batch, list_batches, submit_batches
+from llm.cache import SummaryCache
+from llm.discharge_generator import DischargeSummaryGenerator
+
+
+class RecordingAuditLog:
+    def __init__(self):
+        self.records = []
+
+    def record(self, **fields):
+        self.records.append(fields)
+
+
+@pytest.fixture
+def server():
+    with MockLLMServer(latency=0, batch_latency=0.05) as server:
+        yield server
+
+
+@pytest.fixture
+def generator(server):
+    backend = backends.OpenAIBackend("openai", "gpt-4o", "sk-test", server.base_url)
+    return DischargeSummaryGenerator(
+        backend=backend, cache=SummaryCache(), audit_log=RecordingAuditLog()
+    )
+
+
+@pytest.fixture
+def source(tmp_path, make_chart):
+    path = tmp_path / "charts.jsonl"
+    path.write_text(
+        "".join(json.dumps(make_chart(f"P{i}")) + "\n" for i in range(3))
+    )
+    return str(path)
+
+
+def test_submit_and_collect_round_trip(generator, source, tmp_path):
+    batch_dir, output_dir = tmp_path / "batches", tmp_path / "out"
+
+    submitted = submit_batches(generator, source, batch_dir=batch_dir)
+    assert submitted["submitted"] == 3
+    [manifest] = submitted["batches"]
+    assert {entry["patient_id"] for entry in manifest["requests"].values()} == {
+        "P0",
+        "P1",
+        "P2",
+    }
+
+    counts = collect_batch(
+        generator,
+        manifest["batch_id"],
+        output_dir=output_dir,
+        poll_interval=0.05,
+        timeout=10,
+        batch_dir=batch_dir,
+    )
+    assert counts == {"status": "completed", "done": 3, "failed": 0, "pending": 0}
+    assert sorted(path.name for path in output_dir.iterdir()) == [
+        "P0.txt",
+        "P1.txt",
+        "P2.txt",
+    ]
+    audited = generator.audit_log.records
+    assert [record["error"] for record in audited] == [None] * 3
+    assert list_batches(batch_dir)[0]["collected_at"] is not None
+
+    # Collected summaries are cached, so nothing is submitted again
+    again = submit_batches(generator, source, batch_dir=batch_dir)
+    assert (again["submitted"], again["skipped"]) == (0, 3)
+
+    # Collecting again is a no-op
+    counts = collect_batch(
+        generator, manifest["batch_id"], poll_interval=0.05, batch_dir=batch_dir
+    )
+    assert counts["done"] == 3
+    assert len(generator.audit_log.records) == 3
+
+
+def test_uncollected_requests_are_not_resubmitted(generator, source, tmp_path):
+    batch_dir = tmp_path / "batches"
+
+    first = submit_batches(generator, source, batch_dir=batch_dir)
+    again = submit_batches(generator, source, batch_dir=batch_dir)
+
+    assert first["submitted"] == 3
+    assert (again["submitted"], again["pending"]) == (0, 3)
+    assert again["batches"] == []
+
+
+def test_large_submissions_are_split(generator, source, tmp_path):
+    result = submit_batches(
+        generator, source, batch_dir=tmp_path / "batches", max_requests=2
+    )
+    assert [len(manifest["requests"]) for manifest in result["batches"]] == [2, 1]
@@ -0,0 +1,132 @@
+from types import SimpleNamespace
+
+import pytest
+
+from benchmarks.mock_server import MockLLMServer
+from llm import backends
+from llm.cache import SummaryCache, make_cache_key
+from llm.discharge_generator import DischargeSummaryGenerator
+from llm.scheduler import RequestScheduler
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr("llm.cache.time", SimpleNamespace(time=clock))
+    return clock
+
+
+def _key(chart, **changes):
+    inputs = {
+        "template": "template",
+        "model": "gpt-4o",
+        "temperature": 0.2,
+        "max_tokens": 1000,
+        "strategy": "single",
+        **changes,
+    }
+    return make_cache_key(chart, **inputs)
+
+
+def test_key_depends_on_every_input(chart):
+    base = _key(chart)
+    assert _key(dict(reversed(chart.items()))) == base
+    changed = [
+        _key({**chart, "patient_id": "other"}),
+        _key(chart, template="other template"),
+        _key(chart, model="gpt-4o-mini"),
+        _key(chart, temperature=0.7),
+        _key(chart, max_tokens=500),
+        _key(chart, strategy="map_reduce"),
+    ]
+    assert base not in changed and len(set(changed)) == len(changed)
+
+
+def test_least_recently_used_entry_is_evicted():
+    cache = SummaryCache(max_entries=2, max_bytes=1000, ttl=0)
+    cache.set("a", "A")
+    cache.set("b", "B")
+    assert cache.get("a") == "A"
+    cache.set("c", "C")
+
+    assert cache.get("b") is None
+    assert (cache.get("a"), cache.get("c")) == ("A", "C")
+    assert cache.stats()["evictions"] == 1
+
+
+def test_entries_are_evicted_down_to_the_size_limit():
+    cache = SummaryCache(max_entries=10, max_bytes=10, ttl=0)
+    cache.set("a", "x" * 6)
+    cache.set("b", "y" * 6)
+
+    assert cache.get("a") is None
+    assert cache.stats()["bytes"] == 6
+
+
+def test_entries_expire_after_the_ttl(clock):
+    cache = SummaryCache(ttl=60)
+    cache.set("a", "A")
+    clock.now += 59
+    assert cache.get("a") == "A"
+    clock.now += 2
+
+    assert cache.get("a") is None
+    stats = cache.stats()
+    assert (stats["expirations"], stats["entries"]) == (1, 0)
+
+
+def test_disk_tier_survives_a_new_cache(tmp_path, clock):
+    path = tmp_path / "cache.db"
+    SummaryCache(ttl=60, path=path).set("a", "A")
+
+    cache = SummaryCache(ttl=60, path=path)
+    assert cache.get("a") == "A"
+    assert cache.stats()["disk_hits"] == 1
+    # Promoted to the in-memory tier
+    assert cache.get("a") == "A"
+    assert cache.stats()["disk_hits"] == 1
+
+    clock.now += 61
+    assert SummaryCache(ttl=60, path=path).get("a") is None
+    assert SummaryCache(ttl=0, path=path).get("a") is None
+
+
+def test_generator_serves_repeat_requests_from_the_cache(chart):
+    generator = DischargeSummaryGenerator(
+        backend=backends.get_backend("mock"), cache=SummaryCache()
+    )
+    first = generator.generate_summary(chart)
+    assert generator.generate_summary(chart) == first
+
+    stats = generator.cache.stats()
+    assert (stats["hits"], stats["misses"]) == (1, 1)
+
+
+def test_failed_over_summary_is_keyed_on_the_serving_model(chart, monkeypatch):
+    with MockLLMServer(latency=0, error_rate=1.0) as failing:
+        # Its own scheduler, so the failure does not count against the
+        # process-wide circuit breaker
+        primary = backends.OpenAIBackend(
+            "primary",
+            "gpt-4o",
+            "sk-test",
+            failing.base_url,
+            scheduler=RequestScheduler(0, 0, max_retries=0),
+        )
+        fallback = backends.MockBackend("fallback", "mock-small")
+        monkeypatch.setattr(backends, "fallbacks", lambda backend: [fallback])
+        generator = DischargeSummaryGenerator(backend=primary, cache=SummaryCache())
+        summary = generator.generate_summary(chart)
+
+    call = generator._start_call(chart)
+    assert generator.cache.get(call["input_hash"]) is None
+    served = generator._input_hash(chart, call["template"], model="mock-small")
+    assert generator.cache.get(served) == summary
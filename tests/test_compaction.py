@@ -0,0 +1,82 @@
+import copy
+import json
+
+from llm.tokens import count_tokens
+from llm.utils import compact_patient_json, format_patient_json
+
+
+def _chart():
+    return {
+        "patient_id": "P1",
+        "patient_demographics": {"name": "Jane Doe", "age": 70, "mrn": None},
+        "diagnoses": [{"code": "I50.9", "description": "Heart failure"}],
+        "allergies": [],
+        "flowsheets": [
+            {"date": f"2024-01-{day:02d}", "hr": 80 + day, "bp": "120/80", "note": ""}
+            for day in range(1, 21)
+        ],
+        "labs": [
+            {"date": f"2024-01-{day:02d}", "test": "Creatinine", "value": day / 10}
+            for day in range(11, 21)
+        ],
+    }
+
+
+def test_empty_fields_are_dropped_and_records_tabulated():
+    text, stats = compact_patient_json(_chart())
+    data = json.loads(text)
+
+    assert "allergies" not in data
+    assert "mrn" not in data["patient_demographics"]
+    assert data["labs"]["columns"] == ["date", "test", "value"]
+    assert data["labs"]["rows"][0] == ["2024-01-11", "Creatinine", 1.1]
+    assert "note" not in data["flowsheets"]["columns"]
+    # A single record stays a plain list
+    assert data["diagnoses"] == [{"code": "I50.9", "description": "Heart failure"}]
+    assert stats["compact_tokens"] < stats["original_tokens"]
+    assert not stats["truncated"]
+
+
+def test_data_within_the_budget_is_not_truncated():
+    text, _ = compact_patient_json(_chart())
+    budgeted, stats = compact_patient_json(_chart(), count_tokens(text))
+
+    assert budgeted == text
+    assert not stats["truncated"]
+
+
+def test_oldest_low_value_entries_are_trimmed_first():
+    chart = _chart()
+    original = copy.deepcopy(chart)
+    full, _ = compact_patient_json(chart)
+    budget = count_tokens(full) * 3 // 4
+
+    text, stats = compact_patient_json(chart, budget)
+    data = json.loads(text)
+
+    assert stats["truncated"] and stats["compact_tokens"] <= budget
+    omitted = data["omitted_entries"]
+    # Flowsheets go before labs
+    assert list(omitted) == ["flowsheets"]
+    kept = data["flowsheets"]["rows"]
+    assert omitted["flowsheets"]["count"] + len(kept) == 20
+    assert omitted["flowsheets"]["from"] == "2024-01-01"
+    assert kept[0][0] > omitted["flowsheets"]["to"]
+    assert len(data["labs"]["rows"]) == 10
+    assert chart == original
+
+
+def test_unreachable_budget_keeps_the_last_entry_of_each_section():
+    text, stats = compact_patient_json(_chart(), token_budget=1)
+    data = json.loads(text)
+
+    assert stats["truncated"]
+    assert data["flowsheets"][0]["date"] == "2024-01-20"
+    assert data["labs"][0]["date"] == "2024-01-20"
+    assert data["omitted_entries"]["labs"]["count"] == 9
+
+
+def test_compaction_can_be_turned_off():
+    chart = _chart()
+    assert format_patient_json(chart) == json.dumps(chart, indent=2)
+    assert format_patient_json(chart, compact=True) == compact_patient_json(chart)[0]
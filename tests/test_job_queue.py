@@ -0,0 +1,133 @@
+import time
+
+import pytest
+
+from config import RATE_LIMIT_RPM
+from llm import scheduler
+from llm.job_queue import JobQueue, work
+
+
+@pytest.fixture
+def job_queue(tmp_path):
+    queue = JobQueue(tmp_path / "jobs.db")
+    yield queue
+    queue.close()
+
+
+def test_enqueue_same_chart_twice_is_a_no_op(job_queue, chart):
+    assert job_queue.enqueue(chart) is not None
+    assert job_queue.enqueue(chart) is None
+    assert job_queue.progress()["queued"] == 1
+
+
+def test_leased_job_is_hidden_from_other_workers(job_queue, chart):
+    job_queue.enqueue(chart)
+    job = job_queue.lease("worker-a", visibility_timeout=60)
+    assert job["patient_data"]["patient_id"] == chart["patient_id"]
+    assert job["attempts"] == 1
+    assert job_queue.lease("worker-b", visibility_timeout=60) is None
+
+
+def test_expired_lease_is_taken_over(job_queue, chart):
+    job_queue.enqueue(chart)
+    job = job_queue.lease("worker-a", visibility_timeout=0.01)
+    time.sleep(0.05)
+
+    taken = job_queue.lease("worker-b", visibility_timeout=60)
+    assert taken["id"] == job["id"]
+    assert taken["attempts"] == 2
+    # The slow worker lost its lease: it can neither extend nor complete
+    assert not job_queue.extend(job["id"], "worker-a")
+    assert not job_queue.complete(job["id"], "worker-a", "stale summary")
+
+    assert job_queue.complete(job["id"], "worker-b", "summary")
+    assert list(job_queue.summaries()) == [(chart["patient_id"], "summary")]
+
+
+def test_extended_lease_is_not_taken_over(job_queue, chart):
+    job_queue.enqueue(chart)
+    job = job_queue.lease("worker-a", visibility_timeout=0.05)
+    assert job_queue.extend(job["id"], "worker-a", visibility_timeout=60)
+    time.sleep(0.1)
+    assert job_queue.lease("worker-b") is None
+
+
+def test_failed_job_is_retried_after_a_backoff(job_queue, chart):
+    job_queue.enqueue(chart)
+    job = job_queue.lease("worker-a")
+
+    assert job_queue.fail(job["id"], "worker-a", "boom", retry_delay=0.05) == "queued"
+    assert job_queue.lease("worker-a") is None
+    time.sleep(0.1)
+    retried = job_queue.lease("worker-a")
+    assert retried["id"] == job["id"]
+    assert retried["last_error"] == "boom"
+
+
+def test_job_is_dead_lettered_after_its_last_attempt(job_queue, chart):
+    job_queue.enqueue(chart, max_attempts=2)
+    for attempt in range(2):
+        job = job_queue.lease("worker-a")
+        status = job_queue.fail(job["id"], "worker-a", f"boom {attempt}", retry_delay=0)
+    assert status == "dead"
+    assert job_queue.lease("worker-a") is None
+    [dead] = job_queue.dead_letters()
+    assert dead["last_error"] == "boom 1"
+
+    assert job_queue.requeue_dead() == 1
+    assert job_queue.lease("worker-a")["attempts"] == 1
+
+
+def test_expired_lease_on_last_attempt_is_dead_lettered(job_queue, chart):
+    job_queue.enqueue(chart, max_attempts=1)
+    job_queue.lease("worker-a", visibility_timeout=0.01)
+    time.sleep(0.05)
+
+    assert job_queue.lease("worker-b") is None
+    assert job_queue.progress()["dead"] == 1
+    assert "worker-a" in job_queue.dead_letters()[0]["last_error"]
+
+
+def test_fail_after_losing_the_lease_is_ignored(job_queue, chart):
+    job_queue.enqueue(chart)
+    job = job_queue.lease("worker-a", visibility_timeout=0.01)
+    time.sleep(0.05)
+    job_queue.lease("worker-b", visibility_timeout=60)
+
+    assert job_queue.fail(job["id"], "worker-a", "boom") is None
+    assert job_queue.progress()["leased"] == 1
+
+
+class EchoGenerator:
+    def generate_summary(self, patient_data, template_type=None, strategy=None):
+        return f"Summary for {patient_data['patient_id']}"
+
+
+def test_worker_drains_the_queue_into_files(tmp_path, make_chart, monkeypatch):
+    queue = JobQueue(tmp_path / "jobs.db")
+    for patient_id in ("P1", "P2"):
+        queue.enqueue(make_chart(patient_id))
+    complete = JobQueue.complete
+
+    def complete_after_writing(self, job_id, worker_id, summary):
+        # Once done the job is never retried, so its file must exist by then
+        assert (tmp_path / "out" / f"P{job_id}.txt").exists()
+        return complete(self, job_id, worker_id, summary)
+
+    monkeypatch.setattr(JobQueue, "complete", complete_after_writing)
+    completed = work(tmp_path / "jobs.db", tmp_path / "out", generator=EchoGenerator())
+
+    assert completed == 2
+    assert (tmp_path / "out" / "P2.txt").read_text() == "Summary for P2"
+    assert queue.progress()["done"] == 2
+    queue.close()
+
+
+def test_workers_split_the_rate_limits(tmp_path, monkeypatch):
+    monkeypatch.setattr(scheduler, "_rate_shares", 1)
+    monkeypatch.setattr(scheduler, "_default_scheduler", None)
+
+    work(tmp_path / "jobs.db", workers=4)
+
+    bucket = scheduler.get_default_scheduler().request_bucket
+    assert bucket.capacity == RATE_LIMIT_RPM / 4
@@ -0,0 +1,175 @@
+import asyncio
+import threading
+
+import openai
+import pytest
+
+from llm import map_reduce
+from llm.backends import MockBackend
+from llm.cache import SummaryCache
+from llm.discharge_generator import DischargeSummaryGenerator
+from llm.model_router import ModelRouter
+from llm.scheduler import RequestScheduler
+
+
+class RecordingBackend(MockBackend):
+    """Mock backend that records each request's prompt, optionally failing some."""
+
+    def __init__(self, fail_first=None):
+        super().__init__("recording", "mock")
+        self.prompts = []
+        self._fail_first = fail_first
+        self._lock = threading.Lock()
+
+    def complete(self, params):
+        prompt = params["messages"][0]["content"] + params["messages"][1]["content"]
+        with self._lock:
+            self.prompts.append(prompt)
+            if self._fail_first and self._fail_first in prompt:
+                self._fail_first = None
+                raise openai.APIConnectionError(request=None)
+        return super().complete(params)
+
+    def section_calls(self):
+        return [p for p in self.prompts if map_reduce.SECTION_INSTRUCTIONS in p]
+
+
+class RecordingAuditLog:
+    def __init__(self):
+        self.records = []
+
+    def record(self, **fields):
+        self.records.append(fields)
+
+
+def _generator(backend, **kwargs):
+    return DischargeSummaryGenerator(
+        backend=backend,
+        cache=None,
+        audit_log=RecordingAuditLog(),
+        router=ModelRouter(candidates=[]),
+        **kwargs,
+    )
+
+
+def test_chart_is_split_into_sections_with_context(chart):
+    parts = map_reduce.split_sections({**chart, "imaging_extra": ["CT head"]})
+
+    assert [section.name for section, _ in parts] == [
+        "hospital_course",
+        "labs",
+        "medications",
+    ]
+    for _, section_chart in parts:
+        assert section_chart["patient_id"] == chart["patient_id"]
+        assert section_chart["diagnoses"] == chart["diagnoses"]
+    hospital_course = parts[0][1]
+    # Keys no section claims go to the hospital course
+    assert hospital_course["imaging_extra"] == ["CT head"]
+    assert "labs" not in hospital_course
+
+
+def test_sections_are_drafted_then_merged(chart):
+    backend = RecordingBackend()
+    generator = _generator(backend)
+    timings = {}
+
+    summary = generator.generate_summary(chart, timings=timings, strategy="map_reduce")
+
+    assert summary
+    assert len(backend.section_calls()) == 3
+    merge = backend.prompts[-1]
+    assert map_reduce.DRAFTS_HEADING in merge
+    for title in ("Hospital Course", "Laboratory Results", "Medications"):
+        assert f"## {title}" in merge
+    assert "map_sections" in timings
+    # Only the merge call, which writes the summary, is a router sample
+    assert generator.router.stats()["recording"]["samples"] == 1
+
+
+def test_async_sections_are_drafted_then_merged(chart):
+    backend = RecordingBackend()
+    generator = _generator(backend)
+
+    summary = asyncio.run(generator.agenerate_summary(chart, strategy="map_reduce"))
+
+    assert summary == _generator(MockBackend("recording")).generate_summary(
+        chart, strategy="map_reduce"
+    )
+    assert len(backend.prompts) == 4
+
+
+@pytest.mark.parametrize("use_async", [False, True])
+def test_section_retries_are_counted_into_the_call(chart, use_async):
+    backend = RecordingBackend(fail_first="Summarize the laboratory results")
+    scheduler = RequestScheduler(0, 0, max_retries=1, base_delay=0, max_delay=0)
+    generator = _generator(backend, scheduler=scheduler)
+
+    if use_async:
+        asyncio.run(generator.agenerate_summary(chart, strategy="map_reduce"))
+    else:
+        generator.generate_summary(chart, strategy="map_reduce")
+
+    [audited] = generator.audit_log.records
+    assert audited["retries"] == 1
+    assert audited["error"] is None
+    assert len(backend.section_calls()) == 4
+
+
+def test_chart_without_section_data_is_summarized_in_one_call(chart):
+    backend = RecordingBackend()
+    context = {key: chart[key] for key in map_reduce.CONTEXT_KEYS if key in chart}
+
+    _generator(backend).generate_summary(context, strategy="map_reduce")
+
+    assert len(backend.prompts) == 1
+    assert not backend.section_calls()
+
+
+@pytest.fixture
+def section_cache(monkeypatch):
+    cache = SummaryCache()
+    monkeypatch.setattr("llm.cache._section_cache", cache)
+    return cache
+
+
+def test_unchanged_sections_are_reused(chart, section_cache):
+    backend = RecordingBackend()
+    generator = _generator(backend)
+    generator.generate_summary(chart, strategy="incremental")
+    assert len(backend.section_calls()) == 3
+
+    backend.prompts.clear()
+    generator.generate_summary(chart, strategy="incremental")
+
+    assert backend.section_calls() == []
+    assert generator.audit_log.records[-1]["sections_reused"] == 3
+
+
+def test_only_changed_sections_are_drafted_again(chart, section_cache):
+    backend = RecordingBackend()
+    generator = _generator(backend)
+    generator.generate_summary(chart, strategy="incremental")
+    new_lab = {"date": "2024-03-15", "tests": [{"name": "CBC", "result": "Normal"}]}
+    updated = {**chart, "labs": chart["labs"] + [new_lab]}
+
+    assert map_reduce.changed_sections(updated, "mock") == ["labs"]
+    backend.prompts.clear()
+    generator.generate_summary(updated, strategy="incremental")
+
+    [drafted] = backend.section_calls()
+    assert "Summarize the laboratory results" in drafted
+    assert generator.audit_log.records[-1]["sections_reused"] == 2
+
+
+def test_new_patient_has_every_section_drafted(chart, section_cache):
+    assert map_reduce.changed_sections(chart, "mock") == [
+        "hospital_course",
+        "labs",
+        "medications",
+    ]
+    backend = RecordingBackend()
+    generator = _generator(backend)
+    generator.generate_summary(chart, strategy="incremental")
+
+    assert generator.audit_log.records[-1]["sections_reused"] == 0
@@ -0,0 +1,142 @@
+import time
+
+import openai
+import pytest
+
+from llm.backends import MockBackend
+from llm.discharge_generator import DischargeSummaryGenerator
+from llm.model_router import HedgedStream, ModelRouter
+from llm.scheduler import RequestScheduler
+
+
+def _router(**kwargs):
+    options = {
+        "candidates": ["primary", "secondary", "tertiary"],
+        "slos": {},
+        "default_slo": 1.0,
+        "min_samples": 3,
+        "max_error_rate": 0.5,
+    }
+    return ModelRouter(**{**options, **kwargs})
+
+
+def _record(router, backend, latency, count=3, **outcome):
+    for _ in range(count):
+        router.record(backend, latency, **outcome)
+
+
+def _names(backends):
+    return [backend.name for backend in backends]
+
+
+def test_candidates_without_samples_keep_their_order():
+    assert _names(_router().choose("general")) == ["primary", "secondary", "tertiary"]
+
+
+def test_first_candidate_meeting_the_slo_is_chosen():
+    router = _router()
+    _record(router, "primary", 2.0)
+    _record(router, "secondary", 0.5)
+
+    assert _names(router.choose("general")) == ["secondary", "primary", "tertiary"]
+    assert _names(router.choose("slow"))[0] == "secondary"
+    router.slos["slow"] = 5.0
+    assert _names(router.choose("slow"))[0] == "primary"
+
+
+def test_failing_candidates_go_last():
+    router = _router()
+    _record(router, "primary", None, error=True)
+
+    assert _names(router.choose("general")) == ["secondary", "tertiary", "primary"]
+
+
+def test_fastest_tail_wins_when_no_candidate_meets_the_slo():
+    router = _router(candidates=["primary", "secondary"])
+    _record(router, "primary", 3.0)
+    _record(router, "secondary", 2.0)
+
+    assert _names(router.choose("general")) == ["secondary", "primary"]
+
+
+def test_lost_races_count_as_slo_misses():
+    router = _router(candidates=["primary", "secondary"])
+    _record(router, "primary", 0.1, count=10)
+    router.record("primary", lost_race=True)
+    _record(router, "secondary", 0.5)
+
+    assert router.stats()["primary"]["lost_race_rate"] > 0.05
+    assert _names(router.choose("general"))[0] == "secondary"
+
+
+class FlakyBackend(MockBackend):
+    """
+    Mock backend whose first ``failures`` requests fail to connect at once,
+    and whose other requests take ``latency`` seconds.
+    """
+
+    def __init__(self, name, latency=0.0, failures=0, max_retries=0):
+        super().__init__(
+            name,
+            f"mock-{name}",
+            scheduler=RequestScheduler(
+                0, 0, max_retries=max_retries, base_delay=0, max_delay=0
+            ),
+        )
+        self.stall = latency
+        self.failures = failures
+
+    def complete(self, params):
+        if self.failures:
+            self.failures -= 1
+            raise openai.APIConnectionError(request=None)
+        time.sleep(self.stall)
+        return super().complete(params)
+
+
+def _race(chart, primary, hedge, delay=0.05):
+    generator = DischargeSummaryGenerator(
+        backend=primary, cache=None, audit_log=None, router=_router()
+    )
+    call = generator._start_call(chart)
+    call["backends"] = [primary, hedge]
+    request = generator._request_for_call(call)
+    stream = HedgedStream(generator, request, call, delay)
+    text = "".join(
+        chunk.choices[0].delta.content or "" for chunk in stream if chunk.choices
+    )
+    return generator, call, request, stream, text
+
+
+def test_hedge_wins_when_the_primary_is_slow(chart):
+    slow = FlakyBackend("slow", latency=0.5, failures=1, max_retries=1)
+    fast = FlakyBackend("fast")
+
+    generator, call, request, stream, text = _race(chart, slow, fast)
+
+    assert stream.winner["backend"] is fast
+    assert text.startswith("DISCHARGE SUMMARY (fast")
+    assert (call["backend"], call["model"]) == ("fast", "mock-fast")
+    assert request["model"] == "mock-fast"
+    # The slow backend retried before losing; that is not the call's retry
+    assert slow.failures == 0
+    assert call["retries"] == 0
+    stats = generator.router.stats()
+    assert stats["slow"]["lost_race_rate"] == 1.0
+    assert stats["slow"]["p95_latency"] is None
+    assert stats["fast"]["p95_first_token"] is not None
+
+
+def test_failed_primary_is_hedged_at_once(chart):
+    failing = FlakyBackend("failing", failures=1)
+    hedge = FlakyBackend("hedge")
+
+    _, call, _, stream, _ = _race(chart, failing, hedge, delay=30)
+
+    assert stream.winner["backend"] is hedge
+    assert call["backend"] == "hedge"
+
+
+def test_race_fails_when_both_backends_fail(chart):
+    with pytest.raises(openai.APIConnectionError):
+        _race(chart, FlakyBackend("a", failures=1), FlakyBackend("b", failures=1))
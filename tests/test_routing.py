@@ -0,0 +1,120 @@
+import json
+import os
+
+import pytest
+
+from llm.routing import (
+    DEFAULT_RULES_PATH,
+    RoutingRulesError,
+    RoutingTable,
+    expand_icd10_range,
+    get_routing_table,
+)
+
+RULES = {
+    "default": "general",
+    "rules": [
+        {"name": "cardiac", "template": "cardiac", "icd10": ["I"]},
+        {"name": "stroke", "template": "emergency", "icd10": ["I60-I64"]},
+        {
+            "name": "anticoagulant bleed",
+            "template": "medication_focused",
+            "icd10": ["D68.32"],
+            "priority": 5,
+        },
+        {
+            "name": "respiratory",
+            "template": "respiratory",
+            "icd10": ["J"],
+            "diagnoses": "primary",
+        },
+        {"name": "surgical drg", "template": "surgical", "drg": ["001-050"]},
+        {
+            "name": "polypharmacy",
+            "template": "medication_focused",
+            "min_med_orders": 10,
+        },
+    ],
+}
+
+
+@pytest.fixture
+def table():
+    return RoutingTable(RULES)
+
+
+@pytest.fixture
+def with_diagnoses(chart):
+    def make(*codes, **fields):
+        diagnoses = [{"diagnosis_code": code, "description": code} for code in codes]
+        return {**chart, "diagnoses": diagnoses, **fields}
+
+    return make
+
+
+def test_icd10_ranges_expand_to_prefixes():
+    assert expand_icd10_range("I60-I64") == ["I60", "I61", "I62", "I63", "I64"]
+    assert expand_icd10_range("c98-D01") == ["C98", "C99", "D00", "D01"]
+    assert expand_icd10_range("T78.2") == ["T782"]
+    for malformed in ("I6-I640", "I64-I60", "D00-C99"):
+        with pytest.raises(RoutingRulesError):
+            expand_icd10_range(malformed)
+
+
+def test_most_specific_prefix_wins(table):
+    assert table.route_code("I61.9") == "emergency"
+    assert table.route_code("I21.4") == "cardiac"
+    assert table.route_code("Z00") == "general"
+
+
+def test_priority_beats_an_earlier_diagnosis(table, with_diagnoses):
+    decision = table.route(with_diagnoses("I21.4", "D68.32"))
+    assert decision == ("medication_focused", "anticoagulant bleed", "icd10:D68.32")
+
+
+def test_earlier_diagnosis_wins_a_tie(table, with_diagnoses):
+    assert table.route(with_diagnoses("I63.9", "I21.4")).template == "emergency"
+    assert table.route(with_diagnoses("I21.4", "I63.9")).template == "cardiac"
+
+
+def test_primary_only_rules_ignore_secondary_diagnoses(table, with_diagnoses):
+    assert table.route(with_diagnoses("J18.9")).template == "respiratory"
+    assert table.route(with_diagnoses("Z00", "J18.9")).template == "general"
+
+
+def test_drg_and_medication_rules(table, with_diagnoses):
+    assert table.route(with_diagnoses("Z00", drg={"code": "23"})).rule == "surgical drg"
+    med_orders = [{"medication": f"drug {i}"} for i in range(10)]
+    decision = table.route(with_diagnoses("Z00", med_orders=med_orders))
+    assert decision.matched == "med_orders:10"
+
+
+def test_unmatched_chart_gets_the_default(table, with_diagnoses):
+    assert table.route(with_diagnoses("Z00")) == ("general", None, "default")
+
+
+def test_bundled_rules_route_the_sample_chart(chart):
+    assert RoutingTable.load(DEFAULT_RULES_PATH).route(chart).template == "emergency"
+
+
+def test_rules_naming_unknown_templates_are_rejected():
+    with pytest.raises(RoutingRulesError):
+        RoutingTable({"rules": [{"template": "dental", "icd10": ["K02"]}]})
+
+
+def test_rules_file_is_reloaded_when_it_changes(tmp_path):
+    path = tmp_path / "rules.json"
+    path.write_text(json.dumps(RULES))
+    first = get_routing_table(path)
+    assert get_routing_table(path) is first
+
+    path.write_text(json.dumps({"default": "surgical", "rules": []}))
+    stat = os.stat(path)
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+    reloaded = get_routing_table(path)
+    assert reloaded.default == "surgical"
+
+    # A broken edit keeps the last good table
+    path.write_text("{not json")
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 2 * 10**9))
+    assert get_routing_table(path) is reloaded
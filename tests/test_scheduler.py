@@ -0,0 +1,147 @@
+import httpx
+import openai
+import pytest
+
+from llm import scheduler
+from llm.scheduler import (
+    CircuitBreaker,
+    CircuitOpenError,
+    RequestScheduler,
+    TokenBucket,
+    parse_duration,
+)
+
+
+class Clock:
+    """Stands in for the time module: sleeping advances the clock."""
+
+    def __init__(self):
+        self.now = 1000.0
+        self.sleeps = []
+
+    def monotonic(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(scheduler, "time", clock)
+    return clock
+
+
+def _api_error(status, headers=None):
+    response = httpx.Response(
+        status, headers=headers, request=httpx.Request("POST", "http://llm/v1")
+    )
+    error_type = openai.RateLimitError if status == 429 else openai.APIStatusError
+    return error_type(f"HTTP {status}", response=response, body=None)
+
+
+def _failing(*errors):
+    """A call that raises ``errors`` in turn, then returns "ok"."""
+    errors = list(errors)
+
+    def call():
+        if errors:
+            raise errors.pop(0)
+        return "ok"
+
+    return call
+
+
+def test_parse_duration():
+    assert parse_duration("1.5") == 1.5
+    assert parse_duration("6m0s") == 360
+    assert parse_duration("20ms") == pytest.approx(0.02)
+    assert parse_duration("soon") is None
+    assert parse_duration(None) is None
+
+
+def test_bucket_makes_callers_wait_for_the_refill(clock):
+    bucket = TokenBucket(per_minute=60)
+    assert bucket.reserve(60) == 0
+    assert bucket.reserve(2) == pytest.approx(2)
+    clock.now += 2
+    assert bucket.reserve(1) == pytest.approx(1)
+
+
+def test_bucket_follows_the_providers_remaining_count(clock):
+    bucket = TokenBucket(per_minute=60)
+    bucket.limit_to(0)
+    assert bucket.reserve(1) == pytest.approx(1)
+    assert TokenBucket(per_minute=0).reserve(10**6) == 0
+
+
+def test_breaker_opens_after_repeated_failures(clock):
+    breaker = CircuitBreaker(failure_threshold=2, reset_timeout=30)
+    breaker.record_failure()
+    breaker.check()
+    breaker.record_failure()
+
+    with pytest.raises(CircuitOpenError) as excinfo:
+        breaker.check()
+    assert excinfo.value.retry_after == pytest.approx(30)
+
+
+def test_breaker_lets_one_trial_through_once_reset(clock):
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=30)
+    breaker.record_failure()
+    clock.now += 30
+
+    breaker.check()
+    assert breaker.state == "half_open"
+    with pytest.raises(CircuitOpenError):
+        breaker.check()
+
+    # A failed trial opens the breaker again, a successful one closes it
+    breaker.record_failure()
+    assert breaker.state == "open"
+    clock.now += 30
+    breaker.check()
+    breaker.record_success()
+    assert breaker.state == "closed"
+    breaker.check()
+
+
+def test_rate_limited_call_is_retried_after_retry_after(clock):
+    requests = RequestScheduler(0, 0, max_retries=2, max_delay=60)
+    stats = {}
+
+    result = requests.call(
+        _failing(_api_error(429, {"retry-after": "2"}), _api_error(503)), stats=stats
+    )
+
+    assert result == "ok"
+    assert stats["retries"] == 2
+    assert clock.sleeps[0] == 2
+
+
+def test_retries_give_up_after_max_retries(clock):
+    requests = RequestScheduler(0, 0, max_retries=1)
+    with pytest.raises(openai.APIStatusError):
+        requests.call(_failing(_api_error(500), _api_error(500)))
+    assert len(clock.sleeps) == 1
+
+
+def test_bad_request_is_not_retried_or_held_against_the_provider(clock):
+    breaker = CircuitBreaker(failure_threshold=1)
+    requests = RequestScheduler(0, 0, max_retries=3, breaker=breaker)
+
+    with pytest.raises(openai.APIStatusError):
+        requests.call(_failing(_api_error(400)))
+    assert clock.sleeps == []
+    assert breaker.state == "closed"
+
+
+def test_calls_wait_for_the_rate_limit(clock):
+    requests = RequestScheduler(requests_per_minute=60, tokens_per_minute=0)
+    stats = {}
+    for _ in range(61):
+        requests.call(lambda: "ok", stats=stats)
+    assert stats["wait_seconds"] == pytest.approx(1)
+
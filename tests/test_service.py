@@ -0,0 +1,150 @@
+import http.client
+import json
+import threading
+
+import pytest
+
+from llm.service import GenerationService, ServiceBusy, make_server
+
+
+class GatedGenerator:
+    """Stands in for DischargeSummaryGenerator; calls block until released."""
+
+    model = "mock"
+
+    def __init__(self):
+        self.gate = threading.Event()
+        self.calls = []
+
+    def _resolve_template_type(self, record, template_type=None):
+        return template_type or "general"
+
+    def generate_summary(self, patient_data, template_type=None, strategy=None):
+        self.calls.append(patient_data.patient_id)
+        self.gate.wait(5)
+        return f"Summary for {patient_data.patient_id}"
+
+
+@pytest.fixture
+def generator():
+    generator = GatedGenerator()
+    yield generator
+    generator.gate.set()
+
+
+@pytest.fixture
+def service(generator):
+    service = GenerationService(generator, workers=1, queue_size=1)
+    yield service
+    generator.gate.set()
+    service.close(timeout=5)
+
+
+@pytest.fixture
+def server(service):
+    server = make_server(service, "127.0.0.1", 0, sync_timeout=5)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def _request(server, method, path, body=None, headers=None):
+    connection = http.client.HTTPConnection("127.0.0.1", server.server_port, timeout=5)
+    payload = json.dumps(body).encode() if body is not None else None
+    connection.request(method, path, payload, headers or {})
+    response = connection.getresponse()
+    return response, response.read()
+
+
+def _wait_until_running(service):
+    for _ in range(100):
+        if service.stats()["running"]:
+            return
+        threading.Event().wait(0.01)
+    raise AssertionError("job never started")
+
+
+def test_identical_requests_share_one_job(service, generator, chart):
+    job, coalesced = service.submit(chart)
+    again, again_coalesced = service.submit(chart)
+
+    assert (coalesced, again_coalesced) == (False, True)
+    assert again is job
+    generator.gate.set()
+    assert job.done.wait(5)
+    assert job.summary == f"Summary for {chart['patient_id']}"
+    assert job.to_dict()["coalesced_requests"] == 1
+    assert generator.calls == [chart["patient_id"]]
+
+
+def test_finished_job_is_not_coalesced_onto(service, generator, chart):
+    generator.gate.set()
+    job, _ = service.submit(chart)
+    assert job.done.wait(5)
+
+    again, coalesced = service.submit(chart)
+    assert not coalesced and again is not job
+
+
+def test_full_queue_rejects_new_jobs(service, make_chart):
+    service.submit(make_chart("P1"))
+    _wait_until_running(service)
+    service.submit(make_chart("P2"))
+
+    with pytest.raises(ServiceBusy) as excinfo:
+        service.submit(make_chart("P3"))
+    assert excinfo.value.retry_after >= 1
+
+
+def test_http_jobs_coalesce_and_then_get_429(server, service, generator, make_chart):
+    response, body = _request(
+        server, "POST", "/v1/jobs", {"patient_data": make_chart("P1")}
+    )
+    assert response.status == 202
+    job = json.loads(body)
+    assert response.getheader("Location") == f"/v1/jobs/{job['job_id']}"
+    _wait_until_running(service)
+
+    response, body = _request(
+        server, "POST", "/v1/jobs", {"patient_data": make_chart("P1")}
+    )
+    assert json.loads(body)["coalesced"] is True
+    assert json.loads(body)["job_id"] == job["job_id"]
+
+    _request(server, "POST", "/v1/jobs", {"patient_data": make_chart("P2")})
+    response, _ = _request(
+        server, "POST", "/v1/jobs", {"patient_data": make_chart("P3")}
+    )
+    assert response.status == 429
+    assert int(response.getheader("Retry-After")) >= 1
+
+    generator.gate.set()
+    response, body = _request(
+        server, "POST", "/v1/summaries", {"patient_data": make_chart("P1")}
+    )
+    assert response.status == 200
+    assert json.loads(body)["summary"] == "Summary for P1"
+
+
+def test_oversized_body_closes_the_connection(server, monkeypatch):
+    monkeypatch.setattr("llm.service.SERVICE_MAX_BODY_BYTES", 16)
+    smuggled = b"GET /healthz HTTP/1.1\r\nHost: x\r\n\r\n"
+    connection = http.client.HTTPConnection("127.0.0.1", server.server_port, timeout=5)
+    connection.request("POST", "/v1/summaries", b"x" * 32 + smuggled)
+    response = connection.getresponse()
+
+    assert response.status == 413
+    assert response.will_close
+
+
+@pytest.mark.parametrize("length", ["abc", "-5"])
+def test_invalid_content_length_is_rejected(server, length):
+    connection = http.client.HTTPConnection("127.0.0.1", server.server_port, timeout=5)
+    connection.putrequest("POST", "/v1/summaries")
+    connection.putheader("Content-Length", length)
+    connection.endheaders()
+    response = connection.getresponse()
+
+    assert response.status == 400
+    assert response.will_close
@@ -0,0 +1,200 @@
+"""
+Incremental, columnar index over application log files.
+
+Each log line ("YYYY-MM-DD HH:MM:SS | LEVEL | message") is parsed once, when
+it is first seen, into numpy columns: level code, epoch timestamp, byte offset
+of the line and of its message. Later refreshes only read bytes appended
+since the last one. Filters are evaluated as vectorized masks, text search
+runs over a memory map of the file, and message text is only read back for
+the rows actually displayed.
+"""
+
+import mmap
+import os
+import re
+import threading
+
+import numpy as np
+import pandas as pd
+
+LEVELS = ["TRACE", "DEBUG", "INFO", "SUCCESS", "WARNING", "ERROR", "CRITICAL"]
+_LEVEL_CODES = {name: code for code, name in enumerate(LEVELS)}
+_UNKNOWN_LEVEL = len(LEVELS)
+
+SEPARATOR = b" | "
+TIMESTAMP_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+
+class LogIndex:
+    """
+    Index over a single log file that tracks how far it has read.
+    """
+
+    def __init__(self, path):
+        self.path = str(path)
+        self._lock = threading.Lock()
+        self._reset()
+
+    def _reset(self):
+        self._read_offset = 0
+        self._inode = None
+        self.levels = np.empty(0, dtype=np.int8)
+        self.timestamps = np.empty(0, dtype=np.int64)
+        self.line_offsets = np.empty(0, dtype=np.int64)
+        self.message_offsets = np.empty(0, dtype=np.int64)
+        self.line_ends = np.empty(0, dtype=np.int64)
+
+    def __len__(self):
+        return len(self.levels)
+
+    def refresh(self):
+        """
+        Index lines appended since the last refresh.
+
+        The index is rebuilt from scratch if the file was rotated or
+        truncated. A trailing partial line is left for the next refresh.
+
+        Returns:
+            int: Number of newly indexed entries
+        """
+        with self._lock:
+            try:
+                stat = os.stat(self.path)
+            except FileNotFoundError:
+                self._reset()
+                return 0
+
+            if stat.st_ino != self._inode or stat.st_size < self._read_offset:
+                self._reset()
+                self._inode = stat.st_ino
+            if stat.st_size == self._read_offset:
+                return 0
+
+            with open(self.path, "rb") as f:
+                f.seek(self._read_offset)
+                data = f.read(stat.st_size - self._read_offset)
+
+            complete = data.rfind(b"\n") + 1
+            if complete == 0:
+                return 0
+            added = self._index_chunk(data[:complete], self._read_offset)
+            self._read_offset += complete
+            return added
+
+    def _index_chunk(self, chunk, base_offset):
+        """Parse a chunk of complete lines and append them to the columns."""
+        lines = chunk.split(b"\n")[:-1]
+        starts = np.empty(len(lines), dtype=np.int64)
+        position = base_offset
+        for i, line in enumerate(lines):
+            starts[i] = position
+            position += len(line) + 1
+
+        # Lines that don't match the log format (e.g. traceback continuation
+        # lines) are skipped, as the viewer has always done
+        timestamps, levels, message_starts, keep = [], [], [], []
+        for i, line in enumerate(lines):
+            first = line.find(SEPARATOR)
+            second = line.find(SEPARATOR, first + 3) if first >= 0 else -1
+            if second < 0:
+                continue
+            keep.append(i)
+            timestamps.append(line[:first].decode("utf-8", "replace"))
+            level = line[first + 3 : second].decode("utf-8", "replace").strip()
+            levels.append(_LEVEL_CODES.get(level, _UNKNOWN_LEVEL))
+            message_starts.append(second + 3)
+
+        if not keep:
+            return 0
+
+        keep = np.asarray(keep, dtype=np.int64)
+        line_starts = starts[keep]
+        line_ends = line_starts + np.fromiter(
+            (len(lines[i]) for i in keep), dtype=np.int64, count=len(keep)
+        )
+        # One vectorized parse per chunk; unparseable timestamps become -1
+        parsed = pd.to_datetime(
+            pd.Series(timestamps), format=TIMESTAMP_FORMAT, errors="coerce"
+        )
+        epoch = np.where(
+            parsed.isna(), -1, parsed.values.astype("datetime64[s]").astype(np.int64)
+        )
+
+        self.levels = np.concatenate([self.levels, np.asarray(levels, np.int8)])
+        self.timestamps = np.concatenate([self.timestamps, epoch.astype(np.int64)])
+        self.line_offsets = np.concatenate([self.line_offsets, line_starts])
+        self.message_offsets = np.concatenate(
+            [self.message_offsets, line_starts + np.asarray(message_starts)]
+        )
+        self.line_ends = np.concatenate([self.line_ends, line_ends])
+        return len(keep)
+
+    def filter(self, level=None, search_term=None, start=None, end=None):
+        """
+        Return the row numbers of entries matching all given criteria.
+
+        Args:
+            level (str, optional): Exact log level to keep
+            search_term (str, optional): Case-insensitive text to find in messages
+            start (int, optional): Earliest epoch timestamp (inclusive)
+            end (int, optional): Latest epoch timestamp (exclusive)
+
+        Returns:
+            numpy.ndarray: Matching row numbers in file order
+        """
+        mask = np.ones(len(self), dtype=bool)
+        if level:
+            mask &= self.levels == _LEVEL_CODES.get(level, _UNKNOWN_LEVEL)
+        if start is not None:
+            mask &= self.timestamps >= start
+        if end is not None:
+            mask &= self.timestamps < end
+        if search_term:
+            mask &= self._search_mask(search_term)
+        return np.flatnonzero(mask)
+
+    def _search_mask(self, search_term):
+        """Mark entries whose message contains the search term."""
+        found = np.zeros(len(self), dtype=bool)
+        if not len(self):
+            return found
+
+        pattern = re.compile(re.escape(search_term.encode("utf-8")), re.IGNORECASE)
+        with open(self.path, "rb") as f:
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                limit = int(self.line_ends[-1])
+                positions = np.fromiter(
+                    (m.start() for m in pattern.finditer(mm, 0, limit)),
+                    dtype=np.int64,
+                )
+        if not len(positions):
+            return found
+
+        rows = np.searchsorted(self.line_offsets, positions, side="right") - 1
+        valid = (rows >= 0) & (positions >= self.message_offsets[rows.clip(0)])
+        valid &= positions < self.line_ends[rows.clip(0)]
+        found[rows[valid]] = True
+        return found
+
+    def read_rows(self, rows):
+        """
+        Read the log entries for the given row numbers.
+
+        Args:
+            rows (array-like): Row numbers from filter()
+
+        Returns:
+            list: Dicts with "timestamp", "level" and "message"
+        """
+        entries = []
+        with open(self.path, "rb") as f:
+            for row in rows:
+                f.seek(int(self.line_offsets[row]))
+                line = f.read(int(self.line_ends[row] - self.line_offsets[row]))
+                timestamp, level, message = line.decode("utf-8", "replace").split(
+                    " | ", 2
+                )
+                entries.append(
+                    {"timestamp": timestamp, "level": level.strip(), "message": message}
+                )
+        return entries
@@ -11,8 +11,8 @@ import json
 sys.path.insert(0, str(Path(__file__).parent.parent.parent))
 
 from llm.prompt_templates import TEMPLATE_MAP
-from llm.discharge_generator import DischargeSummaryGenerator
 from llm.utils import load_patient_data
+from ui.resources import get_generator
 import config
 
 
@@ -83,9 +83,7 @@ def main():
             if st.button("Compare Outputs"):
                 with st.spinner("Generating comparison..."):
                     try:
-                        generator = DischargeSummaryGenerator(
-                            api_key=api_key, model=model
-                        )
+                        generator = get_generator(api_key, model)
 
                         # Generate summary with original template
                         original_summary = generator.generate_summary(
@@ -94,17 +92,19 @@ def main():
                         )
 
                         # Override template temporarily for comparison
+                        original_template = TEMPLATE_MAP[template_name]
                         temp_template = st.session_state.edited_templates[template_name]
                         TEMPLATE_MAP[template_name] = temp_template
 
-                        # Generate with edited template
-                        edited_summary = generator.generate_summary(
-                            st.session_state.current_patient_data,
-                            template_type=template_name,
-                        )
-
-                        # Restore original template
-                        TEMPLATE_MAP[template_name] = TEMPLATE_MAP[template_name]
+                        try:
+                            # Generate with edited template
+                            edited_summary = generator.generate_summary(
+                                st.session_state.current_patient_data,
+                                template_type=template_name,
+                            )
+                        finally:
+                            # Restore original template
+                            TEMPLATE_MAP[template_name] = original_template
 
                         # Store results
                         st.session_state.comparison_output = {
@@ -7,12 +7,15 @@ import sys
 from pathlib import Path
 import glob
 import os
-import datetime
+
+import pandas as pd
 
 # Add the parent directory to path
 sys.path.insert(0, str(Path(__file__).parent.parent.parent))
 
 import config
+from llm.audit import get_default_audit_log
+from ui.log_index import LogIndex
 
 st.set_page_config(page_title="Log Viewer", page_icon="📊", layout="wide")
 
@@ -30,46 +33,10 @@ def get_log_files():
     return sorted(log_files, key=os.path.getmtime, reverse=True)
 
 
-def parse_log_line(line):
-    """Parse a log line into its components."""
-    try:
-        # Example format: 2025-04-12 15:31:57 | INFO | Starting web UI
-        parts = line.split(" | ", 2)
-        if len(parts) >= 3:
-            timestamp = parts[0]
-            level = parts[1]
-            message = parts[2]
-
-            return {"timestamp": timestamp, "level": level, "message": message}
-        return None
-    except Exception:
-        return None
-
-
-def filter_logs(logs, level=None, search_term=None, date_range=None):
-    """Filter logs based on criteria."""
-    filtered_logs = []
-
-    for log in logs:
-        if level and log["level"] != level:
-            continue
-
-        if search_term and search_term.lower() not in log["message"].lower():
-            continue
-
-        if date_range:
-            try:
-                log_date = datetime.datetime.strptime(
-                    log["timestamp"], "%Y-%m-%d %H:%M:%S"
-                ).date()
-                if log_date < date_range[0] or log_date > date_range[1]:
-                    continue
-            except Exception:
-                pass
-
-        filtered_logs.append(log)
-
-    return filtered_logs
+@st.cache_resource(show_spinner=False)
+def get_log_index(log_path):
+    """Return the log index for a file, kept across reruns."""
+    return LogIndex(log_path)
 
 
 def main():
@@ -112,71 +79,74 @@ def main():
 
         refresh_button = st.button("Refresh Logs")
 
+        # Pagination
+        page_size = st.selectbox("Entries per page", [50, 100, 250, 500], index=1)
+
+    # Generation metrics from the structured audit log
+    audit_log = get_default_audit_log()
+    if audit_log is not None:
+        with st.expander("Generation Metrics (last 24 hours)"):
+            metrics = audit_log.recent_stats(hours=24)
+            if metrics:
+                st.dataframe(metrics, use_container_width=True)
+            else:
+                st.info("No summaries generated in the last 24 hours")
+
     # Main content area
     st.subheader(f"Viewing: {selected_log.name if selected_log else ''}")
 
     if selected_log:
         try:
-            with open(selected_log, "r") as f:
-                log_content = f.readlines()
-
-            # Parse logs
-            parsed_logs = []
-            for line in log_content:
-                line = line.strip()
-                if line:
-                    parsed_log = parse_log_line(line)
-                    if parsed_log:
-                        parsed_logs.append(parsed_log)
-
-            # Apply filters
-            if level_filter != "All":
-                parsed_logs = [
-                    log for log in parsed_logs if log["level"] == level_filter
-                ]
-
-            if search_term:
-                parsed_logs = [
-                    log
-                    for log in parsed_logs
-                    if search_term.lower() in log["message"].lower()
-                ]
+            # Only lines appended since the last rerun are read and parsed
+            log_index = get_log_index(str(selected_log))
+            log_index.refresh()
 
+            start, end = None, None
             if date_range:
-                filtered_logs = []
-                for log in parsed_logs:
-                    try:
-                        log_date = datetime.datetime.strptime(
-                            log["timestamp"], "%Y-%m-%d %H:%M:%S"
-                        ).date()
-                        if date_range[0] <= log_date <= date_range[1]:
-                            filtered_logs.append(log)
-                    except Exception:
-                        pass
-                parsed_logs = filtered_logs
+                start = int(pd.Timestamp(date_range[0]).timestamp())
+                end = int(
+                    (pd.Timestamp(date_range[1]) + pd.Timedelta(days=1)).timestamp()
+                )
+
+            matches = log_index.filter(
+                level=None if level_filter == "All" else level_filter,
+                search_term=search_term or None,
+                start=start,
+                end=end,
+            )
 
             # Display logs
-            if parsed_logs:
-                log_data = []
-                for log in parsed_logs:
-                    log_data.append(
-                        {
-                            "Timestamp": log["timestamp"],
-                            "Level": log["level"],
-                            "Message": log["message"],
-                        }
-                    )
+            if len(matches):
+                page_count = (len(matches) - 1) // page_size + 1
+                page = st.number_input(
+                    f"Page (of {page_count})",
+                    min_value=1,
+                    max_value=page_count,
+                    value=1,
+                    step=1,
+                )
+                page_rows = matches[(page - 1) * page_size : page * page_size]
+
+                log_data = [
+                    {
+                        "Timestamp": log["timestamp"],
+                        "Level": log["level"],
+                        "Message": log["message"],
+                    }
+                    for log in log_index.read_rows(page_rows)
+                ]
 
                 st.dataframe(log_data, use_container_width=True)
-                st.info(f"Showing {len(log_data)} log entries")
+                st.info(
+                    f"Showing {len(log_data)} of {len(matches)} matching log entries "
+                    f"({len(log_index)} indexed)"
+                )
 
                 # Allow downloading filtered logs
-                if log_data:
+                if st.button("Prepare Download of Filtered Logs"):
                     log_text = "\n".join(
-                        [
-                            f"{log['Timestamp']} | {log['Level']} | {log['Message']}"
-                            for log in log_data
-                        ]
+                        f"{log['timestamp']} | {log['level']} | {log['message']}"
+                        for log in log_index.read_rows(matches)
                     )
                     st.download_button(
                         label="Download Filtered Logs",
@@ -13,8 +13,9 @@ import json
 sys.path.insert(0, str(Path(__file__).parent.parent.parent))
 
 import config
+from llm.scheduler import get_default_scheduler
 from llm.utils import setup_logging
-from openai import OpenAI
+from ui.resources import get_openai_client
 
 st.set_page_config(page_title="Chat Assistant", page_icon="💬", layout="wide")
 
@@ -27,29 +28,44 @@ st.markdown(
 logger = setup_logging(config.LOGS_DIR, config.LOG_LEVEL)
 
 
-def get_assistant_response(messages, api_key, model):
-    """Get a response from the LLM based on the conversation history."""
-    try:
-        client = OpenAI(api_key=api_key)
-        response = client.chat.completions.create(
-            model=model,
-            messages=[
-                {
-                    "role": "system",
-                    "content": """You are a helpful medical assistant specializing in discharge summaries.
+ASSISTANT_SYSTEM_PROMPT = """You are a helpful medical assistant specializing in discharge summaries.
                     You can answer questions about medical terminology, best practices for discharge summaries,
                     and how to use this application. Keep responses focused on medical discharge summaries
-                    and related healthcare topics. Be professional, accurate, and helpful.""",
-                },
-                *messages,
-            ],
-            temperature=0.3,
-            max_tokens=1000,
+                    and related healthcare topics. Be professional, accurate, and helpful."""
+
+
+def stream_assistant_response(messages, api_key, model):
+    """Stream a response from the LLM based on the conversation history."""
+    try:
+        client = get_openai_client(api_key)
+        # Share rate limits, retries and the circuit breaker with generation
+        stream = get_default_scheduler().call(
+            lambda: client.chat.completions.create(
+                model=model,
+                messages=[
+                    {"role": "system", "content": ASSISTANT_SYSTEM_PROMPT},
+                    *messages,
+                ],
+                temperature=0.3,
+                max_tokens=1000,
+                stream=True,
+            ),
+            tokens=1000,
         )
-        return response.choices[0].message.content
+        try:
+            for chunk in stream:
+                if chunk.choices and chunk.choices[0].delta.content:
+                    yield chunk.choices[0].delta.content
+        finally:
+            stream.close()
     except Exception as e:
         logger.error(f"Error getting assistant response: {str(e)}")
-        return f"Sorry, I encountered an error: {str(e)}"
+        yield f"Sorry, I encountered an error: {str(e)}"
+
+
+def get_assistant_response(messages, api_key, model):
+    """Get a response from the LLM based on the conversation history."""
+    return "".join(stream_assistant_response(messages, api_key, model))
 
 
 def main():
@@ -119,9 +135,11 @@ def main():
             for msg in st.session_state.chat_messages
         ]
 
-        # Get assistant response
-        with st.spinner("Thinking..."):
-            response_text = get_assistant_response(api_messages, api_key, model)
+        # Stream the assistant response as it arrives
+        with st.chat_message("assistant"):
+            response_text = st.write_stream(
+                stream_assistant_response(api_messages, api_key, model)
+            )
 
         # Add assistant message to chat history
         assistant_message = {
@@ -131,10 +149,6 @@ def main():
         }
         st.session_state.chat_messages.append(assistant_message)
 
-        # Display assistant response
-        with st.chat_message("assistant"):
-            st.write(response_text)
-
         # Log the interaction
         logger.info(
             f"Chat interaction - User: {prompt[:50]}{'...' if len(prompt) > 50 else ''}"
@@ -0,0 +1,20 @@
+"""
+Shared, cached resources for the Streamlit pages.
+"""
+
+import streamlit as st
+
+from llm import clients
+from llm.discharge_generator import DischargeSummaryGenerator
+
+
+@st.cache_resource(show_spinner=False)
+def get_generator(api_key, model):
+    """Return a generator reused across reruns and pages for a key and model."""
+    return DischargeSummaryGenerator(api_key=api_key, model=model)
+
+
+@st.cache_resource(show_spinner=False)
+def get_openai_client(api_key):
+    """Return the pooled OpenAI client for an API key."""
+    return clients.get_client(api_key)
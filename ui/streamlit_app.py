@@ -12,7 +12,12 @@ import sys
 # Add parent directory to path
 sys.path.insert(0, str(Path(__file__).parent.parent))
 
-from llm.discharge_generator import DischargeSummaryGenerator
+from llm.cache import get_default_cache
+from llm.model_router import get_default_router
+from llm.records import InvalidPatientRecord, as_record
+from llm.store import get_default_store
+from llm.utils import consume_stream
+from ui.resources import get_generator
 from llm.prompt_templates import TEMPLATE_MAP
 import config
 
@@ -31,50 +36,88 @@ def show_patient_overview(patient_data):
     if not patient_data:
         return
 
+    try:
+        record = as_record(patient_data)
+    except InvalidPatientRecord as e:
+        st.error(str(e))
+        return
+
     try:
         # Patient demographics
-        demo = patient_data.get("patient_demographics", {})
+        demo = record.patient_demographics
         col1, col2 = st.columns(2)
 
         with col1:
             st.subheader("Patient Information")
-            st.write(f"**Name:** {demo.get('name', 'N/A')}")
-            st.write(f"**Patient ID:** {patient_data.get('patient_id', 'N/A')}")
-            st.write(f"**Age:** {demo.get('age', 'N/A')}")
-            st.write(f"**Gender:** {demo.get('gender', 'N/A')}")
+            st.write(f"**Name:** {demo.name or 'N/A'}")
+            st.write(f"**Patient ID:** {record.patient_id}")
+            st.write(f"**Age:** {demo.age if demo.age is not None else 'N/A'}")
+            st.write(f"**Gender:** {demo.gender or 'N/A'}")
 
         with col2:
             st.subheader("Admission Details")
-            st.write(f"**Admission Date:** {demo.get('admission_date', 'N/A')}")
-            discharge_date = demo.get(
-                "discharge_date", demo.get("expected_discharge_date", "N/A")
+            st.write(f"**Admission Date:** {demo.admission_date or 'N/A'}")
+            discharge_label = (
+                "Expected Discharge Date"
+                if record.discharge_is_expected
+                else "Discharge Date"
             )
-            st.write(f"**Discharge Date:** {discharge_date}")
+            st.write(f"**{discharge_label}:** {record.discharge_date or 'N/A'}")
 
             # Display diagnosis if available
-            if "diagnoses" in patient_data and len(patient_data["diagnoses"]) > 0:
-                diagnosis = patient_data["diagnoses"][0]
-                st.write(
-                    f"**Primary Diagnosis:** {diagnosis.get('description', 'N/A')}"
-                )
-                st.write(f"**ICD Code:** {diagnosis.get('diagnosis_code', 'N/A')}")
+            diagnosis = record.primary_diagnosis
+            if diagnosis:
+                st.write(f"**Primary Diagnosis:** {diagnosis.description or 'N/A'}")
+                st.write(f"**ICD Code:** {diagnosis.diagnosis_code}")
 
         # Show a preview of encounters
-        if "encounters" in patient_data and len(patient_data["encounters"]) > 0:
+        if record.encounters:
             st.subheader("Encounters Summary")
-            encounters_df = pd.DataFrame(patient_data["encounters"])
+            encounters_df = pd.DataFrame(record.encounters)
             st.dataframe(encounters_df, use_container_width=True)
 
         # Show medications
-        if "med_orders" in patient_data and len(patient_data["med_orders"]) > 0:
+        if record.med_orders:
             st.subheader("Medications")
-            meds_df = pd.DataFrame(patient_data["med_orders"])
+            meds_df = pd.DataFrame(record.med_orders)
             st.dataframe(meds_df, use_container_width=True)
 
     except Exception as e:
         st.error(f"Error displaying patient overview: {str(e)}")
 
 
+def show_stored_summaries(patient_data):
+    """
+    Let the user open a summary stored for the patient earlier, without
+    generating a new one.
+    """
+    store = get_default_store()
+    patient_id = (
+        patient_data.get("patient_id") if isinstance(patient_data, dict) else None
+    )
+    if store is None or patient_id is None:
+        return
+    stored = store.versions(patient_id)
+    if not stored:
+        return
+
+    with st.expander(f"Stored summaries ({len(stored)})"):
+        labels = {
+            f"v{row['version']} · {row['template']} · "
+            f"admission {row['admission'] or 'unknown'} · {row['model']}": row
+            for row in stored
+        }
+        selected = labels[st.selectbox("Stored version", list(labels))]
+        st.caption(
+            f"Generated with the {selected['strategy']} strategy in "
+            f"{selected['latency_ms'] or 0:.0f} ms "
+            f"({selected['prompt_tokens']} prompt, "
+            f"{selected['completion_tokens']} completion tokens)"
+        )
+        if st.button("Show stored summary"):
+            st.session_state.generated_summary = selected["summary"]
+
+
 def main():
     st.set_page_config(page_title=config.UI_TITLE, page_icon="🏥", layout="wide")
 
@@ -132,8 +175,33 @@ def main():
         )
 
         # Template selection
-        template_options = list(TEMPLATE_MAP.keys())
-        template_type = st.selectbox("Summary template", template_options, index=0)
+        template_options = ["auto"] + list(TEMPLATE_MAP.keys())
+        template_type = st.selectbox(
+            "Summary template",
+            template_options,
+            index=0,
+            help="'auto' picks a template from the patient's diagnoses, DRG "
+            "and encounters",
+        )
+
+        strategies = {
+            "Single prompt": "single",
+            "Sections in parallel, then merge": "map_reduce",
+            "Update changed sections only": "incremental",
+        }
+        strategy = strategies[
+            st.radio(
+                "Generation strategy",
+                list(strategies),
+                index=list(strategies.values()).index(
+                    config.SUMMARY_STRATEGY
+                    if config.SUMMARY_STRATEGY in strategies.values()
+                    else "single"
+                ),
+                help="For very long admissions, summarize chart sections "
+                "concurrently with smaller prompts and merge them into the letter",
+            )
+        ]
 
         # API key input
         api_key = st.text_input(
@@ -142,12 +210,37 @@ def main():
 
         # Model selection
         model = st.selectbox(
-            "LLM Model", ["gpt-4", "gpt-4.5-preview", "gpt-3.5-turbo"], index=0
+            "LLM Model",
+            ["gpt-4", "gpt-4.5-preview", "gpt-3.5-turbo", "auto"],
+            index=0,
+            help="'auto' picks the model meeting the template's latency target "
+            "from recent response times, and hedges slow requests",
         )
 
         # Generate button (in sidebar)
         generate_button = st.button("Generate Discharge Summary", type="primary")
 
+        if model == "auto":
+            router_stats = get_default_router().stats()
+            if router_stats:
+                st.caption(
+                    "Model p95 latency: "
+                    + ", ".join(
+                        f"{name} {stats['p95_latency']:.1f}s"
+                        for name, stats in router_stats.items()
+                        if stats["p95_latency"] is not None
+                    )
+                )
+
+        # Summary cache statistics
+        summary_cache = get_default_cache()
+        if summary_cache is not None:
+            cache_stats = summary_cache.stats()
+            st.caption(
+                f"Summary cache: {cache_stats['hits']} hits, "
+                f"{cache_stats['misses']} misses, {cache_stats['entries']} cached"
+            )
+
     # Main content area
     if input_method == "Upload JSON":
         uploaded_file = st.file_uploader("Upload patient data (JSON)", type="json")
@@ -194,23 +287,41 @@ def main():
     # Display patient overview if data is loaded
     if st.session_state.patient_data:
         show_patient_overview(st.session_state.patient_data)
+        show_stored_summaries(st.session_state.patient_data)
 
     # Generate summary when the button is clicked
+    summary_header_shown = False
     if generate_button and st.session_state.patient_data:
-        with st.spinner("Generating discharge summary..."):
-            try:
-                generator = DischargeSummaryGenerator(api_key=api_key, model=model)
-                summary = generator.generate_summary(
-                    st.session_state.patient_data, template_type=template_type
-                )
-                st.session_state.generated_summary = summary
-                st.success("Summary generated successfully!")
-            except Exception as e:
-                st.error(f"Error generating summary: {str(e)}")
+        st.header("Generated Discharge Summary")
+        summary_header_shown = True
+        summary_placeholder = st.empty()
+        streamed_chunks = []
+
+        def render_chunk(chunk):
+            streamed_chunks.append(chunk)
+            summary_placeholder.markdown("".join(streamed_chunks) + "▌")
+
+        try:
+            generator = get_generator(api_key, model)
+            summary = consume_stream(
+                generator.stream_summary(
+                    st.session_state.patient_data,
+                    template_type=template_type,
+                    strategy=strategy,
+                ),
+                on_chunk=render_chunk,
+            )
+            st.session_state.generated_summary = summary
+            summary_placeholder.empty()
+            st.success("Summary generated successfully!")
+        except Exception as e:
+            summary_placeholder.empty()
+            st.error(f"Error generating summary: {str(e)}")
 
     # Display the generated summary if available
     if st.session_state.generated_summary:
-        st.header("Generated Discharge Summary")
+        if not summary_header_shown:
+            st.header("Generated Discharge Summary")
         st.markdown(st.session_state.generated_summary)
 
         # Add download button for the summary